@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import field_validator, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -5,12 +8,129 @@ class Settings(BaseSettings):
     # --- e-Stat API 設定 ---
     ESTAT_APP_ID: str = ""
     ESTAT_BASE_URL: str = "https://api.e-stat.go.jp/rest/3.0/app/json"
+    # true にすると ESTAT_BASE_URL をローカルの代替サーバー（devtools/estat_standin.py）に向ける
+    ESTAT_USE_STANDIN: bool = False
+    ESTAT_STANDIN_URL: str = "http://127.0.0.1:8765"
+    # 統計表IDと分類マップのキャッシュ（空文字で無効化）と有効期間（秒）
+    ESTAT_META_CACHE_PATH: str = ".cache/estat_meta.json"
+    ESTAT_META_CACHE_MAX_AGE: int = 30 * 86400
+    # 分類マップキャッシュのメモリ予算（バイト、超えたら古い統計表から破棄）
+    ESTAT_CLASS_MAP_CACHE_BUDGET_BYTES: int = 4 * 1024 * 1024
+    # 接続プール設定（EStatClient が保持する HTTP クライアントで共有）
+    ESTAT_HTTP_MAX_CONNECTIONS: int = 20
+    ESTAT_HTTP_MAX_KEEPALIVE: int = 10
+    ESTAT_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    # HTTP/2 を使う場合は httpx[http2] (h2) が必要
+    ESTAT_HTTP2: bool = False
+    # 同時実行数（レイテンシとエラー率に応じて MIN〜MAX の間で自動調整）
+    ESTAT_CONCURRENCY_INITIAL: int = 10
+    ESTAT_CONCURRENCY_MIN: int = 1
+    ESTAT_CONCURRENCY_MAX: int = 32
+    # これを超える応答時間（秒）は「遅い」とみなして同時実行数を下げる
+    ESTAT_LATENCY_TARGET: float = 3.0
+    # 再試行（ジッター付き指数バックオフ、Retry-After を尊重）
+    ESTAT_MAX_RETRIES: int = 3
+    ESTAT_RETRY_BASE_DELAY: float = 0.5
+    ESTAT_RETRY_MAX_DELAY: float = 20.0
+    # 連続失敗がこの回数に達したら一定時間（秒）呼び出しを止める
+    ESTAT_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    ESTAT_CIRCUIT_RESET_TIMEOUT: float = 60.0
+
+    # --- 市場データ スナップショット設定 ---
+    # 空文字にするとディスクへの保存・読込を無効化
+    MARKET_DATA_SNAPSHOT_PATH: str = ".cache/market_data.json"
+    # これより古いスナップショットは起動時に読み込まない（秒）
+    MARKET_DATA_SNAPSHOT_MAX_AGE: int = 7 * 86400
+
+    # --- 市場データ 取得範囲 ---
+    # 価格キューブに含める地域コード（カンマ区切り、13100=東京都区部は常に含む）
+    MARKET_DATA_AREAS: str = "13100"
+    # 価格キューブに含める月数（最新月から遡る）
+    MARKET_DATA_MONTHS: int = 12
+
+    # --- 市場データ バックグラウンド更新設定 ---
+    MARKET_DATA_BACKGROUND_REFRESH: bool = True
+    # キャッシュの有効期限の何秒前に更新を始めるか
+    MARKET_DATA_REFRESH_AHEAD: int = 3600
+    # 更新失敗時の再試行間隔、および連続した更新の最短間隔（秒）
+    MARKET_DATA_RETRY_INTERVAL: int = 300
+
+    # --- 価格比較 ---
+    # true: Gemini は読取のみ、名寄せ・価格比較はローカルで行い、解決できない商品だけ Gemini に問い合わせる
+    LOCAL_PRICING_ENABLED: bool = True
+    # テキストレシート一括解析の上限件数と、Gemini フォールバック時の同時呼び出し数
+    TEXT_BATCH_MAX_RECEIPTS: int = 5000
+    TEXT_BATCH_MODEL_CONCURRENCY: int = 4
+    # Gemini に渡す市場データの上限件数（レシートの商品に関係しそうな品目だけに絞る、0 で絞り込まない）
+    MODEL_MARKET_ROWS_MAX: int = 40
+
+    # --- 品目ルール ---
+    # 名寄せルールのファイル（空文字なら同梱の rules.json）と、更新を確認する間隔（秒、0 で監視しない）
+    RULES_PATH: str = ""
+    RULES_WATCH_INTERVAL: float = 5.0
+    # 管理用エンドポイント（/admin/...）のトークン（X-Admin-Token ヘッダー、空文字なら管理用エンドポイントは無効）
+    ADMIN_TOKEN: str = ""
 
     # --- Gemini Vision API 設定 ---
+    # 画像解析のバックエンド（"gemini" / "mock": 負荷試験用のローカル代替、API キー不要）
+    VISION_BACKEND: Literal["gemini", "mock"] = "gemini"
     GEMINI_API_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta/models"
     GEMINI_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-flash-latest"
     GEMINI_MODEL_FALLBACK: str = "gemini-1.5-pro"
+    # 1回の呼び出しの締め切り（秒、超えたら 504）
+    GEMINI_DEADLINE: float = 60.0
+    # GEMINI_MODEL が直近の所要時間の GEMINI_HEDGE_PERCENTILE パーセンタイルを過ぎても応答しなければ
+    # GEMINI_MODEL_FALLBACK にも送り、先に返ったほうを使う（記録が GEMINI_HEDGE_MIN_SAMPLES 件未満なら INITIAL_DELAY 秒）
+    GEMINI_HEDGE_ENABLED: bool = True
+    GEMINI_HEDGE_PERCENTILE: float = 95.0
+    GEMINI_HEDGE_MIN_SAMPLES: int = 20
+    GEMINI_HEDGE_INITIAL_DELAY: float = 15.0
+    GEMINI_HEDGE_MIN_DELAY: float = 2.0
+    # プロンプト前半部分（指示文 + 市場データ）のコンテキストキャッシュ
+    # "off": 使わない / "gemini": Gemini の cached content に登録 / "local": テスト用の代替（Gemini には登録しない）
+    GEMINI_CONTEXT_CACHE: str = "off"
+    # キャッシュの有効期間（秒）と、登録する前半部分の最小サイズ（バイト、小さすぎるとキャッシュできない）
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600
+    GEMINI_CONTEXT_CACHE_MIN_BYTES: int = 16384
+
+    # --- モック Vision バックエンド（VISION_BACKEND=mock） ---
+    # レイテンシ分布（fixed / uniform / lognormal / exponential）
+    # LATENCY_MS は fixed・uniform では平均、lognormal では中央値、exponential では平均
+    # SPREAD は uniform では ±の割合、lognormal では対数の標準偏差
+    MOCK_VISION_LATENCY_DIST: str = "lognormal"
+    MOCK_VISION_LATENCY_MS: float = 1500.0
+    MOCK_VISION_LATENCY_SPREAD: float = 0.5
+    MOCK_VISION_ERROR_RATE: float = 0.0
+    MOCK_VISION_SEED: int = 0
+    # 1枚あたりの商品数の目安
+    MOCK_VISION_ITEMS: int = 8
+    # スキーマ名 → 応答例のリスト の JSON（空文字なら応答を合成する）
+    MOCK_VISION_CANNED_PATH: str = ""
+
+    # --- レシート画像の前処理 ---
+    # 長辺の最大ピクセル数（0 で縮小しない）、グレースケール化、レシート部分の自動切り抜き
+    IMAGE_MAX_EDGE: int = 1536
+    IMAGE_GRAYSCALE: bool = True
+    IMAGE_AUTOCROP: bool = False
+    IMAGE_JPEG_QUALITY: int = 80
+    # 受け付けるファイルサイズ（バイト）と画素数の上限
+    IMAGE_MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    IMAGE_MAX_PIXELS: int = 50_000_000
+    # 前処理を実行するスレッド数
+    IMAGE_PREPROCESS_WORKERS: int = 4
+    # 画像の一括解析（/analyzeReceipt/batch）: 1回の枚数・合計バイト数の上限と同時に解析する枚数
+    IMAGE_BATCH_MAX_IMAGES: int = 100
+    IMAGE_BATCH_MAX_BYTES: int = 200 * 1024 * 1024
+    IMAGE_BATCH_CONCURRENCY: int = 4
+
+    # --- 解析結果キャッシュ（同じレシート画像の再アップロード） ---
+    RESULT_CACHE_ENABLED: bool = True
+    # 有効期間（秒）とメモリ予算（バイト、超えたら古いものから破棄）
+    RESULT_CACHE_TTL: int = 6 * 3600
+    RESULT_CACHE_BUDGET_BYTES: int = 16 * 1024 * 1024
+    # 知覚ハッシュ（64bit）のハミング距離がこれ以下なら同じ画像とみなす（0 で完全一致のみ）
+    RESULT_CACHE_NEAR_DUPLICATE_DISTANCE: int = 0
 
     # --- Supabase 設定 ---
     SUPABASE_URL: str = ""
@@ -18,6 +138,21 @@ class Settings(BaseSettings):
     SUPABASE_SERVICE_ROLE_KEY: str = ""
     SUPABASE_JWT_SECRET: str = ""
 
+    @field_validator("VISION_BACKEND", mode="before")
+    @classmethod
+    def _normalize_vision_backend(cls, value: object) -> object:
+        # 起動時に検証する（未対応の値は /health などで初めて失敗させない）。大文字・前後の空白は許す
+        return value.strip().lower() if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def _apply_estat_standin(self) -> "Settings":
+        if self.ESTAT_USE_STANDIN:
+            self.ESTAT_BASE_URL = self.ESTAT_STANDIN_URL.rstrip("/")
+            # 代替サーバーは appId を検証しないので、未設定でも動くようにする
+            if not self.ESTAT_APP_ID:
+                self.ESTAT_APP_ID = "standin"
+        return self
+
     # Pydantic Settings の設定
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,4 +1,4 @@
-from .auth import CurrentUser
+from .auth import AdminOnly, CurrentUser
 from .db import supabase
 
-__all__ = ["CurrentUser", "supabase"]
+__all__ = ["AdminOnly", "CurrentUser", "supabase"]
@@ -1,7 +1,8 @@
+import hmac
 from typing import Annotated
 
 from config import settings
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt  # type: ignore
 from loguru import logger
@@ -57,5 +58,24 @@ def get_current_user(
         )
 
 
+def require_admin(x_admin_token: Annotated[str | None, Header()] = None) -> None:
+    """
+    管理用エンドポイントの X-Admin-Token ヘッダーを検証する。
+    ADMIN_TOKEN が未設定の場合は管理用エンドポイントを使えない。
+    """
+    admin_token = settings.ADMIN_TOKEN
+    if not admin_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled",
+        )
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid admin token",
+        )
+
+
 # 依存性注入用のエイリアス
 CurrentUser = Annotated[dict[str, str], Depends(get_current_user)]
+AdminOnly = Annotated[None, Depends(require_admin)]
@@ -0,0 +1,116 @@
+"""
+guess_canonical のベンチマーク（従来のルール総当たりループ vs キーワードオートマトン）
+
+現在の品目ルール（item_rules）を 1倍・10倍・100倍 に水増ししたルール表で、同じ入力に対する
+推定結果が一致することを確認したうえで、1行あたりの処理時間を比較します。
+
+実行例:
+    uv run python -m devtools.bench_guess_canonical
+    uv run python -m devtools.bench_guess_canonical --scales 1,10,100,1000 --repeat 3
+"""
+import argparse
+import json
+import re
+import time
+
+from schemas.keyword_automaton import ItemRuleMatcher
+from schemas.parser import fold_key, normalize_text
+from schemas.rules_engine import compile_item_rules, rules_path, validate_rules
+
+# レシートによくある品目名（ルールに当たるもの・当たらないものを混ぜる）
+SAMPLE_LINES = [
+    "明治おいしい牛乳 1000ml", "森永のおいしい牛乳", "MILK 低脂肪", "国産 鶏卵 10個入",
+    "Mサイズたまご", "超熟 食パン 6枚切", "日清カップヌードル", "カップ ラーメン しょうゆ",
+    "サバ水煮 缶 190g", "さば 味噌煮 缶", "コシヒカリ 5kg", "キャベツ 1玉", "バナナ",
+    "国産豚バラ 切り落とし", "ポテトチップス うすしお", "レジ袋 大", "ボールペン 黒",
+    "アイスクリーム バニラ", "ヨーグルト 4P", "ｶｯﾌﾟｳﾄﾞﾝ", "たまねぎ 3個", "小計",
+]
+
+
+def scaled_rules(scale: int) -> list[dict[str, str | list[str]]]:
+    """
+    現在のルールファイルの item_rules を scale 倍に水増ししたルール表を返します。
+
+    元のルールはそのまま先頭に置き、複製にはキーワードに番号を付けて別物にします
+    （正規表現パターンは元のルールだけに残す）。
+    """
+    item_rules: list[dict[str, str | list[str]]] = validate_rules(
+        json.loads(rules_path().read_text(encoding="utf-8"))
+    )["item_rules"]
+    rules = list(item_rules)
+    for j in range(1, scale):
+        for rule in item_rules:
+            keywords = rule.get("keywords", [])
+            assert isinstance(keywords, list)
+            rules.append({
+                "canonical": f"{rule['canonical']}#{j}",
+                "keywords": [f"{kw}{j}" for kw in keywords],
+            })
+    return rules
+
+
+def guess_by_loop(
+    compiled: list[tuple[str, list[str], list[re.Pattern[str]]]], s_norm: str, s_fold: str
+) -> str | None:
+    """従来の guess_canonical と同じ総当たりループ"""
+    best: str | None = None
+    best_score = -1
+    for canonical, keywords, patterns in compiled:
+        for pat in patterns:
+            if pat.search(s_norm):
+                score = 10_000
+                if score > best_score:
+                    best = canonical
+                    best_score = score
+        for kw in keywords:
+            if kw and kw in s_fold:
+                score = len(kw)
+                if score > best_score:
+                    best = canonical
+                    best_score = score
+    return best
+
+
+def _per_line_us(fn, inputs: list[tuple[str, str]], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for s_norm, s_fold in inputs:
+            fn(s_norm, s_fold)
+        best = min(best, time.perf_counter() - start)
+    return best / len(inputs) * 1e6
+
+
+def main(scales: list[int], repeat: int, lines: int) -> None:
+    raw_lines = (SAMPLE_LINES * (lines // len(SAMPLE_LINES) + 1))[:lines]
+    inputs = [(normalize_text(s), fold_key(normalize_text(s))) for s in raw_lines]
+
+    print(f"{'scale':>6} {'rules':>7} {'keywords':>9} {'build ms':>9} {'loop us':>9} {'automaton us':>13} {'speedup':>8}")
+    for scale in scales:
+        compiled = compile_item_rules(scaled_rules(scale))
+
+        start = time.perf_counter()
+        matcher = ItemRuleMatcher(compiled)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # 結果が従来のループと完全に一致することを確認する
+        for s_norm, s_fold in inputs[:len(SAMPLE_LINES)]:
+            expected = guess_by_loop(compiled, s_norm, s_fold)
+            actual = matcher.match(s_norm, s_fold)
+            if expected != actual:
+                raise SystemExit(f"結果が一致しません: {s_norm!r} loop={expected} automaton={actual}")
+
+        loop_us = _per_line_us(lambda n, f, compiled=compiled: guess_by_loop(compiled, n, f), inputs, repeat)
+        auto_us = _per_line_us(matcher.match, inputs, repeat)
+        n_keywords = sum(len(kws) for _, kws, _ in compiled)
+        print(f"{scale:>6} {len(compiled):>7} {n_keywords:>9} {build_ms:>9.1f} {loop_us:>9.2f} "
+              f"{auto_us:>13.2f} {loop_us / auto_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="guess_canonical のベンチマーク")
+    parser.add_argument("--scales", default="1,10,100")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--lines", type=int, default=2000)
+    args = parser.parse_args()
+    main([int(x) for x in args.scales.split(",")], args.repeat, args.lines)
@@ -0,0 +1,107 @@
+"""
+市場データ更新のベンチマーク（e-Stat 代替サーバー使用・ネットワーク不要）
+
+代替サーバーをプロセス内で起動し、以下を計測します。
+- コールドスタート: キャッシュなしの EStatClient で統計表探索から市場データ取得まで
+- 更新スループット: 統計表が決まった状態で市場データ更新を繰り返したときの所要時間
+
+実行例:
+    uv run python -m devtools.bench_market_refresh --rounds 5
+    ESTAT_STANDIN_LATENCY_MS=80 ESTAT_STANDIN_ERROR_RATE=0.05 uv run python -m devtools.bench_market_refresh
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# config を読み込む前に、代替サーバーを向くように環境変数を設定する
+os.environ.setdefault("ESTAT_STANDIN_MODE", "synthetic")
+os.environ.setdefault("ESTAT_STANDIN_PORT", "8765")
+os.environ["ESTAT_USE_STANDIN"] = "true"
+os.environ.setdefault("ESTAT_STANDIN_URL", f"http://127.0.0.1:{os.environ['ESTAT_STANDIN_PORT']}")
+# ディスクキャッシュを無効にして毎回同じ条件で計測する
+os.environ["ESTAT_META_CACHE_PATH"] = ""
+os.environ["MARKET_DATA_SNAPSHOT_PATH"] = ""
+
+import uvicorn  # noqa: E402
+from loguru import logger  # noqa: E402
+
+from devtools.estat_standin import app as standin_app, standin_settings  # noqa: E402
+from schemas.estat import EStatClient  # noqa: E402
+from services.market_data import clear_market_data_cache, fetch_all_market_data  # noqa: E402
+
+
+async def _start_standin() -> tuple[uvicorn.Server, asyncio.Task[None]]:
+    config = uvicorn.Config(
+        standin_app,
+        host=standin_settings.HOST,
+        port=standin_settings.PORT,
+        log_level="warning",
+    )
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def _measure_once(client: EStatClient) -> tuple[float, int]:
+    clear_market_data_cache()
+    start = time.perf_counter()
+    data = await fetch_all_market_data(client)
+    return time.perf_counter() - start, len(data)
+
+
+async def main(rounds: int) -> None:
+    server, server_task = await _start_standin()
+    try:
+        # コールドスタート: 統計表の探索・メタ情報の取得を含む
+        cold_client = EStatClient()
+        await cold_client.open()
+        try:
+            cold_sec, cold_items = await _measure_once(cold_client)
+            cold_requests = cold_client.get_http_stats()["requests"]
+        finally:
+            await cold_client.aclose()
+
+        # 更新スループット: 統計表・分類マップがメモリにある状態で繰り返す
+        client = EStatClient()
+        await client.open()
+        try:
+            await _measure_once(client)
+            before = client.get_http_stats()["requests"]
+            durations: list[float] = []
+            items = 0
+            for _ in range(rounds):
+                sec, items = await _measure_once(client)
+                durations.append(sec)
+            warm_requests = (client.get_http_stats()["requests"] - before) / max(rounds, 1)
+            http_stats = client.get_http_stats()
+            resilience = client.get_resilience_stats()
+        finally:
+            await client.aclose()
+    finally:
+        server.should_exit = True
+        await server_task
+
+    print(f"mode={standin_settings.MODE} latency={standin_settings.LATENCY_MS}ms "
+          f"jitter={standin_settings.LATENCY_JITTER_MS}ms error_rate={standin_settings.ERROR_RATE}")
+    print(f"cold start : {cold_sec:.3f}s items={cold_items} requests={cold_requests}")
+    print(f"refresh    : median={statistics.median(durations):.3f}s min={min(durations):.3f}s "
+          f"max={max(durations):.3f}s items={items} requests/refresh={warm_requests:.1f} rounds={rounds}")
+    print(f"http       : {http_stats}")
+    print(f"resilience : {resilience}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="市場データ更新のベンチマーク")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    if not args.verbose:
+        logger.remove()
+        logger.add(lambda msg: print(msg, end=""), level="WARNING")
+    asyncio.run(main(args.rounds))
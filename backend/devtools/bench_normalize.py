@@ -0,0 +1,156 @@
+"""
+文字列正規化のベンチマーク（従来の実装 vs 事前コンパイル + キャッシュ + 一括変換）
+
+従来の normalize_text / simplify_key / fold_key（呼び出しごとに変換表を作り、正規表現を個別に適用し、
+fold_key の中で何度も NFKC を通す）と、現在の実装の結果が一致することを確認したうえで、
+1行あたりの処理時間を比較します。キャッシュなし（初回）とキャッシュあり（同じ品名の2回目以降）を分けて測ります。
+
+実行例:
+    uv run python -m devtools.bench_normalize
+    uv run python -m devtools.bench_normalize --receipts 2000 --repeat 3
+"""
+import argparse
+import random
+import re
+import time
+import unicodedata
+from collections.abc import Callable
+
+from schemas.normalize import (
+    clear_normalize_cache,
+    fold_key,
+    normalize_many,
+    normalize_text,
+    simplify_key,
+)
+
+# レシートによくある品名（全角・半角カナ、全角数字、記号を混ぜる）
+SAMPLE_NAMES = [
+    "明治おいしい牛乳　１０００ｍｌ", "森永のおいしい牛乳", "MILK 低脂肪", "国産 鶏卵 10個入",
+    "Ｍサイズたまご", "超熟 食パン 6枚切", "日清カップヌードル", "ｶｯﾌﾟ ﾗｰﾒﾝ しょうゆ",
+    "サバ水煮 缶 190g", "さば 味噌煮 缶", "コシヒカリ ５ｋｇ", "キャベツ 1玉", "ﾊﾞﾅﾅ",
+    "国産豚バラ（切り落とし）", "ポテトチップス・うすしお", "ヨーグルト 4P", "ｶｯﾌﾟｳﾄﾞﾝ", "たまねぎ 3個",
+]
+
+
+def legacy_normalize_text(s: str) -> str:
+    """従来の normalize_text（呼び出しごとに変換表を作る）"""
+    s = unicodedata.normalize("NFKC", s)
+    trans = str.maketrans({
+        "０": "0", "１": "1", "２": "2", "３": "3", "４": "4",
+        "５": "5", "６": "6", "７": "7", "８": "8", "９": "9",
+        "／": "/", "－": "-", "ー": "-", "：": ":", "　": " ",
+        "￥": "¥",
+        "\\": "¥",
+    })
+    s = s.translate(trans)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+def legacy_simplify_key(s: str) -> str:
+    s = legacy_normalize_text(s)
+    s = re.sub(r"[ \t\r\n]", "", s)
+    s = re.sub(r"[()（）【】\[\]「」『』]", "", s)
+    s = re.sub(r"[・,，\.。/／\-－]", "", s)
+    return s
+
+
+def legacy_fold_key(s: str) -> str:
+    return legacy_simplify_key(s).casefold()
+
+
+def make_receipts(n: int, lines_per_receipt: int, seed: int = 0) -> list[str]:
+    """SAMPLE_NAMES から価格付きの行を並べたレシート本文を n 件作ります。"""
+    rnd = random.Random(seed)
+    receipts: list[str] = []
+    for _ in range(n):
+        lines = ["スーパーABC", "２０２５／０３／０２ １５：３０"]
+        lines += [f"{rnd.choice(SAMPLE_NAMES)} ¥{rnd.randint(80, 980)}" for _ in range(lines_per_receipt)]
+        lines.append(f"小計 ¥{rnd.randint(1000, 5000)}")
+        receipts.append("\n".join(lines))
+    return receipts
+
+
+def legacy_receipt(text: str) -> list[tuple[str, str]]:
+    """従来の parse_receipt_text + guess_canonical の正規化部分（全文 + 各行 + 品名ごとに fold_key）"""
+    legacy_normalize_text(text)
+    out: list[tuple[str, str]] = []
+    for raw_line in text.splitlines():
+        line = legacy_normalize_text(raw_line)
+        s_norm = legacy_normalize_text(line)
+        out.append((s_norm, legacy_fold_key(s_norm)))
+    return out
+
+
+def current_receipt(text: str) -> list[tuple[str, str]]:
+    """現在の parse_receipt_text + guess_canonical の正規化部分（行をまとめて正規化、キャッシュ共有）"""
+    return [(normalize_text(line), fold_key(line)) for line in normalize_many(text.splitlines())]
+
+
+def _per_line_us(fn: Callable[[str], object], inputs: list[str], repeat: int, n_lines: int, cold: bool) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            clear_normalize_cache()
+        start = time.perf_counter()
+        for s in inputs:
+            fn(s)
+        best = min(best, time.perf_counter() - start)
+    return best / n_lines * 1e6
+
+
+def main(receipts: int, lines_per_receipt: int, repeat: int) -> None:
+    texts = make_receipts(receipts, lines_per_receipt)
+    n_lines = sum(t.count("\n") + 1 for t in texts)
+
+    # 結果が従来の実装と完全に一致することを確認する（全角記号・半角カナ・制御文字を含むランダムな文字列も）
+    rnd = random.Random(1)
+    alphabet = "ａＡ１！（）【】・ー－／ｶﾞﾊﾟ　 \t牛乳Milkｍｌ￥\\,.。「」"
+    fuzz = ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 20))) for _ in range(2000)]
+    for s in fuzz + SAMPLE_NAMES:
+        for legacy, current in ((legacy_normalize_text, normalize_text), (legacy_simplify_key, simplify_key),
+                                (legacy_fold_key, fold_key)):
+            if legacy(s) != current(s):
+                raise SystemExit(f"結果が一致しません: {current.__name__}({s!r})")
+    for t in texts[:50]:
+        if legacy_receipt(t) != current_receipt(t):
+            raise SystemExit(f"レシートの正規化結果が一致しません: {t!r}")
+
+    unique_names = sorted(set(SAMPLE_NAMES) | set(fuzz))
+    cases: list[tuple[str, Callable[[str], object], Callable[[str], object], list[str], int]] = [
+        ("normalize_text", legacy_normalize_text, normalize_text, unique_names, len(unique_names)),
+        ("fold_key", legacy_fold_key, fold_key, unique_names, len(unique_names)),
+        ("receipt lines", legacy_receipt, current_receipt, texts, n_lines),
+    ]
+    print(f"{receipts} receipts, {n_lines} lines")
+    print(f"{'case':<16} {'legacy us':>10} {'cold us':>9} {'warm us':>9} {'cold x':>7} {'warm x':>7}")
+    for label, legacy_fn, current_fn, inputs, n in cases:
+        legacy_us = _per_line_us(legacy_fn, inputs, repeat, n, cold=False)
+        cold_us = _per_line_us(current_fn, inputs, repeat, n, cold=True)
+        current_fn(inputs[0])
+        warm_us = _per_line_us(current_fn, inputs, repeat, n, cold=False)
+        print(f"{label:<16} {legacy_us:>10.2f} {cold_us:>9.2f} {warm_us:>9.2f} "
+              f"{legacy_us / cold_us:>6.1f}x {legacy_us / warm_us:>6.1f}x")
+
+    # 分類マップの名前（一度しか使わない）は共有キャッシュを使わずに一括変換する
+    class_names = [f"{1000 + i} {rnd.choice(SAMPLE_NAMES)}{i}" for i in range(20000)]
+    start = time.perf_counter()
+    expected = [legacy_simplify_key(n) for n in class_names]
+    legacy_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    actual = normalize_many(class_names, "simple", memoize=False)
+    batch_ms = (time.perf_counter() - start) * 1000
+    if expected != actual:
+        raise SystemExit("分類名の一括変換結果が一致しません")
+    print(f"{'class names':<16} {len(class_names)} names: legacy {legacy_ms:.1f}ms, normalize_many {batch_ms:.1f}ms "
+          f"({legacy_ms / batch_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="文字列正規化のベンチマーク")
+    parser.add_argument("--receipts", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=20, help="1レシートあたりの商品行数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.receipts, args.lines, args.repeat)
@@ -0,0 +1,89 @@
+"""
+Gemini に渡す市場データのプロンプトサイズ比較（全件・インデント付き vs 関係する品目だけ・詰めた JSON）
+
+e-Stat の小売物価統計と同程度の件数の市場データを作り、典型的なレシート（5〜15商品）ごとに
+ITEM_PRICING_INSTRUCTION + ITEM_PRICING_INPUT を組み立てたときの文字数・バイト数と、絞り込みにかかった時間を比べます。
+
+実行例:
+    uv run python -m devtools.bench_prompt_size
+    uv run python -m devtools.bench_prompt_size --market-rows 600 --receipts 200
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from model.generate import compact_json
+from model.prompt import ITEM_PRICING_INPUT, ITEM_PRICING_INSTRUCTION
+from services.pricing import relevant_market_rows
+
+# 市場データの品目名の元（番号を付けて件数を水増しする）と単位
+BASE_ITEMS = [
+    ("鶏卵", "1パック"), ("牛乳", "1000ml"), ("食パン", "1kg"), ("うるち米(単一原料米,「コシヒカリ」)", "5kg"),
+    ("キャベツ", "1kg"), ("たまねぎ", "1kg"), ("じゃがいも", "1kg"), ("トマト", "1kg"), ("バナナ", "1kg"),
+    ("りんご(ふじ)", "1kg"), ("豚肉(バラ)", "100g"), ("牛肉(ロース)", "100g"), ("鶏肉", "100g"),
+    ("さば缶詰", "1缶(190g)"), ("即席めん", "1個"), ("アイスクリーム", "1個"), ("ヨーグルト", "1個"),
+    ("緑茶(ティーバッグ)", "1袋"), ("しょう油", "1L"), ("砂糖", "1kg"), ("マヨネーズ", "1袋(450g)"),
+    ("チーズ(国産品)", "1箱"), ("ポテトチップス", "1袋(60g)"), ("豆腐", "1丁"), ("納豆", "1パック"),
+]
+# レシートの品名（名寄せできるもの・できないものを混ぜる）
+RECEIPT_NAMES = [
+    "明治おいしい牛乳", "たまご Mサイズ", "超熟 食パン", "キャベツ 1玉", "バナナ", "カップヌードル",
+    "ポテトチップス うすしお", "伊右衛門 緑茶", "謎のおやつ", "ﾖｰｸﾞﾙﾄ", "国産豚バラ", "ﾏﾖﾈｰｽﾞ",
+    "サバ水煮 缶", "絹ごし豆腐", "ひきわり納豆", "コシヒカリ 5kg", "ﾁｰｽﾞ", "しょうゆ 1L",
+]
+
+
+def make_market_data(n: int) -> list[dict[str, str | float]]:
+    rows: list[dict[str, str | float]] = []
+    for i in range(n):
+        name, unit = BASE_ITEMS[i % len(BASE_ITEMS)]
+        if i >= len(BASE_ITEMS):
+            name = f"{name}{i // len(BASE_ITEMS)}"
+        rows.append({"item_name": name, "price": float(100 + i % 50 * 20), "unit": unit})
+    return rows
+
+
+def build_prompt(items: list[dict[str, object]], market_json: str) -> str:
+    return (
+        ITEM_PRICING_INSTRUCTION.replace("{{MARKET_DATA_JSON}}", market_json)
+        + ITEM_PRICING_INPUT.replace("{{ITEMS_JSON}}", json.dumps(items, ensure_ascii=False, indent=2))
+    )
+
+
+def main(market_rows: int, receipts: int, seed: int) -> None:
+    market_data = make_market_data(market_rows)
+    rnd = random.Random(seed)
+    # 名寄せ器などの初回構築は除いて測る
+    relevant_market_rows(RECEIPT_NAMES[:1], market_data)
+
+    before: list[int] = []
+    after: list[int] = []
+    picked: list[int] = []
+    prune_ms: list[float] = []
+    full_json = json.dumps(market_data, ensure_ascii=False, indent=2)
+    for _ in range(receipts):
+        names = rnd.sample(RECEIPT_NAMES, rnd.randint(5, 15))
+        items: list[dict[str, object]] = [{"raw_name": n, "paid_unit_price": 198.0, "quantity": 1.0} for n in names]
+        start = time.perf_counter()
+        rows = relevant_market_rows(names, market_data)
+        prune_ms.append((time.perf_counter() - start) * 1000)
+        picked.append(len(rows))
+        before.append(len(build_prompt(items, full_json).encode()))
+        after.append(len(build_prompt(items, compact_json(rows)).encode()))
+
+    print(f"market rows: {market_rows}, receipts: {receipts} (5-15 items)")
+    print(f"rows sent      median {statistics.median(picked):>8.0f}  max {max(picked):>8}")
+    print(f"prompt bytes   before {statistics.median(before):>8.0f}  after {statistics.median(after):>8.0f} "
+          f"({statistics.median(after) / statistics.median(before):.1%})")
+    print(f"pruning ms     median {statistics.median(prune_ms):>8.2f}  max {max(prune_ms):>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gemini に渡す市場データのプロンプトサイズ比較")
+    parser.add_argument("--market-rows", type=int, default=500)
+    parser.add_argument("--receipts", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.market_rows, args.receipts, args.seed)
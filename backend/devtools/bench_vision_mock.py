@@ -0,0 +1,100 @@
+"""
+モック Vision バックエンドを使った画像解析の処理能力の計測（ネットワーク・API キー不要）
+
+合成したレシート画像を同時実行数ごとに analyze_receipt_with_market_data に流し、
+スループット・レイテンシ（p50 / p95 / p99）・メモリの増分と、ヘッジ・前処理の統計を表示します。
+レイテンシ分布やエラー率は MOCK_VISION_* の設定で変えられます。
+
+実行例:
+    VISION_BACKEND=mock uv run python -m devtools.bench_vision_mock
+    VISION_BACKEND=mock MOCK_VISION_LATENCY_MS=800 uv run python -m devtools.bench_vision_mock --images 500 --concurrency 8,32,128
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+from config import settings
+from devtools.bench_prompt_size import make_market_data
+from model import analyze_receipt_with_market_data, get_image_stats, get_model_call_stats, get_vision_backend
+
+
+def make_receipt_image(rnd: random.Random, width: int, height: int) -> bytes:
+    """白い紙に文字の行のような横線を並べた、スマートフォンの写真程度の大きさの JPEG"""
+    img = Image.new("RGB", (width, height), (90, 80, 70))
+    draw = ImageDraw.Draw(img)
+    left, right = width // 5, width * 4 // 5
+    draw.rectangle((left, height // 20, right, height * 19 // 20), fill=(245, 245, 240))
+    for y in range(height // 10, height * 9 // 10, max(8, height // 60)):
+        x = left + 20 + rnd.randint(width // 10, (right - left) // 2)
+        draw.line((left + 20, y, x, y), fill=(30, 30, 30), width=3)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+async def run(images: list[bytes], market_data: list[dict[str, str | float]], concurrency: int) -> dict[str, float]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(data: bytes) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await analyze_receipt_with_market_data(data, market_data, "bench")
+                latencies.append(time.perf_counter() - t0)
+            except Exception:
+                errors += 1
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(d) for d in images))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    q = statistics.quantiles(latencies, n=100) if len(latencies) >= 2 else [0.0] * 99
+    return {
+        "concurrency": concurrency,
+        "throughput_per_s": round(len(images) / elapsed, 1),
+        "p50_s": round(q[49], 3),
+        "p95_s": round(q[94], 3),
+        "p99_s": round(q[98], 3),
+        "errors": errors,
+        "peak_mem_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+async def main(n_images: int, levels: list[int], market_rows: int, seed: int) -> None:
+    if get_vision_backend().name != "mock":
+        raise SystemExit("VISION_BACKEND=mock を設定して実行してください（本物の API を呼ばないため）。")
+    rnd = random.Random(seed)
+    # 画像の合成は遅いので16枚を作って使い回す（結果キャッシュは通らないので毎回解析される）
+    distinct = [make_receipt_image(rnd, rnd.choice([3024, 4032]), 4032) for _ in range(min(n_images, 16))]
+    images = [distinct[i % len(distinct)] for i in range(n_images)]
+    market_data = make_market_data(market_rows)
+
+    print(f"backend=mock latency={settings.MOCK_VISION_LATENCY_DIST}({settings.MOCK_VISION_LATENCY_MS}ms) "
+          f"images={n_images} market_rows={market_rows}")
+    for c in levels:
+        print(json.dumps(await run(images, market_data, c), ensure_ascii=False))
+    print("image_preprocess:", json.dumps(get_image_stats(), ensure_ascii=False))
+    print("model_calls:", json.dumps(get_model_call_stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--concurrency", default="1,8,32", help="カンマ区切りの同時実行数")
+    parser.add_argument("--market-rows", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.images, [int(c) for c in args.concurrency.split(",")], args.market_rows, args.seed))
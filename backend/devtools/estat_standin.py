@@ -0,0 +1,248 @@
+"""
+e-Stat API のローカル代替サーバー（オフラインでのベンチマーク・動作確認用）
+
+getStatsList / getMetaInfo / getStatsData を以下のいずれかのモードで返します。
+- replay   : 記録済みフィクスチャ（ESTAT_STANDIN_FIXTURE_DIR）から返す。未記録のリクエストは404
+- record   : 本物の e-Stat に転送し、レスポンスをフィクスチャとして保存してから返す
+- synthetic: 品目・地域・月を決定的に生成した架空の小売物価統計を返す（フィクスチャ不要）
+
+レイテンシ（平均・揺らぎ）とエラー（503 + Retry-After）を注入できます。
+
+起動例:
+    ESTAT_STANDIN_MODE=synthetic uv run python -m devtools.estat_standin
+    ESTAT_STANDIN_MODE=record ESTAT_STANDIN_UPSTREAM_APP_ID=xxxx uv run python -m devtools.estat_standin
+
+アプリ側は .env に ESTAT_USE_STANDIN=true を設定すると、この代替サーバーに接続します。
+"""
+import asyncio
+import hashlib
+import json
+import random
+from pathlib import Path
+from typing import Any
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from loguru import logger
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+from utils.files import write_json_atomic
+
+
+class StandinSettings(BaseSettings):
+    MODE: str = "replay"
+    HOST: str = "127.0.0.1"
+    PORT: int = 8765
+    FIXTURE_DIR: str = "devtools/fixtures/estat"
+    # record モードの転送先と appId（appId はフィクスチャには保存しない）
+    UPSTREAM_URL: str = "https://api.e-stat.go.jp/rest/3.0/app/json"
+    UPSTREAM_APP_ID: str = ""
+    # レイテンシ注入（ミリ秒）: 平均 ± 揺らぎ の一様分布
+    LATENCY_MS: float = 0.0
+    LATENCY_JITTER_MS: float = 0.0
+    # エラー注入: この確率で 503 を返す
+    ERROR_RATE: float = 0.0
+    RETRY_AFTER_SEC: int = 1
+    SEED: int = 0
+    # synthetic モードの規模
+    SYNTHETIC_ITEMS: int = 600
+    SYNTHETIC_AREAS: str = "13100,27100,23100,40130,01100"
+    SYNTHETIC_MONTHS: int = 24
+
+    model_config = SettingsConfigDict(
+        env_prefix="ESTAT_STANDIN_",
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+    )
+
+
+standin_settings = StandinSettings()
+_rng = random.Random(standin_settings.SEED)
+_stats = {"requests": 0, "injected_errors": 0, "fixture_misses": 0, "recorded": 0}
+
+app = FastAPI(title="e-Stat stand-in")
+
+SYNTHETIC_STATS_DATA_ID = "0003421913"
+# 代表品目（本物の統計表の判定に使われる品目名を含める）
+_SYNTHETIC_BASE_NAMES = ["鶏卵", "牛乳", "食パン", "うるち米", "キャベツ", "たまねぎ", "じゃがいも", "トマト",
+                         "バナナ", "りんご", "豚肉(バラ)", "牛肉(ロース)", "鶏肉", "さば缶詰", "即席めん", "アイスクリーム"]
+_SYNTHETIC_UNITS = ["1パック", "1000ml", "1kg", "100g", "1個", "1袋"]
+
+
+# =================================================================
+# フィクスチャ（record / replay）
+# =================================================================
+
+
+def _fixture_path(path: str, params: dict[str, str]) -> Path:
+    # appId はキーに含めない（誰が記録しても同じフィクスチャを引けるように）
+    key_params = sorted((k, v) for k, v in params.items() if k != "appId")
+    raw = json.dumps([path, key_params], ensure_ascii=False, separators=(",", ":"))
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return Path(standin_settings.FIXTURE_DIR) / path / f"{digest}.json"
+
+
+def _load_fixture(path: str, params: dict[str, str]) -> dict[str, Any] | None:
+    fp = _fixture_path(path, params)
+    if not fp.is_file():
+        return None
+    with fp.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def _record(path: str, params: dict[str, str]) -> dict[str, Any]:
+    if not standin_settings.UPSTREAM_APP_ID:
+        raise HTTPException(status_code=500, detail="record モードには ESTAT_STANDIN_UPSTREAM_APP_ID が必要です")
+    upstream_params = {**params, "appId": standin_settings.UPSTREAM_APP_ID}
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout=90.0, connect=5.0)) as client:
+        r = await client.get(f"{standin_settings.UPSTREAM_URL}/{path}", params=upstream_params)
+    r.raise_for_status()
+    body = r.json()
+    fixture = {
+        "path": path,
+        "params": {k: v for k, v in params.items() if k != "appId"},
+        "body": body,
+    }
+    write_json_atomic(_fixture_path(path, params), fixture)
+    _stats["recorded"] += 1
+    logger.info(f"フィクスチャを記録しました: {path} {fixture['params']}")
+    return body
+
+
+# =================================================================
+# 合成データ（synthetic）
+# =================================================================
+
+
+def _synthetic_items() -> list[tuple[str, str, str]]:
+    """(コード, 名前, 単位) の一覧。コードは食料品目（01xxx）として採番する。"""
+    items: list[tuple[str, str, str]] = []
+    for i in range(standin_settings.SYNTHETIC_ITEMS):
+        base = _SYNTHETIC_BASE_NAMES[i % len(_SYNTHETIC_BASE_NAMES)]
+        name = base if i < len(_SYNTHETIC_BASE_NAMES) else f"{base}{i // len(_SYNTHETIC_BASE_NAMES)}"
+        code = f"01{i + 1:03d}"
+        items.append((code, f"{1000 + i} {name}", _SYNTHETIC_UNITS[i % len(_SYNTHETIC_UNITS)]))
+    return items
+
+
+def _synthetic_time_codes() -> list[str]:
+    # 2024年1月から SYNTHETIC_MONTHS ヶ月分
+    codes: list[str] = []
+    for i in range(standin_settings.SYNTHETIC_MONTHS):
+        y, m = 2024 + i // 12, i % 12 + 1
+        codes.append(f"{y}00{m:02d}{m:02d}")
+    return codes
+
+
+def _synthetic_price(code: str, area: str, time_code: str) -> float:
+    h = int(hashlib.md5(f"{code}:{area}:{time_code}".encode()).hexdigest()[:8], 16)
+    base = 100 + int(code[2:]) % 50 * 20
+    return float(base + h % 40)
+
+
+def _synthetic_response(path: str, params: dict[str, str]) -> dict[str, Any]:
+    if path == "getStatsList":
+        return {"GET_STATS_LIST": {"DATALIST_INF": {"TABLE_INF": [
+            {"@id": SYNTHETIC_STATS_DATA_ID, "TITLE": {"$": "小売物価統計調査 動向編 主要品目の都市別小売価格 全国 月別"}},
+        ]}}}
+
+    if path == "getMetaInfo":
+        areas = [a for a in standin_settings.SYNTHETIC_AREAS.split(",") if a]
+        return {"GET_META_INFO": {"METADATA_INF": {"CLASS_INF": {"CLASS_OBJ": [
+            {"@id": "tab", "CLASS": {"@code": "01", "@name": "価格"}},
+            {"@id": "cat01", "CLASS": [
+                {"@code": code, "@name": name, "@unit": unit} for code, name, unit in _synthetic_items()
+            ]},
+            {"@id": "area", "CLASS": [{"@code": a, "@name": a} for a in areas]},
+            {"@id": "time", "CLASS": [{"@code": t, "@name": t} for t in _synthetic_time_codes()]},
+        ]}}}}
+
+    if path == "getStatsData":
+        units = {code: unit for code, _, unit in _synthetic_items()}
+        codes = [c for c in params.get("cdCat01", "").split(",") if c] or list(units)
+        all_areas = [a for a in standin_settings.SYNTHETIC_AREAS.split(",") if a]
+        areas = [a for a in params.get("cdArea", "").split(",") if a] or all_areas
+        times = _synthetic_time_codes()
+        if params.get("cdTime"):
+            times = [t for t in times if t == params["cdTime"]]
+        if params.get("cdTimeFrom"):
+            times = [t for t in times if t >= params["cdTimeFrom"]]
+        if params.get("cdTimeTo"):
+            times = [t for t in times if t <= params["cdTimeTo"]]
+
+        values = [
+            {"@tab": "01", "@cat01": code, "@area": area, "@time": t, "@unit": units[code],
+             "$": str(_synthetic_price(code, area, t))}
+            for code in codes if code in units
+            for area in areas if area in all_areas
+            for t in times
+        ]
+        start = int(params.get("startPosition", "1"))
+        limit = int(params.get("limit", "100000"))
+        page = values[start - 1:start - 1 + limit]
+        result_inf: dict[str, Any] = {"TOTAL_NUMBER": len(values)}
+        if start - 1 + limit < len(values):
+            result_inf["NEXT_KEY"] = start + limit
+        return {"GET_STATS_DATA": {"STATISTICAL_DATA": {
+            "RESULT_INF": result_inf,
+            "DATA_INF": {"VALUE": page},
+        }}}
+
+    raise HTTPException(status_code=404, detail=f"未対応のAPIです: {path}")
+
+
+# =================================================================
+# エンドポイント
+# =================================================================
+
+
+async def _inject_faults() -> JSONResponse | None:
+    delay_ms = standin_settings.LATENCY_MS
+    if standin_settings.LATENCY_JITTER_MS:
+        delay_ms += _rng.uniform(-standin_settings.LATENCY_JITTER_MS, standin_settings.LATENCY_JITTER_MS)
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000)
+
+    if standin_settings.ERROR_RATE and _rng.random() < standin_settings.ERROR_RATE:
+        _stats["injected_errors"] += 1
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "injected error"},
+            headers={"Retry-After": str(standin_settings.RETRY_AFTER_SEC)},
+        )
+    return None
+
+
+@app.get("/_standin/stats")
+def standin_stats() -> dict[str, Any]:
+    return {"mode": standin_settings.MODE, **_stats}
+
+
+@app.get("/{path}")
+async def estat_api(path: str, request: Request) -> Any:
+    _stats["requests"] += 1
+    fault = await _inject_faults()
+    if fault is not None:
+        return fault
+
+    params = dict(request.query_params)
+    mode = standin_settings.MODE
+    if mode == "synthetic":
+        return _synthetic_response(path, params)
+
+    fixture = _load_fixture(path, params)
+    if fixture is not None:
+        return fixture["body"]
+    if mode == "record":
+        return await _record(path, params)
+
+    _stats["fixture_misses"] += 1
+    raise HTTPException(status_code=404, detail=f"フィクスチャがありません: {path} {params}")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=standin_settings.HOST, port=standin_settings.PORT, log_level="warning")
@@ -1,12 +1,22 @@
 import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Any
 
 from config import settings
-from db import CurrentUser, supabase
-from fastapi import FastAPI, File, UploadFile
+from db import AdminOnly, CurrentUser, supabase
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
-from model import analyze_receipt_with_market_data
+from model import (
+    analyze_receipt_with_market_data,
+    get_image_stats,
+    get_model_call_stats,
+    get_prompt_stats,
+    get_vision_backend,
+    shutdown_image_executor,
+    unpack_image_archive,
+)
 from schemas import (
     EStatClient,
     Profile,
@@ -15,11 +25,44 @@ from schemas import (
     RankingResponse,
     Receipt,
     ReceiptCreate,
+    ReceiptTextBatchRequest,
+    ReceiptTextRequest,
     ReceiptUpdate,
 )
-from services.market_data import fetch_all_market_data
-
-app = FastAPI(title="Receipt AI Analyzer", version="2.0-advanced")
+from schemas.normalize import get_normalize_cache_stats
+from schemas.rules_engine import get_rules_status, reload_rules, start_rules_watcher, stop_rules_watcher
+from services.market_data import (
+    fetch_all_market_data,
+    get_market_data_for,
+    get_market_data_status,
+    get_market_data_version,
+    load_market_data_snapshot,
+    start_market_data_refresher,
+    stop_market_data_refresher,
+)
+from services.pricing import analyze_receipt_locally_first, analyze_receipt_text, analyze_receipt_text_locally
+from services.result_cache import cached_analysis, get_result_cache_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # 前回保存した市場データを読み込み、最初のリクエストからキャッシュを使えるようにする
+    await asyncio.to_thread(load_market_data_snapshot)
+    # e-Stat への接続はプロセス全体で1つの接続プールを使い回す
+    await estat_client.open()
+    # 品目ルールを読み込み、ファイルが更新されたら再起動なしで差し替える
+    start_rules_watcher()
+    # 期限切れ前に裏で市場データを更新し、ユーザーのリクエストが e-Stat を待たないようにする
+    if settings.MARKET_DATA_BACKGROUND_REFRESH:
+        start_market_data_refresher(estat_client)
+    yield
+    await stop_rules_watcher()
+    await stop_market_data_refresher()
+    await estat_client.aclose()
+    shutdown_image_executor()
+
+
+app = FastAPI(title="Receipt AI Analyzer", version="2.0-advanced", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,19 +80,56 @@ def health() -> dict[str, Any]:
     return {
         "ok": True,
         "vision_model": settings.GEMINI_MODEL,
+        "vision_backend": get_vision_backend().stats(),
         "estat_app_id_set": bool(settings.ESTAT_APP_ID),
+        "market_data": get_market_data_status(),
+        "estat_http": estat_client.get_http_stats(),
+        "estat_resilience": estat_client.get_resilience_stats(),
+        "estat_class_map_cache": estat_client.get_class_map_cache_stats(),
+        "rules": get_rules_status(),
+        "normalize_cache": get_normalize_cache_stats(),
+        "prompt": get_prompt_stats(),
+        "model_calls": get_model_call_stats(),
+        "image_preprocess": get_image_stats(),
+        "result_cache": get_result_cache_stats(),
     }
 
 
+async def _analyze_image(
+    file_bytes: bytes,
+    area_code: str | None,
+    market_data: list[dict[str, str | float]],
+    user_id: str,
+) -> tuple[dict[str, Any], bool]:
+    """
+    1枚のレシート画像を解析します（/analyzeReceipt と一括解析で共通）。
+
+    戻り値は (解析結果, 節約額を保存すべきか)。同じユーザーが同じレシートを送り直した場合は False です。
+    """
+    # 同じ画像・同じ条件の解析結果はキャッシュから返す（同時に届いた同じ画像は1回の解析を共有）
+    if settings.LOCAL_PRICING_ENABLED:
+        return await cached_analysis(
+            file_bytes, area_code, lambda image: analyze_receipt_locally_first(image, area_code), user_id
+        )
+    data_version = get_market_data_version()
+    return await cached_analysis(
+        file_bytes, area_code,
+        lambda image: analyze_receipt_with_market_data(image, market_data, data_version),
+        user_id,
+    )
+
+
 @app.post("/analyzeReceipt")
 async def analyze_receipt(
     user: CurrentUser,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    area_code: str | None = Form(None),
 ):
     """
     レシート画像をAIで高度分析します。
-    1. e-Stat APIから最新の市場価格を取得
+    1. e-Stat APIから最新の市場価格を取得（area_code 指定時はその地域の価格）
     2. 画像と市場価格をGeminiに送信
+       （LOCAL_PRICING_ENABLED 時は読取のみGeminiで行い、名寄せ・価格比較はローカルで計算）
     3. AIによる正規化・比較結果を返却
     """
     file_bytes = await file.read()
@@ -57,6 +137,8 @@ async def analyze_receipt(
     # e-Stat APIから全品目の市場価格を取得（キャッシュ付き）
     logger.info("Fetching market data from e-Stat API...")
     market_data = await fetch_all_market_data(estat_client)
+    if area_code:
+        market_data = get_market_data_for(area_code=area_code)
     logger.info(f"Market data fetched: {len(market_data)} items")
 
     # Gemini による高度な画像解析を実行
@@ -64,26 +146,17 @@ async def analyze_receipt(
         logger.info("Starting AI analysis with market data...")
         async with asyncio.TaskGroup() as tg:
             logger.info("Creating task for analyze_receipt_with_market_data...")
-            task = tg.create_task(analyze_receipt_with_market_data(file_bytes, market_data))
+            task = tg.create_task(_analyze_image(file_bytes, area_code, market_data, user["id"]))
             logger.info("Task created, awaiting result...")
 
-        analysis_result = task.result()
+        analysis_result, first = task.result()
         logger.info("AI analysis task completed.")
 
-        # 解析成功後、節約額をSupabaseに保存
-        try:
-            summary = analysis_result.get("summary", {})
-            supabase.table("savings_records").insert({
-                "user_id": user["id"],
-                "purchase_date": analysis_result.get("purchase_date", "1970-01-01"),
-                "store_name": analysis_result.get("store_name"),
-                "total_saved_amount": int(summary.get("total_saved_amount", 0)),
-                "total_overpaid_amount": int(summary.get("total_overpaid_amount", 0)),
-                "item_count": len(analysis_result.get("items", []))
-            }).execute()
-            logger.info(f"Savings record saved for user {user['id']}")
-        except Exception as save_error:
-            logger.warning(f"Failed to save savings record: {save_error}")
+        # 解析成功後、節約額をSupabaseに保存（同じレシートの再送・二度押しでは保存し直さない）
+        if first:
+            _save_savings_records(user["id"], [analysis_result])
+        else:
+            logger.info("同じレシートの再送のため、節約額は保存しません")
 
         return analysis_result
 
@@ -92,6 +165,200 @@ async def analyze_receipt(
             print(f"Error during AI analysis: {str(e)}")
 
 
+def _is_zip_upload(file: UploadFile) -> bool:
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in (
+        "application/zip", "application/x-zip-compressed"
+    )
+
+
+async def _read_batch_uploads(files: list[UploadFile]) -> list[tuple[str, bytes]]:
+    """アップロードされた画像と zip を (ファイル名, バイト列) の並びに展開します（zip の中身は zip 内の順序）。"""
+    images: list[tuple[str, bytes]] = []
+    total = 0
+    for i, file in enumerate(files):
+        data = await file.read()
+        name = file.filename or f"file{i}"
+        if _is_zip_upload(file):
+            entries = await asyncio.to_thread(
+                unpack_image_archive, data, settings.IMAGE_BATCH_MAX_BYTES - total
+            )
+            images.extend((f"{name}/{entry}", body) for entry, body in entries)
+            total += sum(len(body) for _, body in entries)
+        else:
+            images.append((name, data))
+            total += len(data)
+        if total > settings.IMAGE_BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="一度にアップロードできる画像の合計サイズを超えています。")
+        if len(images) > settings.IMAGE_BATCH_MAX_IMAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"一度に解析できるレシート画像は{settings.IMAGE_BATCH_MAX_IMAGES}枚までです。"
+            )
+    return images
+
+
+@app.post("/analyzeReceipt/batch")
+async def analyze_receipt_batch(
+    user: CurrentUser,
+    files: list[UploadFile] = File(...),
+    area_code: str | None = Form(None),
+) -> dict[str, Any]:
+    """
+    複数のレシート画像（または画像をまとめた zip）を一括解析します（結果は入力と同じ順序）。
+    市場データは1回だけ取得し、IMAGE_BATCH_CONCURRENCY 枚ずつ並行して解析します。
+    失敗したレシートは error に理由を入れて返し、成功分の節約額は1回の insert でまとめて保存します。
+    """
+    images = await _read_batch_uploads(files)
+    if not images:
+        raise HTTPException(status_code=400, detail="解析できるレシート画像がありません。")
+
+    market_data = await fetch_all_market_data(estat_client)
+    if area_code:
+        market_data = get_market_data_for(area_code=area_code)
+
+    sem = asyncio.Semaphore(max(1, settings.IMAGE_BATCH_CONCURRENCY))
+    # 節約額を保存する結果（同じユーザーが以前に送った・同じバッチに重複しているレシートは除く）
+    to_save: list[dict[str, Any]] = []
+
+    async def analyze_one(index: int, filename: str, file_bytes: bytes) -> dict[str, Any]:
+        async with sem:
+            try:
+                result, first = await _analyze_image(file_bytes, area_code, market_data, user["id"])
+                if first:
+                    to_save.append(result)
+                return {"index": index, "filename": filename, "ok": True, "duplicate": not first, "result": result}
+            except HTTPException as e:
+                return {"index": index, "filename": filename, "ok": False,
+                        "status_code": e.status_code, "error": e.detail}
+            except Exception as e:
+                logger.warning(f"Batch analysis failed for {filename}: {e}")
+                return {"index": index, "filename": filename, "ok": False,
+                        "status_code": 500, "error": "レシートの解析に失敗しました。"}
+
+    logger.info(f"Batch analysis started: {len(images)} images (concurrency {settings.IMAGE_BATCH_CONCURRENCY})")
+    results = list(await asyncio.gather(*(analyze_one(i, name, data) for i, (name, data) in enumerate(images))))
+    succeeded = sum(1 for r in results if r["ok"])
+    _save_savings_records(user["id"], to_save)
+    return {
+        "count": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
+
+
+def _savings_record(user_id: str, analysis_result: dict[str, Any]) -> dict[str, Any]:
+    summary = analysis_result.get("summary", {})
+    return {
+        "user_id": user_id,
+        "purchase_date": analysis_result.get("purchase_date", "1970-01-01"),
+        "store_name": analysis_result.get("store_name"),
+        "total_saved_amount": int(summary.get("total_saved_amount", 0)),
+        "total_overpaid_amount": int(summary.get("total_overpaid_amount", 0)),
+        "item_count": len(analysis_result.get("items", []))
+    }
+
+
+def _save_savings_records(user_id: str, analysis_results: list[dict[str, Any]]) -> None:
+    """
+    解析結果の節約額をSupabaseに保存します（複数件は1回の insert にまとめる）。
+
+    まとめた insert が失敗した場合は（不正な日付の行が1つあるだけでも全体が失敗するため）、
+    1件ずつ insert し直して保存できる行は保存します。
+    """
+    if not analysis_results:
+        return
+    records = [_savings_record(user_id, r) for r in analysis_results]
+    try:
+        supabase.table("savings_records").insert(records if len(records) > 1 else records[0]).execute()
+        logger.info(f"Savings record saved for user {user_id} ({len(records)} records)")
+        return
+    except Exception as save_error:
+        if len(records) == 1:
+            logger.warning(f"Failed to save savings record: {save_error}")
+            return
+        logger.warning(f"Bulk insert of savings records failed, retrying one by one: {save_error}")
+
+    saved = 0
+    for record in records:
+        try:
+            supabase.table("savings_records").insert(record).execute()
+            saved += 1
+        except Exception as save_error:
+            logger.warning(
+                f"Failed to save savings record ({record['purchase_date']}, {record['store_name']}): {save_error}"
+            )
+    logger.info(f"Savings record saved for user {user_id} ({saved}/{len(records)} records)")
+
+
+@app.post("/analyzeReceiptText")
+async def analyze_receipt_text_endpoint(user: CurrentUser, data: ReceiptTextRequest) -> dict[str, Any]:
+    """
+    レシートのテキスト（電子レシート・OCR済みテキスト）を解析します。
+    parse_receipt_text で行を読み取り、名寄せ・価格比較はローカルで行います。
+    use_model_fallback 指定時のみ、解決できなかった商品を Gemini に問い合わせます。
+    """
+    await fetch_all_market_data(estat_client)
+    result = await analyze_receipt_text(data.text, data.area_code, data.use_model_fallback)
+    _save_savings_records(user["id"], [result])
+    return result
+
+
+@app.post("/analyzeReceiptText/batch")
+async def analyze_receipt_text_batch(user: CurrentUser, data: ReceiptTextBatchRequest) -> dict[str, Any]:
+    """
+    複数のテキストレシートを一括解析します（結果は入力と同じ順序）。
+    モデルを使わない場合はイベントループを塞がないよう別スレッドでまとめて処理します。
+    失敗したレシートは error に理由を入れて返し、成功分だけ節約額を保存します。
+    """
+    if len(data.texts) > settings.TEXT_BATCH_MAX_RECEIPTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"一度に解析できるレシートは{settings.TEXT_BATCH_MAX_RECEIPTS}件までです。"
+        )
+
+    def error_entry(index: int, e: Exception) -> dict[str, Any]:
+        if isinstance(e, HTTPException):
+            return {"index": index, "ok": False, "status_code": e.status_code, "error": e.detail}
+        logger.warning(f"Text batch analysis failed for receipt {index}: {e}")
+        return {"index": index, "ok": False, "status_code": 500, "error": "レシートの解析に失敗しました。"}
+
+    await fetch_all_market_data(estat_client)
+    if data.use_model_fallback:
+        sem = asyncio.Semaphore(settings.TEXT_BATCH_MODEL_CONCURRENCY)
+
+        async def analyze_one(index: int, text: str) -> dict[str, Any]:
+            async with sem:
+                try:
+                    return {"index": index, "ok": True,
+                            "result": await analyze_receipt_text(text, data.area_code, True)}
+                except Exception as e:
+                    return error_entry(index, e)
+
+        results = list(await asyncio.gather(*(analyze_one(i, t) for i, t in enumerate(data.texts))))
+    else:
+        def analyze_all() -> list[dict[str, Any]]:
+            entries = []
+            for i, text in enumerate(data.texts):
+                try:
+                    entries.append({"index": i, "ok": True,
+                                    "result": analyze_receipt_text_locally(text, data.area_code)})
+                except Exception as e:
+                    entries.append(error_entry(i, e))
+            return entries
+
+        results = await asyncio.to_thread(analyze_all)
+
+    succeeded = [r["result"] for r in results if r["ok"]]
+    _save_savings_records(user["id"], succeeded)
+    return {
+        "count": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "results": results,
+    }
+
+
 @app.get("/profile", response_model=Profile)
 async def get_profile(user: CurrentUser) -> Profile:
     """自分のプロフィールを取得します。"""
@@ -296,3 +563,22 @@ async def clear_receipts(user: CurrentUser) -> dict[str, bool]:
     """自分のレシートを全削除します。"""
     supabase.table("receipts").delete().eq("user_id", user["id"]).execute()
     return {"success": True}
+
+
+@app.get("/admin/rules")
+def get_rules_admin(_: AdminOnly) -> dict[str, Any]:
+    """品目ルールのバージョン・コンパイル時間・照合の集計を返します。"""
+    return get_rules_status()
+
+
+@app.post("/admin/rules/reload")
+async def reload_rules_admin(_: AdminOnly, force: bool = False) -> dict[str, Any]:
+    """
+    品目ルールのファイルを読み直して差し替えます（ワーカーの再起動は不要）。
+    ファイルが不正な場合は 422 を返し、現在のルールを使い続けます。
+    複数ワーカーで動かしている場合、このリクエストを受けたワーカー以外はファイル監視で反映されます。
+    """
+    try:
+        return await asyncio.to_thread(reload_rules, None, force)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"品目ルールを読み込めませんでした: {e}")
@@ -1,8 +1,29 @@
-from .genai import client
-from .generate import analyze_receipt_with_market_data, get_model_name
+from .backend import VisionBackend, get_vision_backend, set_vision_backend
+from .genai import get_client
+from .generate import (
+    analyze_receipt_with_market_data,
+    extract_receipt_items,
+    get_model_name,
+    price_items_with_model,
+)
+from .image import PreparedImage, get_image_stats, prepare_image, shutdown_image_executor, unpack_image_archive
+from .prompt_cache import get_prompt_stats
+from .scheduler import get_model_call_stats
 
 __all__ = [
-    "client",
+    "get_client",
+    "VisionBackend",
+    "get_vision_backend",
+    "set_vision_backend",
     "analyze_receipt_with_market_data",
+    "extract_receipt_items",
+    "price_items_with_model",
     "get_model_name",
+    "get_prompt_stats",
+    "get_model_call_stats",
+    "PreparedImage",
+    "get_image_stats",
+    "prepare_image",
+    "shutdown_image_executor",
+    "unpack_image_archive",
 ]
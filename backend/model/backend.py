@@ -0,0 +1,118 @@
+"""
+画像解析（Vision）バックエンドの切り替え
+
+generate.py はプロンプトと画像を組み立てるだけで、実際の呼び出しは VisionBackend に任せます。
+VISION_BACKEND で使うバックエンドを選びます。
+- "gemini": Google Gemini（google-genai SDK）
+- "mock"  : 負荷試験用のローカル代替（model.mock_backend、ネットワーク・API キー・クォータ不要）
+
+contents は文字列（プロンプト）と PreparedImage（前処理済みの画像）の並びで、
+応答は response_schema（GeminiReceiptResponse など）に沿った JSON 文字列です。
+"""
+from typing import Any, Protocol
+
+from google.genai import types
+from pydantic import BaseModel
+
+from config import settings
+
+from .genai import get_client
+from .image import PreparedImage
+from .mock_backend import MockVisionBackend
+
+
+class VisionBackend(Protocol):
+    name: str
+    # API キーが必要か（不要なバックエンドでは未設定でも呼び出せる）
+    requires_api_key: bool
+
+    async def generate(
+        self,
+        model: str,
+        contents: list[str | PreparedImage],
+        response_schema: type[BaseModel],
+        cached_content: str | None = None,
+    ) -> str:
+        """contents を送り、response_schema に沿った JSON 文字列を返します（空の応答は空文字）。"""
+        ...
+
+    async def create_cached_content(self, model: str, text: str, ttl: int, display_name: str) -> str:
+        """text をコンテキストキャッシュに登録し、キャッシュ名を返します。"""
+        ...
+
+    async def delete_cached_content(self, name: str) -> None:
+        ...
+
+    def stats(self) -> dict[str, Any]:
+        ...
+
+
+def _to_gemini_part(content: str | PreparedImage) -> Any:
+    if isinstance(content, PreparedImage):
+        return types.Part.from_bytes(data=content.data, mime_type=content.mime_type)
+    return content
+
+
+class GeminiBackend:
+    """Google Gemini（構造化出力）"""
+
+    name = "gemini"
+    requires_api_key = True
+
+    async def generate(
+        self,
+        model: str,
+        contents: list[str | PreparedImage],
+        response_schema: type[BaseModel],
+        cached_content: str | None = None,
+    ) -> str:
+        response = await get_client().aio.models.generate_content(
+            model=model,
+            contents=[_to_gemini_part(c) for c in contents],  # type: ignore
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=response_schema,
+                cached_content=cached_content,
+            )
+        )
+        return response.text or ""
+
+    async def create_cached_content(self, model: str, text: str, ttl: int, display_name: str) -> str:
+        cache = await get_client().aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                contents=text,
+                display_name=display_name[:128],
+                ttl=f"{ttl}s",
+            ),
+        )
+        if not cache.name:
+            raise RuntimeError("キャッシュ名が返されませんでした")
+        return cache.name
+
+    async def delete_cached_content(self, name: str) -> None:
+        await get_client().aio.caches.delete(name=name)
+
+    def stats(self) -> dict[str, Any]:
+        return {"name": self.name}
+
+
+_backend: VisionBackend | None = None
+
+
+def get_vision_backend() -> VisionBackend:
+    """VISION_BACKEND に応じたバックエンドを返します（最初に使うときに作る）。"""
+    global _backend
+    if _backend is None:
+        # 値は Settings で "gemini" / "mock" に検証済み
+        if settings.VISION_BACKEND == "mock":
+            _backend = MockVisionBackend()
+        else:
+            _backend = GeminiBackend()
+    return _backend
+
+
+def set_vision_backend(backend: VisionBackend | None) -> None:
+    """バックエンドを差し替えます（ベンチマーク・負荷試験用、None なら VISION_BACKEND から作り直す）。"""
+    global _backend
+    _backend = backend
@@ -1,5 +1,10 @@
+from functools import cache
+
 from google import genai
 from config import settings
 
 
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+@cache
+def get_client() -> genai.Client:
+    """Gemini のクライアント（最初に使うときに作る。VISION_BACKEND=mock では作らない）"""
+    return genai.Client(api_key=settings.GEMINI_API_KEY)
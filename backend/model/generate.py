@@ -1,64 +1,189 @@
-import io
 import json
 import logging
+import time
 from typing import Any
 
 from fastapi import HTTPException
-from google.genai import types
 from loguru import logger
-from PIL import Image
+from pydantic import BaseModel
 
 from config import settings
-from schemas import GeminiReceiptResponse
-from model import client
+from schemas import GeminiItemPricingResponse, GeminiReceiptExtraction, GeminiReceiptResponse
 
-from .prompt import SYSTEM_INSTRUCTION
+from .backend import get_vision_backend
+from .image import PreparedImage, prepare_image
+from .prompt import EXTRACTION_INSTRUCTION, ITEM_PRICING_INPUT, ITEM_PRICING_INSTRUCTION, SYSTEM_INSTRUCTION
+from .prompt_cache import PromptPrefix, invalidate_cached_content, prompt_contents, record_prompt, render_prefix
+from .scheduler import call_with_hedging
 
 
-async def analyze_receipt_with_market_data(
-        file_bytes: bytes,
-        market_data: list[dict[str, str | int | float]]
-) -> dict[str, Any]:
-    """最新の google-genai SDK を使用して詳細なAI分析を実行します。"""
-    if not settings.GEMINI_API_KEY:
+def compact_json(data: Any) -> str:
+    """プロンプトに埋め込む JSON（インデント・区切りの空白なし）"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _require_backend() -> None:
+    """API キーが必要なバックエンドでキーが未設定なら 500 を返します。"""
+    if get_vision_backend().requires_api_key and not settings.GEMINI_API_KEY:
         logger.error("Gemini APIキーが設定されていません。")
         raise HTTPException(status_code=500, detail="Gemini APIキーが設定されていません。")
 
+
+async def _generate(
+        kind: str,
+        prefix: PromptPrefix | None,
+        reused: bool,
+        build_ms: float,
+        rest: list[str | PreparedImage],
+        response_schema: type[BaseModel],
+) -> str:
+    """
+    前半部分（指示文 + 市場データ）と可変部分（画像・商品）で Vision バックエンドを呼び出し、応答の JSON 文字列を返します。
+
+    呼び出しは model.scheduler の締め切り・ヘッジ付きで行い、GEMINI_MODEL と GEMINI_MODEL_FALLBACK の
+    先に成功したほうの応答を返します（空の応答は失敗として扱う）。
+    前半部分がコンテキストキャッシュに登録済みなら可変部分だけを送ります（キャッシュを作るのは GEMINI_MODEL のみ）。
+    キャッシュ名が使えなかった場合は、キャッシュを忘れて前半部分ごと送り直します。
+    prefix が None の場合は rest をそのまま送ります。
+    """
+    backend = get_vision_backend()
+    # モデルごとに送ったプロンプトの大きさ・キャッシュの使用（ヘッジしても記録は採用した1回分だけ）
+    sent: dict[str, tuple[int, str | None, str | None]] = {}
+
+    async def call(model: str) -> tuple[str, str]:
+        if prefix is None:
+            contents, cached_name, hit_name = rest, None, None
+        else:
+            contents, cached_name, hit_name = await prompt_contents(
+                prefix, model, rest, create=model == settings.GEMINI_MODEL
+            )
+        inline_bytes = sum(len(c.encode("utf-8")) for c in contents if isinstance(c, str))
+        sent[model] = (inline_bytes, cached_name, hit_name)
+
+        try:
+            text = await backend.generate(model, contents, response_schema, cached_name)
+        except Exception as e:
+            if cached_name is None or prefix is None:
+                raise
+            logger.warning(f"コンテキストキャッシュを使った呼び出しに失敗したため、前半部分ごと送り直します: {e}")
+            invalidate_cached_content(cached_name)
+            text = await backend.generate(model, [prefix.text, *rest], response_schema)
+        if not text:
+            raise ValueError(f"{model} から有効な応答がありませんでした。")
+        return model, text
+
     try:
-        # プロンプトの組み立て
+        model, text = await call_with_hedging(kind, call)
+    except BaseException:
+        # 失敗した場合は最初に送った呼び出し（GEMINI_MODEL）の分を記録する
+        if sent:
+            record_prompt(kind, prefix, reused, build_ms, *next(iter(sent.values())))
+        raise
+    record_prompt(kind, prefix, reused, build_ms, *sent[model])
+    return text
+
+
+async def analyze_receipt_with_market_data(
+        file_bytes: bytes | PreparedImage,
+        market_data: list[dict[str, str | int | float]],
+        data_version: str | None = None,
+) -> dict[str, Any]:
+    """
+    最新の google-genai SDK を使用して詳細なAI分析を実行します。
+
+    data_version: market_data が市場データキャッシュの一覧そのものなら、そのバージョン
+    （指定するとプロンプトの前半部分をバージョンが変わるまで使い回す）
+    """
+    _require_backend()
+
+    try:
+        # プロンプトの組み立て（市場データが変わっていなければ作り置きを使う）
         logger.info("Preparing prompt for Gemini analysis...")
-        market_data_json = json.dumps(market_data, ensure_ascii=False, indent=2)
-        full_prompt = SYSTEM_INSTRUCTION.replace("{{MARKET_DATA_JSON}}", market_data_json)
-        # 画像の読み込み
-
-        logger.info("Loading image for Gemini analysis...")
-        img = Image.open(io.BytesIO(file_bytes))
-        logger.info("Image loaded successfully.")
-
-        # 構造化出力を使用してGemini APIを呼び出し
-        response = await client.aio.models.generate_content(
-            model=settings.GEMINI_MODEL,
-            contents=[full_prompt, img],  # type: ignore
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=GeminiReceiptResponse
-            )
+        started = time.perf_counter()
+        prefix, reused = render_prefix(
+            "receipt", SYSTEM_INSTRUCTION, "{{MARKET_DATA_JSON}}", market_data, data_version, compact_json
         )
+        build_ms = (time.perf_counter() - started) * 1000
+        # 画像の前処理（縮小・グレースケール化、別スレッドで実行）
+        logger.info("Preprocessing image for Gemini analysis...")
+        image = await prepare_image(file_bytes)
+        logger.info("Image preprocessed successfully.")
+
+        # 構造化出力を使用して Vision バックエンド（既定は Gemini）を呼び出し
+        text = await _generate("receipt", prefix, reused, build_ms, [image], GeminiReceiptResponse)
         logger.info("Gemini analysis completed.")
-        if not response.text:
-            logger.error("Gemini APIから有効な応答がありませんでした。")
-            raise HTTPException(status_code=500, detail="Gemini APIから有効な応答がありませんでした。")
 
         # 構造化出力により、JSONは既に正しい形式で返される
-        text = response.text.strip()
+        text = text.strip()
         logger.info(f"Raw Gemini response text: {text}")
         return json.loads(text)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Gemini Analysis Error: {e}")
         raise HTTPException(status_code=500, detail=f"AI分析中にエラーが発生しました: {str(e)}")
 
 
+async def extract_receipt_items(file_bytes: bytes | PreparedImage) -> dict[str, Any]:
+    """
+    レシート画像から購入日・店舗名・商品（名前・支払単価・個数）だけを読み取ります。
+
+    価格比較はローカル（services.pricing）で行うため、市場データはプロンプトに含めません。
+    """
+    _require_backend()
+
+    try:
+        image = await prepare_image(file_bytes)
+        text = await _generate("extraction", None, True, 0.0, [EXTRACTION_INSTRUCTION, image], GeminiReceiptExtraction)
+        text = text.strip()
+        logger.info(f"Raw Gemini extraction text: {text}")
+        return json.loads(text)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Gemini Extraction Error: {e}")
+        raise HTTPException(status_code=500, detail=f"AI読取中にエラーが発生しました: {str(e)}")
+
+
+async def price_items_with_model(
+        items: list[dict[str, Any]],
+        market_data: list[dict[str, str | int | float]],
+        data_version: str | None = None,
+) -> list[dict[str, Any]]:
+    """
+    ローカルで解決できなかった商品だけを Gemini に比較させます（画像は送らない）。
+    market_data は呼び出し側で商品に関係しそうな品目に絞ったもの（services.pricing.relevant_market_rows）を渡します。
+    絞り込まずに市場データキャッシュの一覧をそのまま渡すときは data_version も指定してください
+    （指示文 + 市場データの前半部分を使い回し、商品一覧だけを後ろに付けます）。
+
+    戻り値: 入力と同じ順序の GeminiItemResult 相当の dict のリスト
+    """
+    if not items:
+        return []
+    _require_backend()
+
+    try:
+        started = time.perf_counter()
+        prefix, reused = render_prefix(
+            "pricing", ITEM_PRICING_INSTRUCTION, "{{MARKET_DATA_JSON}}", market_data, data_version, compact_json
+        )
+        items_prompt = ITEM_PRICING_INPUT.replace("{{ITEMS_JSON}}", compact_json(items))
+        build_ms = (time.perf_counter() - started) * 1000
+        text = await _generate("pricing", prefix, reused, build_ms, [items_prompt], GeminiItemPricingResponse)
+        text = text.strip()
+        logger.info(f"Raw Gemini pricing text: {text}")
+        result = json.loads(text)
+        return list(result.get("items", []))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Gemini Pricing Error: {e}")
+        raise HTTPException(status_code=500, detail=f"AI価格比較中にエラーが発生しました: {str(e)}")
+
+
 # 互換性のための関数
 def get_model_name() -> list[str]:
     return [settings.GEMINI_MODEL]
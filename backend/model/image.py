@@ -0,0 +1,302 @@
+"""
+Gemini に送る前のレシート画像の前処理
+
+スマートフォンの写真（4〜12MP）をそのまま送ると、アップロードにも画像トークンにも無駄が多いので、
+形式の確認 → EXIF の向きの反映 → （任意で）レシート部分の切り抜き → 長辺 IMAGE_MAX_EDGE への縮小
+→ グレースケール化 → JPEG への再エンコード を行ってから送ります。
+
+デコード・縮小・エンコードは CPU を使うので、専用のスレッドプールで実行しイベントループを塞ぎません
+（Pillow はこれらの処理の間 GIL を解放するので、プロセスを分けなくても並列に動きます）。
+"""
+import asyncio
+import io
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from fastapi import HTTPException
+from loguru import logger
+from PIL import Image, ImageFilter, ImageOps, ImageStat, UnidentifiedImageError
+
+from config import settings
+
+# 受け付ける画像形式（Pillow の format 名、MPO は一部のカメラの JPEG）
+_ALLOWED_FORMATS = frozenset({"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF"})
+# 加工が不要なときに元のまま送ってよい形式
+_PASSTHROUGH_MIME = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+_EXIF_ORIENTATION = 0x0112
+
+# レシート部分の検出は縮小した画像で行う（長辺のピクセル数）
+_CROP_PROBE_EDGE = 256
+# 検出した範囲がこれより小さい（画像に対する面積比）ときは誤検出とみなして切り抜かない
+_CROP_MIN_AREA = 0.2
+# 切り抜いても面積がこれ以上残るなら切り抜かない（効果が小さい）
+_CROP_MAX_AREA = 0.9
+# 検出した範囲の外側に残す余白（長辺に対する比）
+_CROP_MARGIN = 0.02
+# zip から取り出す画像の拡張子（中身の形式は前処理で確認する）
+_ARCHIVE_IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+
+
+class PreparedImage:
+    """前処理済みの画像（Gemini にはこの data と mime_type を送る）"""
+
+    __slots__ = (
+        "data", "mime_type", "width", "height",
+        "source_format", "source_width", "source_height", "source_bytes", "cropped", "dhash", "elapsed_ms",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        mime_type: str,
+        size: tuple[int, int],
+        source_format: str,
+        source_size: tuple[int, int],
+        source_bytes: int,
+        cropped: bool,
+        dhash: int,
+        elapsed_ms: float,
+    ) -> None:
+        self.data = data
+        self.mime_type = mime_type
+        self.width, self.height = size
+        self.source_format = source_format
+        self.source_width, self.source_height = source_size
+        self.source_bytes = source_bytes
+        self.cropped = cropped
+        # 知覚ハッシュ（ほぼ同じ写真の判定用、64bit の difference hash）
+        self.dhash = dhash
+        self.elapsed_ms = elapsed_ms
+
+
+_executor: ThreadPoolExecutor | None = None
+_stats: dict[str, float] = {
+    "images": 0, "rejected": 0, "passthrough": 0, "cropped": 0,
+    "bytes_in": 0, "bytes_out": 0, "pixels_in": 0, "pixels_out": 0, "ms_total": 0.0,
+}
+
+
+def difference_hash(img: Image.Image) -> int:
+    """
+    64bit の difference hash（9x8 に縮小したグレースケール画像で、左右に隣り合う画素の明暗）
+
+    撮り直しや再圧縮程度の違いならハミング距離が小さくなります。
+    """
+    small = img.convert("L").resize((9, 8), Image.Resampling.BOX, reducing_gap=2.0)
+    px = small.tobytes()
+    h = 0
+    for y in range(8):
+        row = px[y * 9:(y + 1) * 9]
+        for x in range(8):
+            h = (h << 1) | (row[x] > row[x + 1])
+    return h
+
+
+def _receipt_bbox(img: Image.Image) -> tuple[int, int, int, int] | None:
+    """
+    背景より明るい紙の範囲（レシート部分）を推定します（見つからなければ None）。
+
+    縮小・平滑化した画像を、平均と最大の中間の明るさで二値化し、明るい部分の外接矩形を取ります。
+    """
+    probe = img.convert("L")
+    probe.thumbnail((_CROP_PROBE_EDGE, _CROP_PROBE_EDGE))
+    probe = probe.filter(ImageFilter.MedianFilter(5))
+    mean = ImageStat.Stat(probe).mean[0]
+    # "L" の画像なので (最小, 最大) の1組（複数バンドのときの形は来ない）
+    extrema = probe.getextrema()
+    if not isinstance(extrema[1], (int, float)):
+        return None
+    brightest = float(extrema[1])
+    threshold = (mean + brightest) / 2
+    if brightest - mean < 24:
+        # 明るさの差がほとんどない（紙が画面いっぱい、または背景も明るい）
+        return None
+
+    box = probe.point(lambda p: 255 if p >= threshold else 0).getbbox()
+    if box is None:
+        return None
+    pw, ph = probe.size
+    left, top, right, bottom = box
+    area = (right - left) * (bottom - top) / (pw * ph)
+    if not _CROP_MIN_AREA <= area <= _CROP_MAX_AREA:
+        return None
+
+    sx, sy = img.width / pw, img.height / ph
+    margin = _CROP_MARGIN * max(img.size)
+    return (
+        max(0, int(left * sx - margin)),
+        max(0, int(top * sy - margin)),
+        min(img.width, int(right * sx + margin)),
+        min(img.height, int(bottom * sy + margin)),
+    )
+
+
+def preprocess_image(file_bytes: bytes) -> PreparedImage:
+    """
+    アップロードされた画像を検証し、Gemini に送る形に整えます（同期処理、スレッドプールから呼ぶ）。
+
+    形式が対応外なら 415、大きすぎる場合は 413、壊れている場合は 400 の HTTPException を送出します。
+    """
+    started = time.perf_counter()
+    if len(file_bytes) > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="画像ファイルが大きすぎます。")
+
+    try:
+        source = Image.open(io.BytesIO(file_bytes))
+        fmt = source.format or ""
+        if fmt not in _ALLOWED_FORMATS:
+            raise HTTPException(status_code=415, detail=f"対応していない画像形式です: {fmt or '不明'}")
+        source_size = source.size
+        if source_size[0] * source_size[1] > settings.IMAGE_MAX_PIXELS:
+            raise HTTPException(status_code=413, detail="画像の画素数が大きすぎます。")
+
+        orientation = source.getexif().get(_EXIF_ORIENTATION, 1)
+        max_edge = settings.IMAGE_MAX_EDGE
+        grayscale = settings.IMAGE_GRAYSCALE
+        # JPEG はデコード時に 1/2〜1/8 に縮小できる（縮小後の大きさを下回らない範囲で使われる）
+        longest = max(source_size)
+        if fmt in ("JPEG", "MPO") and 0 < max_edge < longest and not settings.IMAGE_AUTOCROP:
+            source.draft("L" if grayscale else "RGB", (
+                -(-source_size[0] * max_edge // longest), -(-source_size[1] * max_edge // longest)
+            ))
+
+        img: Image.Image = ImageOps.exif_transpose(source).convert("L" if grayscale else "RGB")
+    except HTTPException:
+        raise
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise HTTPException(status_code=415 if isinstance(e, UnidentifiedImageError) else 413,
+                            detail=f"画像を読み込めませんでした: {e}")
+    except (OSError, SyntaxError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"画像を読み込めませんでした: {e}")
+
+    cropped = False
+    if settings.IMAGE_AUTOCROP:
+        box = _receipt_bbox(img)
+        if box is not None:
+            img = img.crop(box)
+            cropped = True
+
+    if max_edge > 0 and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    dhash = difference_hash(img)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=settings.IMAGE_JPEG_QUALITY, optimize=True)
+    data, mime_type = out.getvalue(), "image/jpeg"
+
+    # 向き・大きさを変えていないのに元より大きくなった場合は元のまま送る
+    if (len(data) >= len(file_bytes) and fmt in _PASSTHROUGH_MIME and orientation == 1
+            and not cropped and img.size == source_size):
+        data, mime_type = file_bytes, _PASSTHROUGH_MIME[fmt]
+        _stats["passthrough"] += 1
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _stats["images"] += 1
+    _stats["cropped"] += 1 if cropped else 0
+    _stats["bytes_in"] += len(file_bytes)
+    _stats["bytes_out"] += len(data)
+    _stats["pixels_in"] += source_size[0] * source_size[1]
+    _stats["pixels_out"] += img.width * img.height
+    _stats["ms_total"] += elapsed_ms
+    logger.info(
+        f"画像を前処理しました: {fmt} {source_size[0]}x{source_size[1]} {len(file_bytes)}バイト → "
+        f"{img.width}x{img.height} {len(data)}バイト ({elapsed_ms:.1f}ms{', 切り抜き' if cropped else ''})"
+    )
+    return PreparedImage(
+        data, mime_type, img.size, fmt, source_size, len(file_bytes), cropped, dhash, elapsed_ms
+    )
+
+
+def unpack_image_archive(archive: bytes, max_total_bytes: int) -> list[tuple[str, bytes]]:
+    """
+    zip に含まれるレシート画像を (ファイル名, バイト列) のリストで返します（同期処理、スレッドから呼ぶ）。
+
+    フォルダ・隠しファイル（__MACOSX/ など）・画像以外の拡張子は読み飛ばします。
+    1枚が IMAGE_MAX_UPLOAD_BYTES を、展開後の合計が max_total_bytes を超える場合は 413、
+    zip として読めない場合は 400 の HTTPException を送出します。
+    """
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(archive))
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail="zip ファイルを読み込めませんでした。") from e
+
+    images: list[tuple[str, bytes]] = []
+    total = 0
+    with zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or any(part.startswith((".", "__MACOSX")) for part in name.split("/")):
+                continue
+            if not name.lower().endswith(_ARCHIVE_IMAGE_SUFFIXES):
+                continue
+            if info.file_size > settings.IMAGE_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"画像ファイルが大きすぎます: {name}")
+            # 申告サイズは偽れるので、上限まで読んで実際の大きさを確かめる
+            try:
+                with zf.open(info) as f:
+                    data = f.read(settings.IMAGE_MAX_UPLOAD_BYTES + 1)
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError) as e:
+                raise HTTPException(status_code=400, detail=f"zip 内のファイルを読み込めませんでした: {name}") from e
+            if len(data) > settings.IMAGE_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"画像ファイルが大きすぎます: {name}")
+            total += len(data)
+            if total > max_total_bytes:
+                raise HTTPException(status_code=413, detail="zip の展開後のサイズが大きすぎます。")
+            images.append((name, data))
+    return images
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.IMAGE_PREPROCESS_WORKERS), thread_name_prefix="image-preprocess"
+        )
+    return _executor
+
+
+async def prepare_image(file_bytes: bytes | PreparedImage) -> PreparedImage:
+    """
+    画像の前処理を専用のスレッドプールで実行します（イベントループは塞がない）。
+
+    前処理済みの画像（結果キャッシュの確認のために先に前処理した場合など）はそのまま返します。
+    """
+    if isinstance(file_bytes, PreparedImage):
+        return file_bytes
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), preprocess_image, file_bytes)
+    except HTTPException:
+        _stats["rejected"] += 1
+        raise
+
+
+def shutdown_image_executor() -> None:
+    """前処理用のスレッドプールを止めます（アプリ終了時）。"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def get_image_stats() -> dict[str, Any]:
+    """
+    画像前処理の統計を取得（/health 用）
+    """
+    n = int(_stats["images"])
+    return {
+        "images": n,
+        "rejected": int(_stats["rejected"]),
+        "passthrough": int(_stats["passthrough"]),
+        "cropped": int(_stats["cropped"]),
+        "avg_ms": round(_stats["ms_total"] / n, 2) if n else None,
+        "avg_bytes_in": round(_stats["bytes_in"] / n) if n else None,
+        "avg_bytes_out": round(_stats["bytes_out"] / n) if n else None,
+        "byte_ratio": round(_stats["bytes_out"] / _stats["bytes_in"], 4) if _stats["bytes_in"] else None,
+        "pixel_ratio": round(_stats["pixels_out"] / _stats["pixels_in"], 4) if _stats["pixels_in"] else None,
+        "max_edge": settings.IMAGE_MAX_EDGE,
+        "grayscale": settings.IMAGE_GRAYSCALE,
+        "autocrop": settings.IMAGE_AUTOCROP,
+    }
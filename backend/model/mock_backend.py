@@ -0,0 +1,203 @@
+"""
+負荷試験用のローカル Vision バックエンド（VISION_BACKEND=mock）
+
+ネットワーク・API キー・クォータなしで /analyzeReceipt の処理能力・待ち行列・メモリを測るための代替です。
+応答は入力（プロンプトと画像の内容）とシードから決定的に作るので、同じ入力には常に同じ応答を返します。
+- 読取（GeminiReceiptExtraction）: rules.json の品目キーワードから商品名・単価・個数を合成
+- 全体分析（GeminiReceiptResponse）: 上に加えて市場価格・差額・判定・サマリーを合成
+- 商品比較（GeminiItemPricingResponse）: プロンプト末尾の商品一覧に対して比較結果を合成
+MOCK_VISION_CANNED_PATH を指定すると、スキーマ名ごとの応答例（JSON）から入力に応じて1つを選んで返します。
+
+レイテンシは MOCK_VISION_LATENCY_DIST（fixed / uniform / lognormal / exponential）に従って注入し、
+MOCK_VISION_ERROR_RATE の確率で失敗させます。
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from config import settings
+from schemas.rules_engine import get_rules
+from utils.resilience import LatencyWindow
+
+from .image import PreparedImage
+
+_JSON_BLOCK_RE = re.compile(r"```json\s*(.*?)\s*```", re.S)
+# 商品名に付ける内容量（ローカルの単位換算も通るように）
+_SIZES = ["", "", " 1000ml", " 10個入", " 500g", " 1袋", " 2個"]
+# 名寄せできない商品名（モデルへの問い合わせを発生させる）
+_UNKNOWN_NAMES = ["謎のおやつ", "PB商品", "ｾｯﾄ割引品", "季節限定品"]
+
+
+def _judgement(rate: float) -> str:
+    if rate >= 1.05:
+        return "OVERPAY"
+    if rate <= 0.95:
+        return "DEAL"
+    return "FAIR"
+
+
+def _estat(rng: random.Random, paid: float, quantity: float, found: bool) -> dict[str, Any]:
+    if not found:
+        return {"found": False, "stat_price": None, "stat_unit": None, "diff": None, "rate": None,
+                "judgement": "FAIR", "note": "モック: 該当なし"}
+    stat_price = round(paid * quantity * rng.uniform(0.8, 1.25), 1)
+    payment = paid * quantity
+    return {
+        "found": True,
+        "stat_price": stat_price,
+        "stat_unit": rng.choice(["1kg", "100g", "1個", "1パック", "1000ml"]),
+        "diff": round(stat_price - payment, 1),
+        "rate": round(payment / stat_price, 3),
+        "judgement": _judgement(payment / stat_price),
+        "note": "モック応答",
+    }
+
+
+class MockVisionBackend:
+    """決定的な応答と設定可能なレイテンシ分布を持つローカルの代替バックエンド"""
+
+    name = "mock"
+    requires_api_key = False
+
+    def __init__(self) -> None:
+        self._seed = settings.MOCK_VISION_SEED
+        # レイテンシ・エラー注入の乱数（応答の中身とは別系列、シードで再現できる）
+        self._rng = random.Random(self._seed)
+        self._canned: dict[str, list[Any]] = {}
+        if settings.MOCK_VISION_CANNED_PATH:
+            self._canned = json.loads(Path(settings.MOCK_VISION_CANNED_PATH).read_text(encoding="utf-8"))
+        self._cached_contents: dict[str, str] = {}
+        self._latency = LatencyWindow(1024)
+        self._stats = {"requests": 0, "injected_errors": 0, "cached_content_requests": 0, "in_flight": 0}
+
+    def _sample_latency(self) -> float:
+        base = settings.MOCK_VISION_LATENCY_MS / 1000
+        spread = settings.MOCK_VISION_LATENCY_SPREAD
+        dist = settings.MOCK_VISION_LATENCY_DIST.strip().lower()
+        if dist == "uniform":
+            return max(0.0, self._rng.uniform(base * (1 - spread), base * (1 + spread)))
+        if dist == "lognormal":
+            # base は中央値、spread は対数の標準偏差（0.5 で p99 ≒ 中央値の 3.2倍）
+            return base * self._rng.lognormvariate(0.0, spread) if base > 0 else 0.0
+        if dist == "exponential":
+            return self._rng.expovariate(1 / base) if base > 0 else 0.0
+        return base
+
+    def _input_rng(self, schema_name: str, contents: list[str | PreparedImage]) -> random.Random:
+        h = hashlib.sha256(f"{self._seed}|{schema_name}".encode())
+        for c in contents:
+            h.update(c.data if isinstance(c, PreparedImage) else c.encode("utf-8"))
+        return random.Random(int.from_bytes(h.digest()[:8], "big"))
+
+    def _receipt_items(self, rng: random.Random) -> list[dict[str, Any]]:
+        n = max(1, settings.MOCK_VISION_ITEMS + rng.randint(-2, 2))
+        # 品目ルールの再読み込みに追従するよう、毎回現在のルールから選ぶ
+        names = get_rules().item_keywords or ("牛乳",)
+        items = []
+        for _ in range(n):
+            if rng.random() < 0.15:
+                name = rng.choice(_UNKNOWN_NAMES)
+            else:
+                name = rng.choice(names) + rng.choice(_SIZES)
+            items.append({
+                "raw_name": name,
+                "paid_unit_price": float(rng.randrange(80, 1200, 10)),
+                "quantity": float(rng.choice([1, 1, 1, 2, 3])),
+            })
+        return items
+
+    def _synthesize(self, schema_name: str, rng: random.Random, contents: list[str | PreparedImage]) -> Any:
+        header = {
+            "purchase_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "store_name": f"モックストア{rng.randint(1, 50)}号店",
+        }
+        if schema_name == "GeminiReceiptExtraction":
+            return {**header, "items": self._receipt_items(rng)}
+
+        if schema_name == "GeminiReceiptResponse":
+            items = []
+            total = overpaid = saved = 0.0
+            for item in self._receipt_items(rng):
+                estat = _estat(rng, item["paid_unit_price"], item["quantity"], rng.random() < 0.85)
+                items.append({**item, "canonical": item["raw_name"].split(" ")[0] if estat["found"] else None,
+                              "estat": estat})
+                total += item["paid_unit_price"] * item["quantity"]
+                if estat["judgement"] == "OVERPAY":
+                    overpaid += -estat["diff"]
+                elif estat["judgement"] == "DEAL":
+                    saved += estat["diff"]
+            summary = {"total_payment": total, "total_overpaid_amount": round(overpaid, 1),
+                       "total_saved_amount": round(saved, 1)}
+            return {**header, "items": items, "summary": summary}
+
+        if schema_name == "GeminiItemPricingResponse":
+            # 商品一覧はプロンプト末尾の JSON ブロック（ITEM_PRICING_INPUT）
+            texts = [c for c in contents if isinstance(c, str)]
+            blocks = _JSON_BLOCK_RE.findall(texts[-1]) if texts else []
+            requested = json.loads(blocks[-1]) if blocks else []
+            items = []
+            for item in requested:
+                paid = float(item.get("paid_unit_price") or 0.0)
+                quantity = float(item.get("quantity") or 1.0)
+                found = paid > 0 and rng.random() < 0.7
+                items.append({**item, "canonical": item.get("raw_name") if found else None,
+                              "estat": _estat(rng, paid, quantity, found)})
+            return {"items": items}
+
+        raise ValueError(f"モックが対応していないスキーマです: {schema_name}")
+
+    async def generate(
+        self,
+        model: str,
+        contents: list[str | PreparedImage],
+        response_schema: type[BaseModel],
+        cached_content: str | None = None,
+    ) -> str:
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        try:
+            if cached_content is not None:
+                text = self._cached_contents.get(cached_content)
+                if text is None:
+                    raise RuntimeError(f"モック: キャッシュ {cached_content} が見つかりません")
+                self._stats["cached_content_requests"] += 1
+                contents = [text, *contents]
+
+            latency = self._sample_latency()
+            await asyncio.sleep(latency)
+            self._latency.record(latency)
+            if self._rng.random() < settings.MOCK_VISION_ERROR_RATE:
+                self._stats["injected_errors"] += 1
+                raise RuntimeError("モック: 注入されたエラー")
+
+            schema_name = response_schema.__name__
+            rng = self._input_rng(schema_name, contents)
+            canned = self._canned.get(schema_name)
+            data = rng.choice(canned) if canned else self._synthesize(schema_name, rng, contents)
+            # 本物と同じくスキーマで検証してから返す
+            return response_schema.model_validate(data).model_dump_json()
+        finally:
+            self._stats["in_flight"] -= 1
+
+    async def create_cached_content(self, model: str, text: str, ttl: int, display_name: str) -> str:
+        name = f"mockCachedContents/{len(self._cached_contents)}-{display_name}"
+        self._cached_contents[name] = text
+        return name
+
+    async def delete_cached_content(self, name: str) -> None:
+        self._cached_contents.pop(name, None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "latency_dist": settings.MOCK_VISION_LATENCY_DIST,
+            "latency": self._latency.stats(),
+            "cached_contents": len(self._cached_contents),
+            **self._stats,
+        }
@@ -6,6 +6,7 @@ SYSTEM_INSTRUCTION = """
 # Context: 市場平均価格データ (e-Stat基準)
 判定の基準となる価格データは以下の通りです。
 このデータと単位が異なる場合（例: データはkg単位だが、レシートは個数単位）は、あなたの一般的知識を用いて重量を推定し、単位を合わせて比較してください。
+base_price は base_unit（100g・100ml・1個など）あたりの価格です。換算にはこちらを使ってください。
 
 ```json
 {{MARKET_DATA_JSON}}
@@ -47,3 +48,52 @@ SYSTEM_INSTRUCTION = """
 - total_overpaid_amount: OVERPAYの商品で払いすぎた金額の合計（絶対値）
 - total_saved_amount: DEALの商品で節約できた金額の合計（絶対値）
 """
+
+# ローカルで価格比較する場合の読取専用プロンプト（市場データを含めない）
+EXTRACTION_INSTRUCTION = """
+# Role
+あなたは「レシート読取AI」です。
+ユーザーのレシート画像から、購入日・店舗名と商品ごとの支払単価・個数を正確に読み取ってください。
+
+# Instructions
+- raw_name: レシートに記載されたとおりの商品名（名寄せや言い換えはしない）
+- paid_unit_price: 1個あたりの支払単価（値引きがあれば値引き後）。読み取れない場合は null
+- quantity: 個数。記載がなければ 1
+- purchase_date: 購入日（YYYY-MM-DD）
+
+除外対象: 以下の行は絶対に商品として扱わないでください。
+- 日付・時刻（例: "2024年...", "15:30"）
+- 合計、小計、お釣り、消費税、店名、電話番号
+- クレジットカード情報、ポイント情報
+"""
+
+# ローカルで解決できなかった商品だけを比較させるプロンプト（画像は送らない）
+ITEM_PRICING_INSTRUCTION = """
+# Role
+あなたは「高度な家計分析AI」です。
+レシートから読み取った商品（最後の Input）について、提供された「市場平均価格データ」と照らし合わせて価格を比較してください。
+
+# Context: 市場平均価格データ (e-Stat基準)
+このデータと単位が異なる場合（例: データはkg単位だが、レシートは個数単位）は、あなたの一般的知識を用いて重量を推定し、単位を合わせて比較してください。
+base_price は base_unit（100g・100ml・1個など）あたりの価格です。換算にはこちらを使ってください。
+
+```json
+{{MARKET_DATA_JSON}}
+```
+
+# Instructions
+入力と同じ順序・同じ件数で items を返してください（raw_name, paid_unit_price, quantity は入力のまま）。
+1. 名寄せ: 商品名を市場データの品目名に変換して canonical に入れてください。該当がなければ found=false
+2. 重量推定: 市場データが重量単位で商品が個数単位なら、一般的な重量を推測して換算してください
+3. stat_price: 購入数量分の市場適正価格（市場単価 × 推定重量 × 個数）
+4. stat_unit: 比較に使った市場データの単位
+5. note: 推定の根拠を簡潔に
+"""
+
+# ITEM_PRICING_INSTRUCTION の後ろに付ける商品一覧（市場データが同じなら前半部分はキャッシュできるよう、可変部分を最後に置く）
+ITEM_PRICING_INPUT = """
+# Input: 比較対象の商品
+```json
+{{ITEMS_JSON}}
+```
+"""
@@ -0,0 +1,304 @@
+"""
+プロンプト前半部分（指示文 + 市場データ）の作り置きとコンテキストキャッシュ
+
+市場データの一覧はバージョンが変わるまで同じオブジェクトが使われるので、
+(プロンプトの種類, データバージョン, 一覧) ごとに JSON 化・テンプレート埋め込みを1回だけ行い、使い回します。
+
+GEMINI_CONTEXT_CACHE が "gemini" のとき、十分に大きい前半部分は Vision バックエンドのコンテキストキャッシュ
+（Gemini の cached content）に登録し、以降の呼び出しではキャッシュ名と可変部分（画像・商品）だけを送ります。
+"local" はテスト・ベンチマーク用の代替で、登録・再利用・期限切れの流れは同じまま、
+送信時にはキャッシュ名を前半部分の本文に戻します（Gemini 側には何も作りません）。
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from loguru import logger
+
+from config import settings
+
+from .backend import get_vision_backend
+
+# 作り置きしておく前半部分の数（地域・月ごとの一覧 × プロンプトの種類）
+_PREFIX_MEMO_SIZE = 16
+# コンテキストキャッシュの作成に失敗したら、同じ前半部分ではしばらく作り直さない（秒）
+_CREATE_RETRY_INTERVAL = 600.0
+# 期限切れ直前のキャッシュ名は使わない（呼び出し中に切れないように、秒）
+_EXPIRY_MARGIN = 60.0
+
+
+class PromptPrefix:
+    """
+    組み立て済みのプロンプト前半部分
+
+    key は作り置きの識別子（data_version がない1回限りの前半部分では None）。
+    """
+
+    __slots__ = ("kind", "version", "key", "text", "size", "digest", "build_ms", "created_at")
+
+    def __init__(self, kind: str, version: str | None, text: str, build_ms: float) -> None:
+        self.kind = kind
+        self.version = version
+        self.text = text
+        encoded = text.encode("utf-8")
+        self.size = len(encoded)
+        self.digest = hashlib.sha256(encoded).hexdigest()[:16]
+        self.key: tuple[str, str] | None = (kind, self.digest) if version is not None else None
+        self.build_ms = build_ms
+        self.created_at = time.time()
+
+
+class _CachedContent:
+    __slots__ = ("name", "model", "prefix_key", "version", "size", "expires_at", "hits")
+
+    def __init__(self, name: str, model: str, prefix: PromptPrefix, expires_at: float) -> None:
+        self.name = name
+        self.model = model
+        self.prefix_key = prefix.key
+        self.version = prefix.version
+        self.size = prefix.size
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+# (種類, データバージョン, id(一覧)) → (一覧, 前半部分)  一覧そのものを持って id の再利用による取り違えを防ぐ
+_prefixes: OrderedDict[tuple[str, str, int], tuple[list[Any], PromptPrefix]] = OrderedDict()
+# (モデル, 前半部分の key) → 登録済みのコンテキストキャッシュ
+_CacheKey = tuple[str, tuple[str, str]]
+_cached_contents: dict[_CacheKey, _CachedContent] = {}
+_creating: dict[_CacheKey, asyncio.Task[_CachedContent | None]] = {}
+_create_failed_at: dict[_CacheKey, float] = {}
+# "local" の代替で登録した本文（キャッシュ名 → 前半部分）
+_local_store: dict[str, str] = {}
+# 古いキャッシュの削除タスク（完了まで参照を持っておく）
+_background_tasks: set[asyncio.Task[None]] = set()
+
+_stats: dict[str, dict[str, float]] = {}
+_cache_stats: dict[str, int] = {"created": 0, "hits": 0, "failures": 0, "expired": 0, "deleted": 0}
+
+
+def render_prefix(
+    kind: str,
+    template: str,
+    placeholder: str,
+    market_data: list[Any],
+    data_version: str | None,
+    render: Callable[[list[Any]], str],
+) -> tuple[PromptPrefix, bool]:
+    """
+    template の placeholder に render(market_data) を埋め込んだ前半部分を返します。
+
+    data_version を指定すると (種類, バージョン, 一覧) ごとに作り置きを使い回します
+    （市場データキャッシュの一覧そのものを渡すときだけ指定する）。
+    戻り値: (前半部分, 作り置きを使ったか)
+    """
+    if data_version is not None:
+        memo_key = (kind, data_version, id(market_data))
+        entry = _prefixes.get(memo_key)
+        if entry is not None and entry[0] is market_data:
+            _prefixes.move_to_end(memo_key)
+            return entry[1], True
+
+    started = time.perf_counter()
+    text = template.replace(placeholder, render(market_data))
+    prefix = PromptPrefix(kind, data_version, text, (time.perf_counter() - started) * 1000)
+
+    if data_version is not None:
+        _prefixes[memo_key] = (market_data, prefix)
+        while len(_prefixes) > _PREFIX_MEMO_SIZE:
+            _prefixes.popitem(last=False)
+        logger.info(
+            f"プロンプト前半部分を作成しました: {kind} (version={data_version}, "
+            f"{prefix.size}バイト, {prefix.build_ms:.1f}ms)"
+        )
+    return prefix, False
+
+
+def _cache_mode() -> str:
+    mode = settings.GEMINI_CONTEXT_CACHE.strip().lower()
+    return mode if mode in ("gemini", "local") else "off"
+
+
+async def _create_cached_content(key: _CacheKey, prefix: PromptPrefix) -> _CachedContent | None:
+    ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+    model = key[0]
+    try:
+        if _cache_mode() == "gemini":
+            name = await get_vision_backend().create_cached_content(
+                model, prefix.text, ttl, f"{prefix.kind}-{prefix.version}-{prefix.digest}"
+            )
+        else:
+            name = f"local/{prefix.kind}/{prefix.digest}/{int(time.time() * 1000)}"
+            _local_store[name] = prefix.text
+    except Exception as e:
+        _cache_stats["failures"] += 1
+        _create_failed_at[key] = time.time()
+        logger.warning(f"コンテキストキャッシュを作成できませんでした ({prefix.kind}, {prefix.size}バイト): {e}")
+        return None
+
+    entry = _CachedContent(name, model, prefix, time.time() + ttl)
+    _cache_stats["created"] += 1
+    logger.info(f"コンテキストキャッシュを作成しました: {name} ({prefix.kind}, {prefix.size}バイト, ttl={ttl}秒)")
+
+    # 同じ種類の古いバージョンのキャッシュは不要なので消す
+    for old_key, old in list(_cached_contents.items()):
+        if old.model == model and old_key[1][0] == prefix.kind and old.version != prefix.version:
+            _cached_contents.pop(old_key, None)
+            task = asyncio.create_task(_delete_cached_content(old.name))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+    _cached_contents[key] = entry
+    return entry
+
+
+async def _delete_cached_content(name: str) -> None:
+    try:
+        if name.startswith("local/"):
+            _local_store.pop(name, None)
+        else:
+            await get_vision_backend().delete_cached_content(name)
+        _cache_stats["deleted"] += 1
+    except Exception as e:
+        logger.debug(f"コンテキストキャッシュの削除に失敗しました（期限切れで消えます） {name}: {e}")
+
+
+async def cached_content_for(prefix: PromptPrefix, model: str, create: bool = True) -> tuple[str, bool] | None:
+    """
+    前半部分を登録したコンテキストキャッシュの (名前, 登録済みのものを再利用したか) を返します
+    （使わない・使えない場合は None）。
+
+    作り置きの前半部分で GEMINI_CONTEXT_CACHE_MIN_BYTES 以上のものだけを登録します。
+    同時に呼ばれても作成は1回だけ行います。create=False なら登録済みのものだけを使います。
+    再利用の回数は呼び出し1回につき1回だけ数えたいので、ここではなく record_prompt で集計します。
+    """
+    prefix_key = prefix.key
+    if _cache_mode() == "off" or prefix_key is None or prefix.size < settings.GEMINI_CONTEXT_CACHE_MIN_BYTES:
+        return None
+
+    key = (model, prefix_key)
+    entry = _cached_contents.get(key)
+    if entry is not None and entry.expires_at - _EXPIRY_MARGIN <= time.time():
+        _cached_contents.pop(key, None)
+        _local_store.pop(entry.name, None)
+        _cache_stats["expired"] += 1
+        entry = None
+
+    if entry is None:
+        if not create:
+            return None
+        failed_at = _create_failed_at.get(key)
+        if failed_at is not None and time.time() - failed_at < _CREATE_RETRY_INTERVAL:
+            return None
+        task = _creating.get(key)
+        if task is None:
+            task = asyncio.create_task(_create_cached_content(key, prefix))
+            _creating[key] = task
+            task.add_done_callback(lambda _t: _creating.pop(key, None))
+        # shield: 1つのリクエストがキャンセルされても共有中の作成処理は止めない
+        entry = await asyncio.shield(task)
+        if entry is None:
+            return None
+        return entry.name, False
+    return entry.name, True
+
+
+def invalidate_cached_content(name: str) -> None:
+    """Gemini 側で使えなくなったキャッシュ名を忘れます（次の呼び出しで作り直す）。"""
+    for key, entry in list(_cached_contents.items()):
+        if entry.name == name:
+            _cached_contents.pop(key, None)
+    _local_store.pop(name, None)
+
+
+async def prompt_contents(
+    prefix: PromptPrefix,
+    model: str,
+    rest: list[Any],
+    create: bool = True,
+) -> tuple[list[Any], str | None, str | None]:
+    """
+    generate_content に渡す contents と cached_content、再利用した登録済みキャッシュの名前を返します。
+
+    コンテキストキャッシュを使える場合は可変部分（rest）だけを送ります。
+    "local" の代替ではキャッシュ名を本文に戻して送ります。
+    create=False ならキャッシュを新しく作らない（ヘッジ先のモデルなど、待たせたくない呼び出し用）。
+    """
+    found = await cached_content_for(prefix, model, create)
+    if found is None:
+        return [prefix.text, *rest], None, None
+    name, hit = found
+    hit_name = name if hit else None
+    if name.startswith("local/"):
+        return [_local_store.get(name, prefix.text), *rest], None, hit_name
+    return rest, name, hit_name
+
+
+def record_prompt(kind: str, prefix: PromptPrefix | None, reused: bool, build_ms: float,
+                  inline_bytes: int, cached_name: str | None, hit_name: str | None = None) -> None:
+    """
+    1リクエスト分のプロンプトの大きさと組み立て時間を記録します（ヘッジしても1回だけ呼ぶ）。
+
+    inline_bytes: 本文として送ったテキストのバイト数（画像は含まない）
+    hit_name: 再利用した登録済みのコンテキストキャッシュの名前（prompt_contents の3つ目の戻り値）
+    """
+    if hit_name is not None:
+        _cache_stats["hits"] += 1
+        for entry in _cached_contents.values():
+            if entry.name == hit_name:
+                entry.hits += 1
+                break
+    cached_bytes = prefix.size if cached_name is not None and prefix is not None else 0
+    s = _stats.setdefault(kind, {
+        "requests": 0, "prefix_reused": 0, "build_ms_total": 0.0, "build_ms_last": 0.0,
+        "bytes_total": 0, "bytes_last": 0, "cached_bytes_total": 0,
+    })
+    s["requests"] += 1
+    s["prefix_reused"] += 1 if reused else 0
+    s["build_ms_total"] += build_ms
+    s["build_ms_last"] = round(build_ms, 3)
+    s["bytes_total"] += inline_bytes
+    s["bytes_last"] = inline_bytes
+    s["cached_bytes_total"] += cached_bytes
+    logger.info(
+        f"プロンプト ({kind}): 送信 {inline_bytes}バイト"
+        + (f" + キャッシュ済み {cached_bytes}バイト" if cached_bytes else "")
+        + f", 組み立て {build_ms:.2f}ms" + (" (作り置きを使用)" if reused else "")
+    )
+
+
+def get_prompt_stats() -> dict[str, Any]:
+    """
+    プロンプトの大きさ・組み立て時間とコンテキストキャッシュの状態を取得（/health 用）
+    """
+    by_kind: dict[str, Any] = {}
+    for kind, s in _stats.items():
+        n = int(s["requests"])
+        by_kind[kind] = {
+            "requests": n,
+            "prefix_reused": int(s["prefix_reused"]),
+            "avg_bytes": round(s["bytes_total"] / n) if n else None,
+            "last_bytes": int(s["bytes_last"]),
+            "cached_bytes_total": int(s["cached_bytes_total"]),
+            "avg_build_ms": round(s["build_ms_total"] / n, 3) if n else None,
+            "last_build_ms": s["build_ms_last"],
+        }
+    now = time.time()
+    return {
+        "by_kind": by_kind,
+        "prefixes": [
+            {"kind": p.kind, "version": p.version, "bytes": p.size, "build_ms": round(p.build_ms, 3)}
+            for _, p in _prefixes.values()
+        ],
+        "context_cache": {
+            "mode": _cache_mode(),
+            "active": [
+                {"name": c.name, "model": c.model, "version": c.version, "bytes": c.size,
+                 "hits": c.hits, "expires_in": round(c.expires_at - now)}
+                for c in _cached_contents.values()
+            ],
+            **_cache_stats,
+        },
+    }
@@ -0,0 +1,168 @@
+"""
+Gemini 呼び出しの締め切りとヘッジ
+
+1回の呼び出しには GEMINI_DEADLINE 秒の締め切りを設け、超えたら 504 を返します。
+GEMINI_MODEL が直近の所要時間の GEMINI_HEDGE_PERCENTILE パーセンタイルを過ぎても応答しない場合は
+GEMINI_MODEL_FALLBACK にも同じ内容を送り（ヘッジ）、先に成功したほうを使って残りは取り消します。
+GEMINI_MODEL が失敗した場合も、締め切りまでに時間が残っていればすぐにフォールバック先へ送ります。
+"""
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+from loguru import logger
+
+from config import settings
+from utils.resilience import LatencyWindow
+
+T = TypeVar("T")
+
+# (呼び出しの種類, モデル) → 成功した呼び出しの所要時間（取り消された呼び出しはそこまでの経過時間）
+_latencies: dict[tuple[str, str], LatencyWindow] = {}
+_stats: dict[str, dict[str, int]] = {}
+
+
+def _window(kind: str, model: str) -> LatencyWindow:
+    window = _latencies.get((kind, model))
+    if window is None:
+        window = _latencies[(kind, model)] = LatencyWindow()
+    return window
+
+
+def _kind_stats(kind: str) -> dict[str, int]:
+    s = _stats.get(kind)
+    if s is None:
+        s = _stats[kind] = {
+            "calls": 0, "primary_wins": 0, "fallback_wins": 0, "hedged": 0, "failovers": 0,
+            "cancelled": 0, "failures": 0, "deadline_exceeded": 0,
+        }
+    return s
+
+
+def _fallback_model() -> str | None:
+    fallback = settings.GEMINI_MODEL_FALLBACK
+    if not settings.GEMINI_HEDGE_ENABLED or not fallback or fallback == settings.GEMINI_MODEL:
+        return None
+    return fallback
+
+
+def hedge_delay(kind: str) -> float:
+    """
+    ヘッジを送るまでの待ち時間（秒）
+
+    GEMINI_MODEL の成功した呼び出しが GEMINI_HEDGE_MIN_SAMPLES 件たまるまでは GEMINI_HEDGE_INITIAL_DELAY を使います。
+    """
+    window = _window(kind, settings.GEMINI_MODEL)
+    delay = settings.GEMINI_HEDGE_INITIAL_DELAY
+    if len(window) >= settings.GEMINI_HEDGE_MIN_SAMPLES:
+        delay = window.percentile(settings.GEMINI_HEDGE_PERCENTILE) or delay
+    return max(settings.GEMINI_HEDGE_MIN_DELAY, delay)
+
+
+async def call_with_hedging(kind: str, call: Callable[[str], Awaitable[T]]) -> T:
+    """
+    call(モデル名) を締め切りとヘッジ付きで実行し、先に成功した結果を返します。
+
+    両方とも失敗した場合は最後の例外を、締め切りを過ぎた場合は 504 の HTTPException を送出します。
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + settings.GEMINI_DEADLINE
+    primary = settings.GEMINI_MODEL
+    fallback = _fallback_model()
+    hedge_at = started + hedge_delay(kind) if fallback else None
+    stats = _kind_stats(kind)
+    stats["calls"] += 1
+
+    async def timed(model: str) -> T:
+        t0 = loop.time()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            # ヘッジに負けて取り消された呼び出しは最も遅い部類なので、経過時間を下限として記録する
+            # （成功した呼び出しだけを記録すると、パーセンタイルが下がり続けてヘッジが増えていく）
+            _window(kind, model).record(loop.time() - t0)
+            raise
+        _window(kind, model).record(loop.time() - t0)
+        return result
+
+    tasks: dict[asyncio.Task[T], str] = {}
+
+    def launch(model: str) -> None:
+        tasks[asyncio.create_task(timed(model))] = model
+
+    launch(primary)
+    fallback_started = False
+    last_error: BaseException | None = None
+    try:
+        while tasks:
+            now = loop.time()
+            if now >= deadline:
+                break
+            wake_at = deadline
+            if fallback and not fallback_started and hedge_at is not None:
+                wake_at = min(wake_at, hedge_at)
+            done, _ = await asyncio.wait(
+                tasks, timeout=max(0.0, wake_at - now), return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not done:
+                if fallback and not fallback_started and hedge_at is not None and loop.time() >= hedge_at:
+                    logger.info(
+                        f"{primary} の応答が {hedge_at - started:.1f}秒を過ぎたため {fallback} にも送ります ({kind})"
+                    )
+                    stats["hedged"] += 1
+                    fallback_started = True
+                    launch(fallback)
+                continue
+
+            for task in done:
+                model = tasks.pop(task)
+                error = task.exception()
+                if error is None:
+                    winner = "primary" if model == primary else "fallback"
+                    stats[f"{winner}_wins"] += 1
+                    if tasks:
+                        stats["cancelled"] += len(tasks)
+                    logger.info(
+                        f"Gemini 呼び出し ({kind}): {model} が応答しました ({loop.time() - started:.2f}秒, {winner})"
+                    )
+                    return task.result()
+
+                last_error = error
+                stats["failures"] += 1
+                logger.warning(f"Gemini 呼び出しに失敗しました ({kind}, {model}): {error}")
+                if model == primary and fallback and not fallback_started and loop.time() < deadline:
+                    stats["failovers"] += 1
+                    fallback_started = True
+                    launch(fallback)
+
+        if tasks:
+            stats["deadline_exceeded"] += 1
+            logger.error(f"Gemini の応答が締め切り（{settings.GEMINI_DEADLINE:.0f}秒）までに返りませんでした ({kind})")
+            raise HTTPException(status_code=504, detail="AIの応答が時間内に返りませんでした。")
+        assert last_error is not None
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        # 取り消した呼び出しの終了（timed での所要時間の記録）を待ち、例外も回収しておく
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_model_call_stats() -> dict[str, Any]:
+    """
+    Gemini 呼び出しの勝ち負け・ヘッジ回数と所要時間を取得（/health 用）
+    """
+    return {
+        "primary": settings.GEMINI_MODEL,
+        "fallback": _fallback_model(),
+        "deadline": settings.GEMINI_DEADLINE,
+        "by_kind": {
+            kind: {**s, "hedge_delay": round(hedge_delay(kind), 3) if _fallback_model() else None}
+            for kind, s in _stats.items()
+        },
+        "latency": {f"{kind}:{model}": w.stats() for (kind, model), w in _latencies.items()},
+    }
@@ -1,9 +1,11 @@
-from .estat import EStatClient
+from .estat import EStatClient, EStatUnavailableError
 from .parser import (
     classify_to_code,
     fold_key,
+    fuzzy_candidates,
     guess_canonical,
     is_excluded_name,
+    normalize_many,
     normalize_text,
     parse_receipt_text,
     resolve_area_code,
@@ -18,7 +20,10 @@ from .schemas import (
     AnalyzeResponse,
     CanonicalResolution,
     GeminiEstatResult,
+    GeminiExtractedItem,
+    GeminiItemPricingResponse,
     GeminiItemResult,
+    GeminiReceiptExtraction,
     GeminiReceiptResponse,
     GeminiSummary,
     Profile,
@@ -27,12 +32,16 @@ from .schemas import (
     RankingResponse,
     Receipt,
     ReceiptCreate,
+    ReceiptTextBatchRequest,
+    ReceiptTextRequest,
     ReceiptUpdate,
 )
 
 __all__ = [
     "EStatClient",
+    "EStatUnavailableError",
     "normalize_text",
+    "normalize_many",
     "simplify_key",
     "fold_key",
     "guess_canonical",
@@ -45,6 +54,7 @@ __all__ = [
     "suggest_meta_candidates",
     "is_excluded_name",
     "search_class_names",
+    "fuzzy_candidates",
     "AnalyzeResponse",
     "CanonicalResolution",
     "Profile",
@@ -53,9 +63,14 @@ __all__ = [
     "RankingResponse",
     "Receipt",
     "ReceiptCreate",
+    "ReceiptTextRequest",
+    "ReceiptTextBatchRequest",
     "ReceiptUpdate",
     "GeminiEstatResult",
     "GeminiReceiptResponse",
     "GeminiItemResult",
     "GeminiSummary",
+    "GeminiExtractedItem",
+    "GeminiReceiptExtraction",
+    "GeminiItemPricingResponse",
 ]
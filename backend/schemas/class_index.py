@@ -0,0 +1,98 @@
+"""
+e-Stat 分類マップの名前検索用 n-gram 転置索引
+
+分類名（生の名前と simplify_key 済みの名前）ごとに 1文字・2文字の n-gram から
+名前の位置へのポスティングリストを作っておき、部分一致検索では
+クエリ中で最も出現の少ない n-gram のリストだけを確認します。
+結果は常に分類マップの並び順（位置の昇順）で返します。
+"""
+import sys
+from collections.abc import Iterator, Sequence
+
+from .fuzzy import FuzzyIndex
+
+
+def _grams(s: str) -> set[str]:
+    """文字列に含まれる 1文字・2文字の n-gram の集合"""
+    out = set(s)
+    out.update(s[i:i + 2] for i in range(len(s) - 1))
+    return out
+
+
+def _build_postings(strings: tuple[str, ...]) -> dict[str, list[int]]:
+    postings: dict[str, list[int]] = {}
+    for i, s in enumerate(strings):
+        for g in _grams(s):
+            postings.setdefault(g, []).append(i)
+    return postings
+
+
+def _find(strings: tuple[str, ...], postings: dict[str, list[int]], q: str) -> Iterator[int]:
+    """q を部分文字列として含む位置を昇順に返します（空文字は全件に一致）。"""
+    if not q:
+        yield from range(len(strings))
+        return
+
+    # 2文字以上なら bigram、1文字なら unigram のうち最も短いポスティングリストを候補にする
+    keys = [q[i:i + 2] for i in range(len(q) - 1)] if len(q) >= 2 else [q]
+    candidates: list[int] | None = None
+    for k in keys:
+        lst = postings.get(k)
+        if lst is None:
+            return
+        if candidates is None or len(lst) < len(candidates):
+            candidates = lst
+
+    assert candidates is not None
+    for i in candidates:
+        if q in strings[i]:
+            yield i
+
+
+class ClassNameIndex:
+    """
+    1つの分類マップの名前検索用索引
+
+    names / codes / simple（各名前の simplify_key）は分類マップと同じ順序です。
+    あいまい検索用の索引（fuzzy）は parser.class_fuzzy_index が作って持たせます。
+    """
+
+    __slots__ = ("names", "codes", "simple", "fuzzy", "_raw_postings", "_simple_postings")
+
+    def __init__(
+        self,
+        names: tuple[str, ...],
+        codes: tuple[str, ...],
+        simple: Sequence[str],
+    ) -> None:
+        self.names = names
+        self.codes = codes
+        self.simple = tuple(sys.intern(s) for s in simple)
+        self._raw_postings = _build_postings(names)
+        self._simple_postings = _build_postings(self.simple)
+        self.fuzzy: FuzzyIndex | None = None
+
+    def find_raw(self, q: str) -> Iterator[int]:
+        """生の名前に q を含む位置を昇順に返します。"""
+        return _find(self.names, self._raw_postings, q)
+
+    def find_simple(self, q: str) -> Iterator[int]:
+        """simplify_key 済みの名前に q（simplify_key 済み）を含む位置を昇順に返します。"""
+        return _find(self.simple, self._simple_postings, q)
+
+    def first_raw(self, q: str) -> int | None:
+        return next(self.find_raw(q), None)
+
+    def first_simple(self, q: str) -> int | None:
+        return next(self.find_simple(q), None)
+
+    def approx_size(self) -> int:
+        """おおよそのメモリ使用量（バイト）を返します（names / codes は分類マップ側で計上）。"""
+        size = sys.getsizeof(self.simple)
+        size += sum(sys.getsizeof(s) for s, n in zip(self.simple, self.names) if s is not n)
+        for postings in (self._raw_postings, self._simple_postings):
+            size += sys.getsizeof(postings)
+            size += sum(sys.getsizeof(g) + sys.getsizeof(lst) for g, lst in postings.items())
+        if self.fuzzy is not None:
+            size += self.fuzzy.approx_size()
+        return size
@@ -0,0 +1,171 @@
+"""
+e-Stat の分類マップ（品目名 → 分類コード）をコンパクトに保持するためのクラス群
+
+getMetaInfo の生JSONは数MBになることがあるため、必要な「名前とコードの配列」だけを
+インターン済み文字列のタプルとして保持し、メモリ予算付きのLRUで管理します。
+"""
+import sys
+from collections import OrderedDict
+from collections.abc import ItemsView, Iterator, Mapping, ValuesView
+from typing import Any
+
+from .class_index import ClassNameIndex
+
+
+class ClassMap(Mapping[str, str]):
+    """
+    1つの分類（cat01, area など）の 名前 → コード 対応表
+
+    名前とコードは同じ順序のタプルで保持し、名前引き用の索引は初回参照時に作ります。
+    items() での走査は索引を作らずにタプルをそのまま使います。
+    部分一致検索用の索引（search_index）は parser.class_name_index が作って持たせます。
+    """
+
+    __slots__ = ("names", "codes", "_index", "search_index")
+
+    def __init__(self, names: tuple[str, ...], codes: tuple[str, ...]) -> None:
+        self.names = names
+        self.codes = codes
+        self._index: dict[str, int] | None = None
+        self.search_index: ClassNameIndex | None = None
+
+    @classmethod
+    def from_pairs(cls, pairs: list[tuple[str, str]]) -> "ClassMap":
+        # 同名の分類は後勝ち（dict に詰めていた従来の挙動と同じ）
+        merged: dict[str, str] = {}
+        for name, code in pairs:
+            merged[sys.intern(name)] = sys.intern(code)
+        return cls(tuple(merged.keys()), tuple(merged.values()))
+
+    def _lookup(self) -> dict[str, int]:
+        if self._index is None:
+            self._index = {name: i for i, name in enumerate(self.names)}
+        return self._index
+
+    def __getitem__(self, name: str) -> str:
+        return self.codes[self._lookup()[name]]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._lookup()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def items(self) -> ItemsView[str, str]:
+        return _ClassMapItems(self)
+
+    def values(self) -> ValuesView[str]:
+        return _ClassMapValues(self)
+
+    def approx_size(self) -> int:
+        """おおよそのメモリ使用量（バイト）を返します。"""
+        size = sys.getsizeof(self.names) + sys.getsizeof(self.codes)
+        size += sum(sys.getsizeof(s) for s in self.names)
+        size += sum(sys.getsizeof(s) for s in self.codes)
+        if self._index is not None:
+            size += sys.getsizeof(self._index)
+        if self.search_index is not None:
+            size += self.search_index.approx_size()
+        return size
+
+
+class _ClassMapItems(ItemsView[str, str]):
+    # 索引を作らずにタプルを並べて走査する
+    _mapping: ClassMap
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        return zip(self._mapping.names, self._mapping.codes)
+
+
+class _ClassMapValues(ValuesView[str]):
+    _mapping: ClassMap
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._mapping.codes)
+
+
+class CompactClassMaps(Mapping[str, ClassMap]):
+    """統計表1つ分の分類マップ（分類ID → ClassMap）"""
+
+    __slots__ = ("_maps", "__weakref__")
+
+    def __init__(self, maps: dict[str, ClassMap]) -> None:
+        self._maps = maps
+
+    def __getitem__(self, obj_id: str) -> ClassMap:
+        return self._maps[obj_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._maps)
+
+    def __len__(self) -> int:
+        return len(self._maps)
+
+    def approx_size(self) -> int:
+        return sys.getsizeof(self._maps) + sum(m.approx_size() for m in self._maps.values())
+
+    def to_payload(self) -> dict[str, dict[str, list[str]]]:
+        """ディスク保存用の dict（分類ID → {names, codes}）に変換します。"""
+        return {
+            obj_id: {"names": list(m.names), "codes": list(m.codes)}
+            for obj_id, m in self._maps.items()
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "CompactClassMaps":
+        maps: dict[str, ClassMap] = {}
+        for obj_id, entry in payload.items():
+            names = entry.get("names") if isinstance(entry, dict) else None
+            codes = entry.get("codes") if isinstance(entry, dict) else None
+            if not isinstance(names, list) or not isinstance(codes, list) or len(names) != len(codes):
+                raise ValueError(f"分類マップの形式が不正です: {obj_id}")
+            maps[sys.intern(str(obj_id))] = ClassMap.from_pairs(
+                [(str(n), str(c)) for n, c in zip(names, codes)]
+            )
+        return cls(maps)
+
+
+class ClassMapLRU:
+    """
+    statsDataId → CompactClassMaps のLRUキャッシュ
+
+    合計サイズが budget_bytes を超えたら古いものから捨てます（直近の1件は常に残す）。
+    """
+
+    def __init__(self, budget_bytes: int) -> None:
+        self._budget = budget_bytes
+        self._entries: OrderedDict[str, tuple[CompactClassMaps, int]] = OrderedDict()
+        self._total = 0
+        self._evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> CompactClassMaps | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, maps: CompactClassMaps) -> None:
+        if key in self._entries:
+            self._total -= self._entries.pop(key)[1]
+        size = maps.approx_size()
+        self._entries[key] = (maps, size)
+        self._total += size
+        while self._total > self._budget and len(self._entries) > 1:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._total -= evicted_size
+            self._evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "approx_bytes": self._total,
+            "budget_bytes": self._budget,
+            "evictions": self._evictions,
+        }
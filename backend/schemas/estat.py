@@ -1,16 +1,42 @@
 import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections.abc import AsyncIterator, Mapping
+from typing import Any
 
 import httpx
 from config import settings
 from fastapi import HTTPException
+from loguru import logger
 from rules import CLASS_SEARCH_ORDER
+from utils.files import write_json_atomic
+from utils.resilience import AdaptiveLimiter, CircuitBreaker, backoff_delay, parse_retry_after
 
-from .parser import simplify_key
+from .class_map import ClassMap, ClassMapLRU, CompactClassMaps
+from .parser import class_fuzzy_index, class_name_index, simplify_key
 
 # e-Stat APIレスポンス用の型エイリアス
 type JsonValue = str | int | float | bool | None | dict[str, "JsonValue"] | list["JsonValue"]
 type JsonDict = dict[str, JsonValue]
 
+# 小売物価統計の統計表を探す検索語と、正しい統計表なら必ず含まれる代表品目
+STATS_SEARCH_WORD = "小売物価統計調査 動向編 全国"
+TABLE_MUST_HAVE_ITEMS = ["鶏卵", "卵", "食パン", "牛乳"]
+
+# 統計表IDと分類マップのディスクキャッシュの形式バージョン
+META_CACHE_FORMAT_VERSION = 2
+
+# 再試行の対象とするHTTPステータス（レート制限・一時的なサーバーエラー）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# bulk取得時に1リクエストで指定する分類コード数の上限（e-Stat APIの絞り込み条件の上限）
+ESTAT_BULK_CODES_PER_REQUEST = 100
+# bulk取得時の1ページあたりの取得件数
+ESTAT_BULK_PAGE_SIZE = 10000
+
 ESTAT_TABLE_SCORE_WEIGHTS = [
     ("全国統一", 5),
     ("月別", 3),
@@ -32,6 +58,13 @@ def _calculate_stats_table_score(table_info: JsonDict) -> int:
     return score
 
 
+class EStatUnavailableError(HTTPException):
+    """サーキットブレーカーが開いており、e-Stat API を呼び出さなかったことを示す例外"""
+
+    def __init__(self, detail: str) -> None:
+        super().__init__(status_code=503, detail=detail)
+
+
 class EStatClient:
     """
     EStatClient の Docstring
@@ -39,8 +72,73 @@ class EStatClient:
     def __init__(self) -> None:
         # モジュールレベルからインスタンスレベルへ移動したキャッシュ
         self._stats_data_id_cache: str | None = None
-        self._meta_cache: dict[str, JsonDict] = {}
-        self._class_map_cache: dict[str, dict[str, dict[str, str]]] = {}
+        # getMetaInfo の生JSONは保持せず、抽出した分類マップだけをメモリ予算付きLRUで保持する
+        self._class_map_cache = ClassMapLRU(settings.ESTAT_CLASS_MAP_CACHE_BUDGET_BYTES)
+        self._persisted_meta_checked = False
+        # 全リクエストで共有する接続プール付きHTTPクライアント（keep-alive で再接続を避ける）
+        self._http: httpx.AsyncClient | None = None
+        # e-Stat の応答速度に合わせて同時実行数を調整し、障害時は呼び出しを遮断する
+        self._limiter = AdaptiveLimiter(
+            initial=settings.ESTAT_CONCURRENCY_INITIAL,
+            min_limit=settings.ESTAT_CONCURRENCY_MIN,
+            max_limit=settings.ESTAT_CONCURRENCY_MAX,
+            latency_target=settings.ESTAT_LATENCY_TARGET,
+        )
+        self._breaker = CircuitBreaker(
+            failure_threshold=settings.ESTAT_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.ESTAT_CIRCUIT_RESET_TIMEOUT,
+        )
+        self._http_stats: dict[str, int] = {
+            "requests": 0,
+            "connections_opened": 0,
+            "tls_handshakes": 0,
+        }
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        http2 = settings.ESTAT_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            # HTTP/2 には追加パッケージ（httpx[http2]）が必要
+            logger.warning("h2 がインストールされていないため、e-Stat への接続は HTTP/1.1 を使用します")
+            http2 = False
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout=90.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.ESTAT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ESTAT_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.ESTAT_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+        )
+
+    async def open(self) -> None:
+        """HTTPクライアントを作成します（アプリ起動時に呼び出す）。"""
+        if self._http is None or self._http.is_closed:
+            self._http = self._build_http_client()
+
+    async def aclose(self) -> None:
+        """HTTPクライアントを閉じ、プール中の接続を解放します（アプリ終了時に呼び出す）。"""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    def _client(self) -> httpx.AsyncClient:
+        # open() が呼ばれていない場合（スクリプトからの利用など）は初回利用時に作成する
+        if self._http is None or self._http.is_closed:
+            self._http = self._build_http_client()
+        return self._http
+
+    async def _trace(self, event_name: str, info: dict[str, Any]) -> None:
+        # httpcore のトレースイベントから新規接続数を数え、接続の再利用状況を把握する
+        if event_name == "connection.connect_tcp.complete":
+            self._http_stats["connections_opened"] += 1
+        elif event_name == "connection.start_tls.complete":
+            self._http_stats["tls_handshakes"] += 1
+
+    def get_http_stats(self) -> dict[str, int]:
+        """リクエスト数・新規接続数・接続を再利用したリクエスト数を返します。"""
+        stats = dict(self._http_stats)
+        stats["reused_connections"] = max(0, stats["requests"] - stats["connections_opened"])
+        return stats
 
     async def _get(self, path: str, params: dict[str, str | int]) -> JsonDict:
         if not settings.ESTAT_APP_ID:
@@ -49,40 +147,76 @@ class EStatClient:
         url = f"{settings.ESTAT_BASE_URL}/{path}"
         full_params: dict[str, str | int] = {"appId": settings.ESTAT_APP_ID, **params}
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(timeout=90.0, connect=5.0)) as client:
-            last_err: Exception | None = None
-            for i in range(3):
-                try:
-                    r = await client.get(url, params=full_params)
-                    r.raise_for_status()
+        client = self._client()
+        last_err: Exception | None = None
+        for i in range(settings.ESTAT_MAX_RETRIES):
+            # e-Stat が落ちている間は呼び出さずに即座に失敗させる（キャッシュにフォールバックさせる）
+            probe = self._breaker.state == "half_open"
+            if not self._breaker.allow():
+                raise EStatUnavailableError(
+                    detail=f"e-Stat API が不安定なため呼び出しを停止しています: {last_err or self._breaker.state}"
+                )
+
+            retry_after: float | None = None
+            try:
+                async with self._limiter.slot() as outcome:
                     try:
-                        result: JsonDict = r.json()
-                        return result
-                    except ValueError as e:
-                        raise HTTPException(
-                            status_code=502,
-                            detail=f"e-Stat APIからのレスポンスがJSON形式ではありません: {str(e)} from e"
-                        )from e
-
-                except httpx.RequestError as e:
-                    last_err = e
-                    await asyncio.sleep(1.0 * (i + 1))
-                except httpx.HTTPStatusError as e:
-                    raise HTTPException(status_code=502, detail=f"e-Stat API HTTP error: {e}") from e
-
-            raise HTTPException(
-                status_code=504,
-                detail=f"e-Stat API 接続エラー(リトライ上限超過): {last_err}"
-            ) from last_err
+                        self._http_stats["requests"] += 1
+                        r = await client.get(url, params=full_params, extensions={"trace": self._trace})
+                        r.raise_for_status()
+                    except httpx.RequestError as e:
+                        outcome["ok"] = False
+                        self._breaker.record_failure()
+                        last_err = e
+                    except httpx.HTTPStatusError as e:
+                        if e.response.status_code not in RETRYABLE_STATUS_CODES:
+                            # リクエスト内容の誤りなど、再試行しても結果が変わらないエラー
+                            self._breaker.record_success()
+                            raise HTTPException(status_code=502, detail=f"e-Stat API HTTP error: {e}") from e
+                        outcome["ok"] = False
+                        self._breaker.record_failure()
+                        last_err = e
+                        retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                    else:
+                        self._breaker.record_success()
+                        try:
+                            result: JsonDict = r.json()
+                            return result
+                        except ValueError as e:
+                            raise HTTPException(
+                                status_code=502,
+                                detail=f"e-Stat APIからのレスポンスがJSON形式ではありません: {str(e)} from e"
+                            )from e
+            except BaseException:
+                if probe:
+                    # 枠待ち・通信中にキャンセルされた試行は成否が記録されないので、試行枠を返す
+                    self._breaker.release_probe()
+                raise
+
+            if i + 1 >= settings.ESTAT_MAX_RETRIES:
+                break
+            delay = backoff_delay(i, settings.ESTAT_RETRY_BASE_DELAY, settings.ESTAT_RETRY_MAX_DELAY)
+            if retry_after is not None:
+                if retry_after > settings.ESTAT_RETRY_MAX_DELAY:
+                    # 長時間待つより、キャッシュにフォールバックさせる
+                    break
+                delay = max(delay, retry_after)
+            await asyncio.sleep(delay)
+
+        raise HTTPException(
+            status_code=504,
+            detail=f"e-Stat API 接続エラー(リトライ上限超過): {last_err}"
+        ) from last_err
+
+    def get_resilience_stats(self) -> dict[str, Any]:
+        """同時実行数の上限とサーキットブレーカーの状態を返します。"""
+        return {"limiter": self._limiter.stats(), "circuit": self._breaker.stats()}
 
     async def get_meta(self, statsDataId: str) -> JsonDict:
-        if statsDataId in self._meta_cache:
-            return self._meta_cache[statsDataId]
-        meta = await self._get("getMetaInfo", {"statsDataId": statsDataId})
-        self._meta_cache[statsDataId] = meta
-        return meta
+        # 生JSONはキャッシュしない（必要なのは get_class_maps で抽出した分類マップのみ）
+        return await self._get("getMetaInfo", {"statsDataId": statsDataId})
 
-    def extract_class_maps(self, meta_json: JsonDict) -> dict[str, dict[str, str]]:
+    def extract_class_maps(self, meta_json: JsonDict) -> CompactClassMaps:
         try:
             get_meta_info = meta_json.get("GET_META_INFO")
             if not isinstance(get_meta_info, dict):
@@ -99,7 +233,7 @@ class EStatClient:
             if not isinstance(class_objs_raw, list):
                 class_objs_raw = []
 
-            out: dict[str, dict[str, str]] = {}
+            out: dict[str, ClassMap] = {}
             for obj in class_objs_raw:
                 if not isinstance(obj, dict):
                     continue
@@ -113,50 +247,137 @@ class EStatClient:
                 else:
                     classes = []
 
-                m: dict[str, str] = {}
+                pairs: list[tuple[str, str]] = []
                 for c in classes:
                     code = str(c.get("@code", ""))
                     name = str(c.get("@name", ""))
                     if code and name:
-                        m[name] = code
+                        pairs.append((name, code))
 
                 if obj_id:
-                    out[obj_id] = m
-            return out
+                    out[sys.intern(obj_id)] = ClassMap.from_pairs(pairs)
+            return CompactClassMaps(out)
         except (AttributeError, KeyError) as e:
             raise ValueError(f"e-Statメタデータの解析に失敗しました(構造が不正です): {e}") from e
 
-    async def get_class_maps(self, statsDataId: str) -> dict[str, dict[str, str]]:
-        if statsDataId in self._class_map_cache:
-            return self._class_map_cache[statsDataId]
+    async def get_class_maps(self, statsDataId: str) -> CompactClassMaps:
+        cached = self._class_map_cache.get(statsDataId)
+        if cached is not None:
+            return cached
         meta = await self.get_meta(statsDataId)
         try:
-            maps = self.extract_class_maps(meta)
-            self._class_map_cache[statsDataId] = maps
+            maps = self._index_class_maps(self.extract_class_maps(meta))
+            self._class_map_cache.put(statsDataId, maps)
             return maps
         except ValueError as e:
             raise HTTPException(status_code=502, detail=str(e))from e
 
-    def _table_has_any_item(self, class_maps: dict[str, dict[str, str]], keywords: list[str]) -> bool:
+    def get_class_map_cache_stats(self) -> dict[str, int]:
+        """分類マップキャッシュの件数・推定サイズ・追い出し回数を返します。"""
+        return self._class_map_cache.stats()
+
+    def _table_has_any_item(self, class_maps: Mapping[str, Mapping[str, str]], keywords: list[str]) -> bool:
         # e-Statの分類ID（背番号）の意味：
         # - cat01: 品目名 (例: 卵、牛乳)
         # - cat02: 規格の詳細 (例: 10個入り、1L)
         # - cat03: その他の分類
         # - tab  : 統計の種類 (例: 小売価格)
+        keys = [simplify_key(kw) for kw in keywords]
         for obj_id in CLASS_SEARCH_ORDER:
-            mp = class_maps.get(obj_id, {})
-            for name in mp.keys():
-                nn = simplify_key(name)
-                for kw in keywords:
-                    if simplify_key(kw) in nn:
-                        return True
+            mp = class_maps.get(obj_id)
+            if not mp:
+                continue
+            idx = class_name_index(mp)
+            if any(idx.first_simple(k) is not None for k in keys):
+                return True
         return False
 
+    def _index_class_maps(self, class_maps: CompactClassMaps) -> CompactClassMaps:
+        # 名前検索・あいまい検索用の索引は読込時に1度だけ作る（LRU のサイズ計算にも含める）
+        for obj_id in CLASS_SEARCH_ORDER:
+            mp = class_maps.get(obj_id)
+            if mp:
+                class_fuzzy_index(mp)
+        return class_maps
+
+    def _load_persisted_meta(self) -> bool:
+        """
+        ディスクに保存した statsDataId と分類マップを読み込みます。
+
+        接続先・検索条件が同じで、保存から ESTAT_META_CACHE_MAX_AGE 秒以内、
+        かつ分類マップに代表品目が含まれている場合のみ有効とみなします。
+        """
+        self._persisted_meta_checked = True
+        path = settings.ESTAT_META_CACHE_PATH
+        if not path or not os.path.isfile(path):
+            return False
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"e-Statメタデータキャッシュの読込に失敗しました: {e}")
+            return False
+
+        if (
+            not isinstance(payload, dict)
+            or payload.get("format_version") != META_CACHE_FORMAT_VERSION
+            or payload.get("base_url") != settings.ESTAT_BASE_URL
+            or payload.get("search_word") != STATS_SEARCH_WORD
+        ):
+            return False
+        saved_at = payload.get("saved_at")
+        if not isinstance(saved_at, (int, float)) or time.time() - saved_at > settings.ESTAT_META_CACHE_MAX_AGE:
+            return False
+
+        sid = payload.get("stats_data_id")
+        class_maps = payload.get("class_maps")
+        if not isinstance(sid, str) or not sid or not isinstance(class_maps, dict):
+            return False
+        try:
+            cm = self._index_class_maps(CompactClassMaps.from_payload(class_maps))
+        except (AttributeError, TypeError, ValueError):
+            return False
+        if not self._table_has_any_item(cm, TABLE_MUST_HAVE_ITEMS):
+            return False
+
+        self._stats_data_id_cache = sid
+        self._class_map_cache.put(sid, cm)
+        logger.info(f"e-Statメタデータをキャッシュから復元しました: statsDataId={sid}")
+        return True
+
+    def _persist_meta(self, sid: str, class_maps: CompactClassMaps) -> None:
+        """選ばれた statsDataId と分類マップをディスクに保存します。"""
+        if not settings.ESTAT_META_CACHE_PATH:
+            return
+        payload = {
+            "format_version": META_CACHE_FORMAT_VERSION,
+            "base_url": settings.ESTAT_BASE_URL,
+            "search_word": STATS_SEARCH_WORD,
+            "saved_at": time.time(),
+            "stats_data_id": sid,
+            "class_maps": class_maps.to_payload(),
+        }
+        try:
+            write_json_atomic(settings.ESTAT_META_CACHE_PATH, payload)
+        except OSError as e:
+            logger.warning(f"e-Statメタデータキャッシュの保存に失敗しました: {e}")
+
+    async def _probe_table(self, sid: str) -> tuple[CompactClassMaps, bool]:
+        """候補の統計表のメタ情報を取得し、代表品目を含むかどうかを判定します。"""
+        meta = await self.get_meta(sid)
+        cm = self.extract_class_maps(meta)
+        return cm, self._table_has_any_item(cm, TABLE_MUST_HAVE_ITEMS)
+
     async def pick_stats_data_id(self) -> str:
         if self._stats_data_id_cache:
             return self._stats_data_id_cache
 
-        data = await self._get("getStatsList", {"searchWord": "小売物価統計調査 動向編 全国", "limit": 80})
+        # 再起動時はディスクのキャッシュを使い、統計表の探索を丸ごと省く
+        if not self._persisted_meta_checked and await asyncio.to_thread(self._load_persisted_meta):
+            assert self._stats_data_id_cache is not None
+            return self._stats_data_id_cache
+
+        data = await self._get("getStatsList", {"searchWord": STATS_SEARCH_WORD, "limit": 80})
         try:
             stats_list = data.get("GET_STATS_LIST")
             if not isinstance(stats_list, dict):
@@ -179,22 +400,29 @@ class EStatClient:
         # 独立させたスコア計算関数を使用して並び替え
         table_list: list[JsonDict] = [t for t in lst if isinstance(t, dict)]
         ranked = sorted(table_list, key=_calculate_stats_table_score, reverse=True)[:25]
-        must_like = ["鶏卵", "卵", "食パン", "牛乳"]
+        sids = [sid for t in ranked if (sid := str(t.get("@id") or t.get("ID", "")))]
 
-        for t in ranked:
-            sid = str(t.get("@id") or t.get("ID", ""))
-            if not sid:
-                continue
-            try:
-                meta = await self.get_meta(sid)
-                cm = self.extract_class_maps(meta)
-                if self._table_has_any_item(cm, must_like):
+        # 候補を並行して調べる（同時実行数は _limiter が制御）。
+        # スコア順に結果を確認し、一致した時点でそれより下位の候補の取得をキャンセルする
+        tasks = [asyncio.create_task(self._probe_table(sid)) for sid in sids]
+        try:
+            for i, (sid, task) in enumerate(zip(sids, tasks)):
+                try:
+                    cm, matched = await task
+                except (HTTPException, ValueError):
+                    continue
+                if matched:
+                    for rest in tasks[i + 1:]:
+                        rest.cancel()
                     self._stats_data_id_cache = sid
-                    self._meta_cache[sid] = meta
-                    self._class_map_cache[sid] = cm
+                    self._class_map_cache.put(sid, self._index_class_maps(cm))
+                    await asyncio.to_thread(self._persist_meta, sid, cm)
                     return sid
-            except (HTTPException, ValueError):
-                continue
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         # fallback
         best = ranked[0]
@@ -204,45 +432,41 @@ class EStatClient:
         self._stats_data_id_cache = sid
         return sid
 
-    async def lookup_stat_price(
-        self,
-        statsDataId: str,
-        cdTime: str | None,
-        cdArea: str | None,
-        class_key: str,
-        class_code: str,
-    ) -> tuple[float | None, str | None, str | None]:
-        params: dict[str, str | int] = {"statsDataId": statsDataId, "limit": 1}
-        if cdTime:
-            params["cdTime"] = cdTime
-        if cdArea:
-            params["cdArea"] = cdArea
-
+    @staticmethod
+    def _class_param_name(class_key: str) -> str:
+        """分類ID（cat01, tab など）を getStatsData の絞り込みパラメータ名に変換します。"""
         if class_key == "cat01":
-            params["cdCat01"] = class_code
-        elif class_key == "tab":
-            params["cdTab"] = class_code
-        else:
-            params[f"cd{class_key[0].upper()}{class_key[1:]}"] = class_code
-
-        data = await self._get("getStatsData", params)
-
+            return "cdCat01"
+        if class_key == "tab":
+            return "cdTab"
+        return f"cd{class_key[0].upper()}{class_key[1:]}"
+
+    @staticmethod
+    def _extract_values(data: JsonDict) -> tuple[list[JsonDict], str | None, str | None]:
+        """
+        getStatsData のレスポンスから VALUE 配列と NEXT_KEY を取り出します。
+
+        戻り値: (values, next_key, error)
+        """
         try:
             get_stats_data = data.get("GET_STATS_DATA")
             if not isinstance(get_stats_data, dict):
-                return None, None, "レスポンスデータの解析に失敗しました"
+                return [], None, "レスポンスデータの解析に失敗しました"
             statistical_data = get_stats_data.get("STATISTICAL_DATA")
             if not isinstance(statistical_data, dict):
-                return None, None, "レスポンスデータの解析に失敗しました"
+                return [], None, "レスポンスデータの解析に失敗しました"
+            result_inf = statistical_data.get("RESULT_INF")
+            next_key_raw = result_inf.get("NEXT_KEY") if isinstance(result_inf, dict) else None
+            next_key = str(next_key_raw) if next_key_raw not in (None, "") else None
             data_inf = statistical_data.get("DATA_INF")
             if not isinstance(data_inf, dict):
-                return None, None, "レスポンスデータの解析に失敗しました"
+                return [], None, "レスポンスデータの解析に失敗しました"
             values_raw = data_inf.get("VALUE", [])
         except AttributeError:
-            return None, None, "レスポンスデータの解析に失敗しました"
+            return [], None, "レスポンスデータの解析に失敗しました"
 
         if not values_raw:
-            return None, None, "VALUEが空（条件が合ってない可能性）"
+            return [], next_key, "VALUEが空（条件が合ってない可能性）"
 
         # valuesが単一オブジェクトの場合はリストに変換
         if isinstance(values_raw, dict):
@@ -250,22 +474,125 @@ class EStatClient:
         elif isinstance(values_raw, list):
             values = [v for v in values_raw if isinstance(v, dict)]
         else:
-            return None, None, "VALUEの形式が不正です"
+            return [], None, "VALUEの形式が不正です"
 
         if not values:
-            return None, None, "VALUEが空（条件が合ってない可能性）"
+            return [], next_key, "VALUEが空（条件が合ってない可能性）"
+        return values, next_key, None
 
-        v0 = values[0]
-        # 値の取得
-        raw_val = v0.get("$")
+    @staticmethod
+    def _parse_value(v: JsonDict) -> tuple[float | None, str | None]:
+        """VALUE の1要素から (価格, 単位) を取り出します。"""
+        raw_val = v.get("$")
         if raw_val is None:
-            raw_val = v0.get("@value") or v0.get("value")
+            raw_val = v.get("@value") or v.get("value")
 
         try:
             val = float(str(raw_val)) if raw_val is not None else None
         except (ValueError, TypeError):
             val = None
 
-        unit_val = v0.get("@unit")
+        unit_val = v.get("@unit")
         unit: str | None = str(unit_val) if unit_val is not None else None
+        return val, unit
+
+    async def lookup_stat_price(
+        self,
+        statsDataId: str,
+        cdTime: str | None,
+        cdArea: str | None,
+        class_key: str,
+        class_code: str,
+    ) -> tuple[float | None, str | None, str | None]:
+        params: dict[str, str | int] = {"statsDataId": statsDataId, "limit": 1}
+        if cdTime:
+            params["cdTime"] = cdTime
+        if cdArea:
+            params["cdArea"] = cdArea
+        params[self._class_param_name(class_key)] = class_code
+
+        data = await self._get("getStatsData", params)
+
+        values, _, error = self._extract_values(data)
+        if error:
+            return None, None, error
+
+        val, unit = self._parse_value(values[0])
         return val, unit, None
+
+    async def _iter_stat_values(
+        self,
+        statsDataId: str,
+        class_key: str,
+        class_codes: list[str],
+        filters: dict[str, str | int],
+    ) -> AsyncIterator[JsonDict]:
+        """
+        複数品目の VALUE を順に返します（bulk モード）。
+
+        分類コードをカンマ区切りで ESTAT_BULK_CODES_PER_REQUEST 件ずつ指定し、
+        NEXT_KEY がある限り startPosition を進めてページングします。
+        """
+        param_name = self._class_param_name(class_key)
+
+        for i in range(0, len(class_codes), ESTAT_BULK_CODES_PER_REQUEST):
+            chunk = class_codes[i:i + ESTAT_BULK_CODES_PER_REQUEST]
+            params: dict[str, str | int] = {
+                "statsDataId": statsDataId,
+                param_name: ",".join(chunk),
+                "limit": ESTAT_BULK_PAGE_SIZE,
+                # 注記やメタ情報は不要なので省略して転送量を減らす
+                "metaGetFlg": "N",
+                "cntGetFlg": "N",
+                **filters,
+            }
+
+            start_position: str | None = None
+            while True:
+                page_params = dict(params)
+                if start_position:
+                    page_params["startPosition"] = start_position
+                data = await self._get("getStatsData", page_params)
+                values, next_key, _ = self._extract_values(data)
+
+                for v in values:
+                    yield v
+
+                if not next_key:
+                    break
+                start_position = next_key
+
+    async def lookup_stat_price_series(
+        self,
+        statsDataId: str,
+        cdTimeFrom: str,
+        cdTimeTo: str,
+        cdAreas: list[str],
+        class_key: str,
+        class_codes: list[str],
+    ) -> list[tuple[str, str, str, float, str | None]]:
+        """
+        複数品目 × 複数地域 × 期間の価格をまとめて取得します（bulk モード）。
+
+        戻り値: [(分類コード, 地域コード, 時間コード, 価格, 単位), ...]
+        """
+        filters: dict[str, str | int] = {"cdTimeFrom": cdTimeFrom, "cdTimeTo": cdTimeTo}
+        if cdAreas:
+            filters["cdArea"] = ",".join(cdAreas)
+
+        attr_name = f"@{class_key}"
+        out: list[tuple[str, str, str, float, str | None]] = []
+        seen: set[tuple[str, str, str]] = set()
+        async for v in self._iter_stat_values(statsDataId, class_key, class_codes, filters):
+            code = str(v.get(attr_name, ""))
+            area = str(v.get("@area", ""))
+            time_code = str(v.get("@time", ""))
+            key = (code, area, time_code)
+            # 同じ品目・地域・時点に複数の値がある場合は先頭（1件取得時と同じ）を採用
+            if not code or not area or not time_code or key in seen:
+                continue
+            val, unit = self._parse_value(v)
+            if val is not None:
+                seen.add(key)
+                out.append((code, area, time_code, val, unit))
+        return out
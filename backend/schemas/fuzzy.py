@@ -0,0 +1,125 @@
+"""
+あいまい検索（トライグラム索引 + 編集距離）
+
+レシートの品目名は半角カナの途中切れや OCR の誤読を含むため、完全な部分一致では
+名寄せできないことがあります。折りたたみ済みのキーをトライグラムで索引しておき、
+候補をトライグラムの一致度で絞り込んでから編集距離で並べ直して上位 k 件を返します。
+"""
+import sys
+from collections.abc import Sequence
+
+# 文字列の前後に付ける番兵（短い語でもトライグラムができるように）
+_PAD = "\x02"
+_END = "\x03"
+
+
+def trigrams(s: str) -> set[str]:
+    p = f"{_PAD}{s}{_END}"
+    return {p[i:i + 3] for i in range(len(p) - 2)}
+
+
+def levenshtein(a: str, b: str) -> int:
+    """編集距離（挿入・削除・置換のコストは1）"""
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def similarity(q: str, key: str) -> float:
+    """
+    0〜1 の類似度
+
+    全体の編集距離による類似度と、key を q の長さで切った場合の類似度（途中切れ対策、少し減点）の高い方
+    """
+    if not q or not key:
+        return 0.0
+    full = 1.0 - levenshtein(q, key) / max(len(q), len(key))
+    if len(key) > len(q) >= 3:
+        prefix = 1.0 - levenshtein(q, key[:len(q)]) / len(q)
+        return max(full, prefix * 0.9)
+    return full
+
+
+class FuzzyIndex:
+    """
+    折りたたみ済みキーのトライグラム転置索引
+
+    search の戻り値はキーの位置（コンストラクタに渡した順序）と類似度です。
+    """
+
+    __slots__ = ("keys", "_grams", "_postings")
+
+    def __init__(self, keys: Sequence[str]) -> None:
+        self.keys = tuple(keys)
+        self._grams = [len(trigrams(k)) for k in self.keys]
+        postings: dict[str, list[int]] = {}
+        for i, k in enumerate(self.keys):
+            if not k:
+                continue
+            for g in trigrams(k):
+                postings.setdefault(g, []).append(i)
+        self._postings = postings
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def approx_size(self) -> int:
+        """おおよそのメモリ使用量（バイト）を返します。"""
+        size = sys.getsizeof(self.keys) + sum(sys.getsizeof(k) for k in self.keys)
+        size += sys.getsizeof(self._grams) + sys.getsizeof(self._postings)
+        size += sum(sys.getsizeof(g) + sys.getsizeof(lst) for g, lst in self._postings.items())
+        return size
+
+    def search(
+        self,
+        q: str,
+        k: int = 5,
+        min_score: float = 0.0,
+        max_postings: int | None = None,
+        rerank: int = 20,
+    ) -> list[tuple[int, float]]:
+        """
+        q に近いキーを類似度の高い順に最大 k 件返します。
+
+        1. クエリのトライグラムを出現の少ない順にポスティングリストから数え上げ（Dice 係数で仮採点）
+        2. 仮採点の上位 rerank 件を編集距離の類似度で採点し直す
+        数え上げたポスティングが max_postings 件を超えたら、残りのトライグラムは見ません
+        （時間ではなく件数で打ち切るので、負荷に関係なく同じ入力には同じ結果を返す）。
+        """
+        if not q:
+            return []
+
+        q_grams = trigrams(q)
+        # 同じ長さのリストはトライグラム順にそろえる（set の順序は実行ごとに変わるため）
+        lists = [
+            lst for _, lst in sorted(
+                ((g, self._postings[g]) for g in q_grams if g in self._postings),
+                key=lambda x: (len(x[1]), x[0]),
+            )
+        ]
+        counts: dict[int, int] = {}
+        seen = 0
+        for lst in lists:
+            for i in lst:
+                counts[i] = counts.get(i, 0) + 1
+            seen += len(lst)
+            if max_postings is not None and seen >= max_postings:
+                break
+        if not counts:
+            return []
+
+        n_q = len(q_grams)
+        dice = sorted(
+            ((2 * c / (n_q + self._grams[i]), i) for i, c in counts.items()),
+            reverse=True,
+        )[:max(rerank, k)]
+
+        scored = [(max(similarity(q, self.keys[i]), d), i) for d, i in dice]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(i, round(s, 4)) for s, i in scored[:k] if s >= min_score]
@@ -0,0 +1,130 @@
+"""
+品目ルールのキーワード照合用 Aho-Corasick オートマトン
+
+ルール数 × キーワード数 の部分文字列検索を、文字列を1回なめるだけの照合に置き換えます。
+スコアの付け方は guess_canonical の従来のループと同じです。
+- 正規表現パターンに一致したルールがあれば、ルール順で最初のものを採用
+- なければ最長のキーワードに一致したルールを採用（同じ長さならルール順で先のもの）
+"""
+import re
+from collections import deque
+from collections.abc import Iterable
+
+# 一致なしを表す番兵（長さ 0 は一致として扱わない）
+_NO_HIT = (0, -1)
+
+
+class KeywordAutomaton:
+    """
+    キーワード → ルール番号 の多パターン照合器
+
+    各ノードには「そのノードで終わるキーワードのうち最良のもの」（長さ最大・ルール番号最小）を
+    失敗リンク先の分まで畳み込んで持たせておき、照合時は1文字ごとに比較するだけにします。
+    """
+
+    __slots__ = ("_goto", "_fail", "_best")
+
+    def __init__(self, keywords: Iterable[tuple[str, int]]) -> None:
+        # keywords: [(折りたたみ済みキーワード, ルール番号), ...]
+        goto: list[dict[str, int]] = [{}]
+        # best[node] = (キーワード長, ルール番号)
+        best: list[tuple[int, int]] = [_NO_HIT]
+
+        for kw, rule_i in keywords:
+            if not kw:
+                continue
+            node = 0
+            for ch in kw:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    best.append(_NO_HIT)
+                node = nxt
+            if _better((len(kw), rule_i), best[node]):
+                best[node] = (len(kw), rule_i)
+
+        # 幅優先で失敗リンクを張り、失敗リンク先の最良一致を畳み込む
+        fail = [0] * len(goto)
+        queue: deque[int] = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                if _better(best[fail[child]], best[child]):
+                    best[child] = best[fail[child]]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def longest_match(self, text: str) -> tuple[int, int] | None:
+        """
+        text 中で一致する最長のキーワードを探します。
+
+        戻り値: (キーワード長, ルール番号)。一致がなければ None
+        """
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        hit = _NO_HIT
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            cand = best[node]
+            if cand[0] and _better(cand, hit):
+                hit = cand
+        return hit if hit[0] else None
+
+
+def _better(a: tuple[int, int], b: tuple[int, int]) -> bool:
+    """a の方が良い一致か（長い方が優先、同じ長さならルール番号が小さい方）。"""
+    if a[0] != b[0]:
+        return a[0] > b[0]
+    return a[0] > 0 and (b[1] < 0 or a[1] < b[1])
+
+
+class ItemRuleMatcher:
+    """
+    コンパイル済みの品目ルール一式（正規表現パターン + キーワードオートマトン）
+
+    guess_canonical から使います。ルールの並び順がそのまま優先順位になります。
+    """
+
+    __slots__ = ("canonicals", "automaton", "pattern_rules")
+
+    def __init__(self, rules: Iterable[tuple[str, list[str], list[re.Pattern[str]]]]) -> None:
+        canonicals: list[str] = []
+        keywords: list[tuple[str, int]] = []
+        pattern_rules: list[tuple[int, list[re.Pattern[str]]]] = []
+        for i, (canonical, kws, patterns) in enumerate(rules):
+            canonicals.append(canonical)
+            keywords.extend((kw, i) for kw in kws if kw)
+            if patterns:
+                pattern_rules.append((i, patterns))
+
+        self.canonicals = canonicals
+        self.automaton = KeywordAutomaton(keywords)
+        # パターンを持つルールだけをルール順に保持する
+        self.pattern_rules = pattern_rules
+
+    def match(self, s_norm: str, s_fold: str) -> str | None:
+        """
+        正規化済み文字列（s_norm）と折りたたみ済み文字列（s_fold）から canonical を推定します。
+        """
+        # パターン一致はキーワード一致より常に優先されるので、最初に一致したルールで確定する
+        for rule_i, patterns in self.pattern_rules:
+            for pat in patterns:
+                if pat.search(s_norm):
+                    return self.canonicals[rule_i]
+
+        hit = self.automaton.longest_match(s_fold)
+        return self.canonicals[hit[1]] if hit else None
@@ -0,0 +1,140 @@
+"""
+文字列の正規化（全角・半角の揺れの吸収、検索用キーの生成）
+
+変換表と正規表現はモジュール読込時に1回だけ作ります。
+レシートの品名や検索語は同じものが何度も現れるので、短い文字列の結果は上限付きで覚えておきます
+（NORMALIZE_CACHE_SIZE 件まで、NORMALIZE_CACHE_MAX_LEN 文字を超える文字列は覚えない）。
+分類マップの名前のように一度しか使わない大量の文字列は normalize_many(..., memoize=False) で変換します。
+"""
+import re
+import unicodedata
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+from typing import Any, Literal
+
+NORMALIZE_CACHE_SIZE = 65536
+NORMALIZE_CACHE_MAX_LEN = 256
+
+_TRANS = str.maketrans({
+    "０": "0", "１": "1", "２": "2", "３": "3", "４": "4",
+    "５": "5", "６": "6", "７": "7", "８": "8", "９": "9",
+    "／": "/", "－": "-", "ー": "-", "：": ":", "　": " ",
+    "￥": "¥",
+    "\\": "¥",
+})
+_WS_RE = re.compile(r"\s+")
+# simplify_key で取り除く空白・括弧・記号（1回の置換でまとめて消す）
+_SIMPLIFY_RE = re.compile(r"[ \t\r\n()（）【】\[\]「」『』・,，\.。/／\-－]")
+# カタカナ → ひらがな（あいまい検索ではカナの種類の違いを無視する）
+_KATA_TO_HIRA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)})
+
+
+def _normalize(s: str) -> str:
+    s = unicodedata.normalize("NFKC", s).translate(_TRANS)
+    return _WS_RE.sub(" ", s).strip()
+
+
+def _simplify(s: str) -> str:
+    return _SIMPLIFY_RE.sub("", _normalize(s))
+
+
+def _fold(s: str) -> str:
+    return _simplify(s).casefold()
+
+
+def _fuzzy(s: str) -> str:
+    return _fold(s).translate(_KATA_TO_HIRA)
+
+
+# 覚えておく版は1段前の結果（キャッシュ済みのことが多い）から作る
+_normalize_cached = lru_cache(maxsize=NORMALIZE_CACHE_SIZE)(_normalize)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _simplify_cached(s: str) -> str:
+    return _SIMPLIFY_RE.sub("", normalize_text(s))
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _fold_cached(s: str) -> str:
+    return simplify_key(s).casefold()
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _fuzzy_cached(s: str) -> str:
+    return fold_key(s).translate(_KATA_TO_HIRA)
+
+
+def normalize_text(s: str) -> str:
+    """文字の揺れ（全角・半角など）を吸収し、標準的な形に整えます。"""
+    return _normalize_cached(s) if len(s) <= NORMALIZE_CACHE_MAX_LEN else _normalize(s)
+
+
+def simplify_key(s: str) -> str:
+    """検索や比較のために、記号や空白を徹底的に取り除いた文字列を返します。"""
+    return _simplify_cached(s) if len(s) <= NORMALIZE_CACHE_MAX_LEN else _simplify(s)
+
+
+def fold_key(s: str) -> str:
+    """大文字小文字を区別せず比較するための正規化を行います。"""
+    return _fold_cached(s) if len(s) <= NORMALIZE_CACHE_MAX_LEN else _fold(s)
+
+
+def fuzzy_key(s: str) -> str:
+    """あいまい検索用のキー（fold_key に加えてカタカナをひらがなに寄せる）"""
+    return _fuzzy_cached(s) if len(s) <= NORMALIZE_CACHE_MAX_LEN else _fuzzy(s)
+
+
+_KINDS: dict[str, tuple[Callable[[str], str], Callable[[str], str]]] = {
+    "text": (normalize_text, _normalize),
+    "simple": (simplify_key, _simplify),
+    "fold": (fold_key, _fold),
+    "fuzzy": (fuzzy_key, _fuzzy),
+}
+
+
+def normalize_many(
+    strings: Iterable[str],
+    kind: Literal["text", "simple", "fold", "fuzzy"] = "text",
+    memoize: bool = True,
+) -> list[str]:
+    """
+    複数の文字列をまとめて正規化します（レシート全行・分類マップの全名前など）。
+
+    kind: "text"=normalize_text, "simple"=simplify_key, "fold"=fold_key, "fuzzy"=fuzzy_key
+    同じ文字列は1回だけ変換します。memoize=False なら共有のキャッシュを使わず、この呼び出しの中だけで使い回します。
+    """
+    cached, raw = _KINDS[kind]
+    fn = cached if memoize else raw
+    seen: dict[str, str] = {}
+    out: list[str] = []
+    for s in strings:
+        v = seen.get(s)
+        if v is None:
+            v = seen[s] = fn(s)
+        out.append(v)
+    return out
+
+
+def get_normalize_cache_stats() -> dict[str, Any]:
+    """
+    正規化キャッシュの状態を取得（/health 用）
+    """
+    stats: dict[str, Any] = {}
+    for kind, fn in (("text", _normalize_cached), ("simple", _simplify_cached),
+                     ("fold", _fold_cached), ("fuzzy", _fuzzy_cached)):
+        info = fn.cache_info()
+        total = info.hits + info.misses
+        stats[kind] = {
+            "size": info.currsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / total, 4) if total else None,
+        }
+    return stats
+
+
+def clear_normalize_cache() -> None:
+    """正規化キャッシュを空にします（ベンチマーク用）。"""
+    for fn in (_normalize_cached, _simplify_cached, _fold_cached, _fuzzy_cached):
+        fn.cache_clear()
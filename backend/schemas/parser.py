@@ -1,102 +1,59 @@
 import re
-import unicodedata
+from collections.abc import Mapping
 from datetime import datetime
-from functools import lru_cache
 
-from rules import (
-    CLASS_SEARCH_ORDER,
-    ESTAT_NAME_HINTS,
-    EXCLUDE_WORDS,
-    ITEM_RULES,
-    UNKNOWN_RESCUE_CANDIDATE_RULES,
-    UNKNOWN_RESCUE_NORMALIZE_MAP,
-)
+from rules import CLASS_SEARCH_ORDER
 
+from .class_index import ClassNameIndex
+from .class_map import ClassMap
+from .fuzzy import FuzzyIndex
+from .normalize import fold_key, fuzzy_key, normalize_many, normalize_text, simplify_key
+from .rules_engine import get_rules
 from .schemas import CanonicalResolution
 
 
-def normalize_text(s: str) -> str:
-    """文字の揺れ（全角・半角など）を吸収し、標準的な形に整えます。"""
-    s = unicodedata.normalize("NFKC", s)
-    trans = str.maketrans({
-        "０": "0", "１": "1", "２": "2", "３": "3", "４": "4",
-        "５": "5", "６": "6", "７": "7", "８": "8", "９": "9",
-        "／": "/", "－": "-", "ー": "-", "：": ":", "　": " ",
-        "￥": "¥",
-        "\\": "¥",
-    })
-    s = s.translate(trans)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
-def simplify_key(s: str) -> str:
-    """検索や比較のために、記号や空白を徹底的に取り除いた文字列を返します。"""
-    s = normalize_text(s)
-    s = re.sub(r"[ \t\r\n]", "", s)
-    s = re.sub(r"[()（）【】\[\]「」『』]", "", s)
-    s = re.sub(r"[・,，\.。/／\-－]", "", s)
-    return s
-
-
-def fold_key(s: str) -> str:
-    """大文字小文字を区別せず比較するための正規化を行います。"""
-    return simplify_key(s).casefold()
-
-
-@lru_cache(maxsize=1)
-def _compiled_item_rules() -> list[tuple[str, list[str], list[re.Pattern[str]]]]:
-    compiled: list[tuple[str, list[str], list[re.Pattern[str]]]] = []
-    for rule in ITEM_RULES:
-        can = rule.get("canonical", "")
-        assert isinstance(can, str)
-        canonical: str = can
-        keywords: list[str] = [fold_key(k) for k in (rule.get("keywords", [])) if k]
-        patterns: list[re.Pattern[str]] = [re.compile(p, flags=re.IGNORECASE) for p in (rule.get("patterns", [])) if p]
-        compiled.append((canonical, keywords, patterns))
-    return compiled
+# あいまい検索: 採用する最低類似度・候補数・1回の検索で数え上げるポスティングの上限
+FUZZY_MIN_SCORE = 0.7
+FUZZY_TOP_K = 5
+FUZZY_MAX_POSTINGS = 5000
+# e-Stat 品目名の括弧書き（先頭以外）
+_CLASS_NAME_QUALIFIER_RE = re.compile(r"(?<=.)[(（].*$")
+
+# レシートの行の読み取り
+_DATE_RE = re.compile(r"(20\d{2})[/-](\d{1,2})[/-](\d{1,2})")
+_DATE_LINE_RE = re.compile(r"\b20\d{2}[/-]\d{1,2}[/-]\d{1,2}\b")
+_ITEM_LINE_RE = re.compile(r"^(.+?)\s*[¥]?\s*(\d{1,3}(?:,\d{3})+|\d{2,6})(?:\s*円)?\s*[-‐ー*]?\s*$")
+_ITEM_NAME_CHAR_RE = re.compile(r"[A-Za-zぁ-んァ-ン一-龥]")
+_TRAILING_YEN_RE = re.compile(r"[¥\\]+$")
+_BRACKETS_RE = re.compile(r"[|】\]\[]+")
+_SIZE_SUFFIX_RE = re.compile(r"\d+(\s*[gGmMlL])?")
 
 
 def guess_canonical(raw: str) -> str | None:
     s_norm = normalize_text(raw)
-    s_fold = fold_key(s_norm)
-
-    best: str | None = None
-    best_score = -1
-
-    for canonical, keywords, patterns in _compiled_item_rules():
-        for pat in patterns:
-            if pat.search(s_norm):
-                score = 10_000
-                if score > best_score:
-                    best = canonical
-                    best_score = score
-
-        for kw in keywords:
-            if kw and kw in s_fold:
-                score = len(kw)
-                if score > best_score:
-                    best = canonical
-                    best_score = score
+    # fold_key は内部で normalize_text を通すので、生の文字列をキーにしてキャッシュを共有する
+    s_fold = fold_key(raw)
 
-    return best
+    # パターン一致 > 最長キーワード一致（同じ長さならルール順で先のもの）
+    return get_rules().guess(s_norm, s_fold)
 
 
 def _clean_item_name(name: str) -> str:
     name = name.strip()
-    name = re.sub(r"[¥\\]+$", "", name).strip()
-    name = re.sub(r"[|】\]\[]+", "", name).strip()
+    name = _TRAILING_YEN_RE.sub("", name).strip()
+    name = _BRACKETS_RE.sub("", name).strip()
     return name
 
 
 def is_excluded_name(name: str) -> bool:
     """品目名が除外対象（合計、お釣りなど）かどうかを判定します。"""
-    return any(w in name for w in EXCLUDE_WORDS)
+    return get_rules().is_excluded(name)
 
 
 def parse_receipt_text(text: str) -> tuple[str, list[tuple[str, float | None]]]:
-    text_for_date = normalize_text(text)
-    m = re.search(r"(20\d{2})[/-](\d{1,2})[/-](\d{1,2})", text_for_date)
+    # 行ごとにまとめて正規化する（日付は行をまたがないので、最初に日付が現れる行から読む）
+    lines = normalize_many(text.splitlines())
+    m = next((m for m in map(_DATE_RE.search, lines) if m), None)
     if m:
         y, mo, d = int(m.group(1)), int(m.group(2)), int(m.group(3))
         purchase_date = f"{y:04d}-{mo:02d}-{d:02d}"
@@ -104,15 +61,14 @@ def parse_receipt_text(text: str) -> tuple[str, list[tuple[str, float | None]]]:
         purchase_date = datetime.now().strftime("%Y-%m-%d")
 
     items: list[tuple[str, float | None]] = []
-    for raw_line in text.splitlines():
-        line = normalize_text(raw_line)
+    for line in lines:
         if not line:
             continue
 
-        if re.search(r"\b20\d{2}[/-]\d{1,2}[/-]\d{1,2}\b", line):
+        if _DATE_LINE_RE.search(line):
             continue
 
-        m2 = re.search(r"^(.+?)\s*[¥]?\s*(\d{2,6}(?:,\d{{3}})*)(?:\s*円)?\s*[-‐ー*]?\s*$", line)
+        m2 = _ITEM_LINE_RE.search(line)
         if not m2:
             continue
 
@@ -122,7 +78,7 @@ def parse_receipt_text(text: str) -> tuple[str, list[tuple[str, float | None]]]:
         if not name or len(name) <= 1 or is_excluded_name(name):
             continue
 
-        if not re.search(r"[A-Za-zぁ-んァ-ン一-龥]", name):
+        if not _ITEM_NAME_CHAR_RE.search(name):
             continue
 
         try:
@@ -137,33 +93,11 @@ def parse_receipt_text(text: str) -> tuple[str, list[tuple[str, float | None]]]:
 
 def _candidate_terms_for_unknown(raw_name: str) -> list[str]:
     raw_norm = normalize_text(raw_name)
-    raw_fold = fold_key(raw_norm)
-
-    out: list[str] = []
-
-    for k, v in UNKNOWN_RESCUE_NORMALIZE_MAP.items():
-        if k and fold_key(k) in raw_fold:
-            out.append(v)
-            break
-
-    for rule in UNKNOWN_RESCUE_CANDIDATE_RULES:
-        match_any = rule.get("match_any", [])
-        match_all = rule.get("match_all", [])
-        match_patterns = rule.get("match_patterns", [])
-        candidates = rule.get("candidates", [])
+    raw_fold = fold_key(raw_name)
 
-        ok = False
-        if match_any and any(fold_key(x) in raw_fold for x in match_any if x):
-            ok = True
-        if match_all and all(fold_key(x) in raw_fold for x in match_all if x):
-            ok = True
-        if match_patterns and any(re.search(p, raw_norm, flags=re.IGNORECASE) for p in match_patterns if p):
-            ok = True
+    out = get_rules().rescue_terms(raw_norm, raw_fold)
 
-        if ok:
-            out.extend(candidates)
-
-    stripped = re.sub(r"\d+(\s*[gGmMlL])?", "", raw_norm).strip()
+    stripped = _SIZE_SUFFIX_RE.sub("", raw_norm).strip()
     if stripped and stripped != raw_norm:
         out.append(stripped)
 
@@ -180,7 +114,68 @@ def _candidate_terms_for_unknown(raw_name: str) -> list[str]:
     return uniq
 
 
-def search_class_names(class_maps: dict[str, dict[str, str]], q: str, limit: int = 80) -> list[dict[str, str]]:
+def class_name_index(mp: Mapping[str, str]) -> ClassNameIndex:
+    """
+    分類マップの名前検索用索引を返します。
+
+    ClassMap（EStatClient が返す分類マップ）は初回に作った索引を保持して使い回します。
+    それ以外の Mapping はその都度作ります。
+    """
+    if isinstance(mp, ClassMap):
+        if mp.search_index is None:
+            mp.search_index = ClassNameIndex(mp.names, mp.codes, normalize_many(mp.names, "simple", memoize=False))
+        return mp.search_index
+    names = tuple(mp.keys())
+    return ClassNameIndex(names, tuple(mp.values()), normalize_many(names, "simple", memoize=False))
+
+
+def class_fuzzy_index(mp: Mapping[str, str]) -> FuzzyIndex:
+    """分類マップの名前のあいまい検索用索引を返します（名前検索用の索引に持たせて使い回す）。"""
+    idx = class_name_index(mp)
+    if idx.fuzzy is None:
+        # e-Stat の品目名の括弧書き（「チーズ(国産品)」の「(国産品)」など）はレシートに現れないので除く
+        keys = normalize_many((_CLASS_NAME_QUALIFIER_RE.sub("", n) for n in idx.names), "fuzzy", memoize=False)
+        idx.fuzzy = FuzzyIndex([k or fuzzy_key(n) for k, n in zip(keys, idx.names)])
+    return idx.fuzzy
+
+
+def fuzzy_candidates(
+    raw_name: str,
+    class_maps: Mapping[str, Mapping[str, str]] | None = None,
+    k: int = FUZZY_TOP_K,
+    min_score: float = FUZZY_MIN_SCORE,
+    max_postings: int = FUZZY_MAX_POSTINGS,
+) -> list[dict[str, str | float]]:
+    """
+    品目名に近い canonical・e-Stat分類名をあいまい検索し、類似度の高い順に最大 k 件返します。
+
+    戻り値: [{"source": "rule" または分類ID, "name": ..., "canonical" または "code": ..., "score": ...}, ...]
+    """
+    q = fuzzy_key(raw_name)
+    if len(q) < 2:
+        return []
+
+    hits: list[dict[str, str | float]] = []
+    rules = get_rules()
+    for i, score in rules.fuzzy_search(q, k, min_score, max_postings):
+        hits.append({
+            "source": "rule", "name": rules.fuzzy_names[i], "canonical": rules.fuzzy_canonicals[i], "score": score,
+        })
+
+    for obj_id in CLASS_SEARCH_ORDER:
+        mp = (class_maps or {}).get(obj_id)
+        if not mp:
+            continue
+        idx = class_name_index(mp)
+        for i, score in class_fuzzy_index(mp).search(q, k=k, min_score=min_score, max_postings=max_postings):
+            hits.append({"source": obj_id, "name": idx.names[i], "code": idx.codes[i], "score": score})
+
+    # 同点なら canonical（ルール）を優先し、次に CLASS_SEARCH_ORDER の順
+    hits.sort(key=lambda h: -float(h["score"]))
+    return hits[:k]
+
+
+def search_class_names(class_maps: Mapping[str, Mapping[str, str]], q: str, limit: int = 80) -> list[dict[str, str]]:
     """品目名の一部から、e-Statの分類コードを検索します。"""
     qq = simplify_key(q)
     if not qq:
@@ -188,12 +183,14 @@ def search_class_names(class_maps: dict[str, dict[str, str]], q: str, limit: int
 
     hits: list[dict[str, str]] = []
     for obj_id in CLASS_SEARCH_ORDER:
-        mp = class_maps.get(obj_id) or {}
-        for name, code in mp.items():
-            if qq in simplify_key(name):
-                hits.append({"class_id": obj_id, "name": name, "code": code})
-                if len(hits) >= limit:
-                    return hits
+        mp = class_maps.get(obj_id)
+        if not mp:
+            continue
+        idx = class_name_index(mp)
+        for i in idx.find_simple(qq):
+            hits.append({"class_id": obj_id, "name": idx.names[i], "code": idx.codes[i]})
+            if len(hits) >= limit:
+                return hits
     return hits
 
 
@@ -212,7 +209,7 @@ def _pick_best_hit(hits: list[dict[str, str]]) -> dict[str, str] | None:
     return sorted(hits, key=score)[0]
 
 
-def resolve_canonical(raw_name: str, class_maps: dict[str, dict[str, str]]) -> CanonicalResolution:
+def resolve_canonical(raw_name: str, class_maps: Mapping[str, Mapping[str, str]]) -> CanonicalResolution:
     canonical = guess_canonical(raw_name)
     if canonical:
         return CanonicalResolution(canonical=canonical, class_id=None, class_code=None)
@@ -239,6 +236,27 @@ def resolve_canonical(raw_name: str, class_maps: dict[str, dict[str, str]]) -> C
     picked = _pick_best_hit(all_hits)
     if not picked:
         tried_sorted = sorted(tried, key=get_hits_count, reverse=True)[:3]
+
+        # 部分一致で見つからなければ、半角カナの途中切れや誤読を想定してあいまい検索で救済する
+        fuzzy = fuzzy_candidates(raw_name, class_maps)
+        if fuzzy:
+            best = fuzzy[0]
+            tried_sorted.insert(0, {
+                "term": "fuzzy",
+                "hits": len(fuzzy),
+                "samples": [{k: str(v) for k, v in h.items()} for h in fuzzy[:3]],
+            })
+            if best["source"] == "rule":
+                return CanonicalResolution(
+                    canonical=str(best["canonical"]), candidates_debug=tried_sorted, class_id=None, class_code=None
+                )
+            return CanonicalResolution(
+                canonical=str(best["name"]),
+                class_id=str(best["source"]),
+                class_code=str(best["code"]),
+                candidates_debug=tried_sorted,
+            )
+
         return CanonicalResolution(canonical=None, candidates_debug=tried_sorted, class_id=None, class_code=None)
 
     tried_sorted = sorted(tried, key=get_hits_count, reverse=True)[:3]
@@ -250,8 +268,8 @@ def resolve_canonical(raw_name: str, class_maps: dict[str, dict[str, str]]) -> C
     )
 
 
-def classify_to_code(class_maps: dict[str, dict[str, str]], canonical: str) -> tuple[str, str] | None:
-    hints = ESTAT_NAME_HINTS.get(canonical, [canonical])
+def classify_to_code(class_maps: Mapping[str, Mapping[str, str]], canonical: str) -> tuple[str, str] | None:
+    hints = get_rules().estat_name_hints.get(canonical, (canonical,))
     canon_s = simplify_key(canonical)
 
     for obj_id in CLASS_SEARCH_ORDER:
@@ -262,43 +280,50 @@ def classify_to_code(class_maps: dict[str, dict[str, str]], canonical: str) -> t
         if canonical in mp:
             return obj_id, mp[canonical]
 
-        for name, code in mp.items():
-            for h in hints:
-                if h and h in name:
-                    return obj_id, code
+        idx = class_name_index(mp)
+
+        # いずれかのヒントを含む名前のうち、分類マップ上で最初のもの
+        firsts = [i for h in hints if h for i in [idx.first_raw(h)] if i is not None]
+        if firsts:
+            return obj_id, idx.codes[min(firsts)]
 
-        for name, code in mp.items():
-            if canonical in name:
-                return obj_id, code
+        i = idx.first_raw(canonical)
+        if i is not None:
+            return obj_id, idx.codes[i]
 
-        for name, code in mp.items():
-            if canon_s and canon_s in simplify_key(name):
-                return obj_id, code
+        if canon_s:
+            i = idx.first_simple(canon_s)
+            if i is not None:
+                return obj_id, idx.codes[i]
 
     return None
 
 
 def suggest_meta_candidates(
-        class_maps: dict[str, dict[str, str]],
+        class_maps: Mapping[str, Mapping[str, str]],
         canonical: str,
         limit: int = 10
 ) -> list[dict[str, str]]:
-    hints = ESTAT_NAME_HINTS.get(canonical, [canonical])
-    keys = [simplify_key(h) for h in hints if h]
+    hints = get_rules().estat_name_hints.get(canonical, (canonical,))
+    keys = [k for k in (simplify_key(h) for h in hints if h) if k]
     hits: list[dict[str, str]] = []
 
     for obj_id in ["cat01", "tab", "cat02", "cat03"]:
-        mp = class_maps.get(obj_id) or {}
-        for name, code in mp.items():
-            nn = simplify_key(name)
-            if any(k and k in nn for k in keys):
-                hits.append({"class": obj_id, "name": name, "code": code})
-                if len(hits) >= limit:
-                    return hits
+        mp = class_maps.get(obj_id)
+        if not mp:
+            continue
+        idx = class_name_index(mp)
+        matched: set[int] = set()
+        for k in keys:
+            matched.update(idx.find_simple(k))
+        for i in sorted(matched):
+            hits.append({"class": obj_id, "name": idx.names[i], "code": idx.codes[i]})
+            if len(hits) >= limit:
+                return hits
     return hits
 
 
-def resolve_time_code(class_maps: dict[str, dict[str, str]], yyyymm: str) -> tuple[str, str | None]:
+def resolve_time_code(class_maps: Mapping[str, Mapping[str, str]], yyyymm: str) -> tuple[str, str | None]:
     time_map = class_maps.get("time") or {}
     if not time_map:
         return ("time", None)
@@ -323,7 +348,7 @@ def resolve_time_code(class_maps: dict[str, dict[str, str]], yyyymm: str) -> tup
     return ("time", None)
 
 
-def resolve_area_code(class_maps: dict[str, dict[str, str]], requested: str) -> tuple[str, str | None]:
+def resolve_area_code(class_maps: Mapping[str, Mapping[str, str]], requested: str) -> tuple[str, str | None]:
     area_map = class_maps.get("area") or {}
     if not area_map:
         return ("area", None)
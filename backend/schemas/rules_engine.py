@@ -0,0 +1,459 @@
+"""
+品目ルールのコンパイルと実行時の差し替え
+
+rules.json（RULES_PATH で差し替え可能）を読み込み、名寄せに使う照合器一式
+（キーワードオートマトン・あいまい検索索引・救済ルール）をまとめてコンパイルした
+CompiledRules を作ります。ルールファイルが更新されたら（ファイル監視または管理用エンドポイント）
+新しい CompiledRules を作ってから参照を1回の代入で差し替えるので、処理中のリクエストは
+最後まで古いルールで動き、ワーカーの再起動も市場データなどのキャッシュの破棄も要りません。
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any
+
+from config import settings
+from loguru import logger
+from rules import RULES_FILE
+
+from .fuzzy import FuzzyIndex
+from .keyword_automaton import ItemRuleMatcher
+from .normalize import fold_key, fuzzy_key
+from .units import UnitConverter
+
+# 対応しているルールファイルの形式
+RULES_FORMAT_VERSION = 1
+
+_current: "CompiledRules | None" = None
+_reload_lock = threading.Lock()
+_watcher_task: asyncio.Task[None] | None = None
+_reload_status: dict[str, Any] = {
+    "reloads": 0,
+    "reload_failures": 0,
+    "last_error": None,
+    "last_error_at": None,
+}
+
+
+def compile_item_rules(
+    item_rules: list[dict[str, str | list[str]]],
+) -> list[tuple[str, list[str], list[re.Pattern[str]]]]:
+    compiled: list[tuple[str, list[str], list[re.Pattern[str]]]] = []
+    for rule in item_rules:
+        can = rule.get("canonical", "")
+        assert isinstance(can, str)
+        canonical: str = can
+        keywords: list[str] = [fold_key(k) for k in (rule.get("keywords", [])) if k]
+        patterns: list[re.Pattern[str]] = [re.compile(p, flags=re.IGNORECASE) for p in (rule.get("patterns", [])) if p]
+        compiled.append((canonical, keywords, patterns))
+    return compiled
+
+
+class CandidateRule:
+    """救済用の候補ルール（UNKNOWN_RESCUE_CANDIDATE_RULES の1件、照合語は折りたたみ済み）"""
+
+    __slots__ = ("id", "match_any", "match_all", "patterns", "candidates")
+
+    def __init__(self, rule: Mapping[str, Any]) -> None:
+        self.id: str = str(rule.get("id", ""))
+        self.match_any = tuple(fold_key(x) for x in rule.get("match_any", []) if x)
+        self.match_all = tuple(fold_key(x) for x in rule.get("match_all", []) if x)
+        self.patterns = tuple(re.compile(p, flags=re.IGNORECASE) for p in rule.get("match_patterns", []) if p)
+        self.candidates: tuple[str, ...] = tuple(rule.get("candidates", []))
+
+    def matches(self, raw_norm: str, raw_fold: str) -> bool:
+        if self.match_any and any(x in raw_fold for x in self.match_any):
+            return True
+        if self.match_all and all(x in raw_fold for x in self.match_all):
+            return True
+        return bool(self.patterns) and any(p.search(raw_norm) for p in self.patterns)
+
+
+class CompiledRules:
+    """
+    コンパイル済みの品目ルール一式
+
+    作成後は中身を変更しません（stats の集計値だけが増えます）。
+    ルールの更新は新しいインスタンスを作って reload_rules で差し替えます。
+    """
+
+    __slots__ = (
+        "version", "digest", "path", "file_sig", "loaded_at", "compile_ms",
+        "matcher", "item_keywords", "fuzzy_index", "fuzzy_names", "fuzzy_canonicals",
+        "estat_name_hints", "rescue_normalize", "candidate_rules", "exclude_words", "units",
+        "counts", "stats",
+    )
+
+    def __init__(self, data: Mapping[str, Any], path: Path, digest: str, file_sig: tuple[int, int] | None) -> None:
+        start = time.perf_counter()
+        item_rules = data["item_rules"]
+        hints: dict[str, list[str]] = data["estat_name_hints"]
+        normalize_map: dict[str, str] = data["unknown_rescue_normalize_map"]
+
+        self.version = str(data["version"])
+        self.digest = digest
+        self.path = str(path)
+        self.file_sig = file_sig
+
+        compiled = compile_item_rules(item_rules)
+        self.matcher = ItemRuleMatcher(compiled)
+        # 品目ルールのキーワード（元の表記のまま、負荷試験用のモックが商品名の合成に使う）
+        self.item_keywords: tuple[str, ...] = tuple(
+            str(kw) for rule in item_rules for kw in rule.get("keywords", []) if kw
+        )
+        self.estat_name_hints: Mapping[str, tuple[str, ...]] = MappingProxyType(
+            {can: tuple(h) for can, h in hints.items()}
+        )
+        # 救済用の言い換え（最初に一致したものだけを使うので順序を保つ）
+        self.rescue_normalize = tuple((fold_key(k), v) for k, v in normalize_map.items() if k)
+        self.candidate_rules = tuple(CandidateRule(r) for r in data["unknown_rescue_candidate_rules"])
+        self.exclude_words = tuple(data["exclude_words"])
+        self.units = UnitConverter(MappingProxyType({
+            can: MappingProxyType({u: float(g) for u, g in w.items()}) for can, w in data["unit_weights"].items()
+        }))
+
+        # canonical・キーワード・e-Stat名ヒント・救済用の言い換えを1つのあいまい検索索引にまとめる
+        entries: dict[tuple[str, str], str] = {}
+
+        def add(name: str, canonical: str) -> None:
+            key = fuzzy_key(name)
+            if key and canonical:
+                entries.setdefault((key, canonical), name)
+
+        for rule in item_rules:
+            can = rule["canonical"]
+            add(can, can)
+            for kw in rule.get("keywords", []):
+                add(kw, can)
+        for can, hs in hints.items():
+            for h in hs:
+                add(h, can)
+        for alias, can in normalize_map.items():
+            add(alias, can)
+
+        self.fuzzy_index = FuzzyIndex([k for k, _ in entries])
+        self.fuzzy_names = tuple(entries.values())
+        self.fuzzy_canonicals = tuple(c for _, c in entries)
+
+        self.counts = {
+            "item_rules": len(compiled),
+            "keywords": sum(len(kws) for _, kws, _ in compiled),
+            "patterns": sum(len(pats) for _, _, pats in compiled),
+            "fuzzy_keys": len(self.fuzzy_index),
+            "rescue_normalize": len(self.rescue_normalize),
+            "candidate_rules": len(self.candidate_rules),
+            "exclude_words": len(self.exclude_words),
+            "unit_weights": len(self.units),
+        }
+        # 照合の集計（複数スレッドから加算するのでおおよその値）
+        self.stats = {
+            "guess_calls": 0,
+            "guess_hits": 0,
+            "rescue_calls": 0,
+            "rescue_hits": 0,
+            "fuzzy_calls": 0,
+            "fuzzy_hits": 0,
+        }
+        self.compile_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.loaded_at = time.time()
+
+    def guess(self, s_norm: str, s_fold: str) -> str | None:
+        """キーワード・パターンから canonical を推定します（guess_canonical 用）。"""
+        stats = self.stats
+        stats["guess_calls"] += 1
+        canonical = self.matcher.match(s_norm, s_fold)
+        if canonical:
+            stats["guess_hits"] += 1
+        return canonical
+
+    def rescue_terms(self, raw_norm: str, raw_fold: str) -> list[str]:
+        """未知の品目名から、e-Stat 分類名を探すための言い換え候補を返します。"""
+        stats = self.stats
+        stats["rescue_calls"] += 1
+        out: list[str] = []
+        for k, v in self.rescue_normalize:
+            if k in raw_fold:
+                out.append(v)
+                break
+        for rule in self.candidate_rules:
+            if rule.matches(raw_norm, raw_fold):
+                out.extend(rule.candidates)
+        if out:
+            stats["rescue_hits"] += 1
+        return out
+
+    def fuzzy_search(self, q: str, k: int, min_score: float, max_postings: int) -> list[tuple[int, float]]:
+        """ルール由来の名前をあいまい検索します（位置は fuzzy_names / fuzzy_canonicals の添字）。"""
+        stats = self.stats
+        stats["fuzzy_calls"] += 1
+        hits = self.fuzzy_index.search(q, k=k, min_score=min_score, max_postings=max_postings)
+        if hits:
+            stats["fuzzy_hits"] += 1
+        return hits
+
+    def is_excluded(self, name: str) -> bool:
+        return any(w in name for w in self.exclude_words)
+
+    def approx_size(self) -> int:
+        """おおよそのメモリ使用量（バイト、オートマトンは除く）を返します。"""
+        size = self.fuzzy_index.approx_size()
+        size += sum(sys.getsizeof(n) for n in self.fuzzy_names)
+        return size
+
+
+def _str_list(value: Any, where: str) -> list[str]:
+    if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+        raise ValueError(f"{where} は文字列の配列である必要があります")
+    return value
+
+
+def _check_patterns(patterns: list[str], where: str) -> None:
+    for p in patterns:
+        try:
+            re.compile(p)
+        except re.error as e:
+            raise ValueError(f"{where} の正規表現が不正です: {p!r} ({e})") from e
+
+
+def validate_rules(data: Any) -> dict[str, Any]:
+    """ルールファイルの中身を検証します（不正なら ValueError）。"""
+    if not isinstance(data, dict):
+        raise ValueError("ルールファイルのトップレベルはオブジェクトである必要があります")
+    fmt = data.get("format_version", RULES_FORMAT_VERSION)
+    if fmt != RULES_FORMAT_VERSION:
+        raise ValueError(f"未対応の format_version です: {fmt}")
+    if not isinstance(data.get("version"), (str, int)) or not str(data["version"]):
+        raise ValueError("version がありません")
+
+    item_rules = data.get("item_rules")
+    if not isinstance(item_rules, list) or not item_rules:
+        raise ValueError("item_rules は1件以上のオブジェクトの配列である必要があります")
+    for i, rule in enumerate(item_rules):
+        where = f"item_rules[{i}]"
+        if not isinstance(rule, dict) or not isinstance(rule.get("canonical"), str) or not rule["canonical"]:
+            raise ValueError(f"{where}.canonical がありません")
+        _str_list(rule.get("keywords", []), f"{where}.keywords")
+        _check_patterns(_str_list(rule.get("patterns", []), f"{where}.patterns"), f"{where}.patterns")
+
+    hints = data.setdefault("estat_name_hints", {})
+    if not isinstance(hints, dict):
+        raise ValueError("estat_name_hints はオブジェクトである必要があります")
+    for can, hs in hints.items():
+        _str_list(hs, f"estat_name_hints[{can!r}]")
+
+    normalize_map = data.setdefault("unknown_rescue_normalize_map", {})
+    if not isinstance(normalize_map, dict) or not all(isinstance(v, str) for v in normalize_map.values()):
+        raise ValueError("unknown_rescue_normalize_map は 文字列 → 文字列 のオブジェクトである必要があります")
+
+    candidate_rules = data.setdefault("unknown_rescue_candidate_rules", [])
+    if not isinstance(candidate_rules, list):
+        raise ValueError("unknown_rescue_candidate_rules は配列である必要があります")
+    for i, rule in enumerate(candidate_rules):
+        where = f"unknown_rescue_candidate_rules[{i}]"
+        if not isinstance(rule, dict):
+            raise ValueError(f"{where} はオブジェクトである必要があります")
+        for key in ("match_any", "match_all", "candidates"):
+            _str_list(rule.get(key, []), f"{where}.{key}")
+        _check_patterns(_str_list(rule.get("match_patterns", []), f"{where}.match_patterns"), f"{where}.match_patterns")
+
+    _str_list(data.setdefault("exclude_words", []), "exclude_words")
+
+    unit_weights = data.setdefault("unit_weights", {})
+    if not isinstance(unit_weights, dict):
+        raise ValueError("unit_weights はオブジェクトである必要があります")
+    for can, w in unit_weights.items():
+        if not isinstance(w, dict) or not all(
+            isinstance(g, (int, float)) and not isinstance(g, bool) and g > 0 for g in w.values()
+        ):
+            raise ValueError(f"unit_weights[{can!r}] は 単位 → 正の数 のオブジェクトである必要があります")
+    return data
+
+
+def rules_path() -> Path:
+    """使用するルールファイルのパス（RULES_PATH が空なら同梱の rules.json）"""
+    return Path(settings.RULES_PATH) if settings.RULES_PATH else RULES_FILE
+
+
+def _file_sig(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def load_rules(path: Path) -> CompiledRules:
+    """ルールファイルを読み込んでコンパイルします（読込・検証に失敗したら OSError / ValueError）。"""
+    sig = _file_sig(path)
+    raw = path.read_bytes()
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"ルールファイルの JSON が不正です: {e}") from e
+    return CompiledRules(validate_rules(data), path, hashlib.sha1(raw).hexdigest()[:12], sig)
+
+
+def get_rules() -> CompiledRules:
+    """
+    現在のコンパイル済みルールを返します。
+
+    呼び出し側は1回の処理の間、戻り値を使い続けてください（途中で差し替わっても一貫した結果になります）。
+    """
+    rules = _current
+    if rules is None:
+        rules = _load_initial()
+    return rules
+
+
+def _load_initial() -> CompiledRules:
+    global _current
+    with _reload_lock:
+        if _current is not None:
+            return _current
+        path = rules_path()
+        try:
+            _current = load_rules(path)
+        except (OSError, ValueError) as e:
+            if path == RULES_FILE:
+                raise
+            # 指定されたルールファイルが読めなくても、同梱のルールで動かす
+            _record_failure(path, e)
+            _current = load_rules(RULES_FILE)
+        logger.info(
+            f"品目ルールを読み込みました: version={_current.version} path={_current.path} "
+            f"({_current.counts['item_rules']}件, {_current.compile_ms}ms)"
+        )
+        return _current
+
+
+def _record_failure(path: Path, e: Exception) -> None:
+    _reload_status["reload_failures"] += 1
+    _reload_status["last_error"] = f"{path}: {e}"
+    _reload_status["last_error_at"] = time.time()
+    logger.error(f"品目ルールの読み込みに失敗しました（現在のルールを使い続けます）: {path}: {e}")
+
+
+def reload_rules(path: Path | None = None, force: bool = False) -> dict[str, Any]:
+    """
+    ルールファイルを読み直し、変わっていればコンパイルして差し替えます。
+
+    コンパイルが終わるまでは現在のルールがそのまま使われ、失敗した場合も現在のルールを使い続けます
+    （例外は呼び出し元に送出します）。
+    戻り値: {"reloaded": 差し替えたか, "version": ..., "previous_version": ..., "compile_ms": ...}
+    """
+    global _current
+    path = path or rules_path()
+    with _reload_lock:
+        previous = _current
+        if not force and previous is not None and previous.path == str(path):
+            try:
+                unchanged = previous.file_sig == _file_sig(path)
+            except OSError as e:
+                _record_failure(path, e)
+                raise
+            if unchanged:
+                return {"reloaded": False, "version": previous.version, "digest": previous.digest}
+
+        try:
+            rules = load_rules(path)
+        except (OSError, ValueError) as e:
+            _record_failure(path, e)
+            raise
+
+        if previous is not None and previous.digest == rules.digest and previous.path == rules.path and not force:
+            # 更新日時だけ変わった場合は差し替えず（集計値を保つ）、監視用の日時だけ更新する
+            previous.file_sig = rules.file_sig
+            return {"reloaded": False, "version": previous.version, "digest": previous.digest}
+
+        _current = rules
+        _reload_status["reloads"] += 1
+        _reload_status["last_error"] = None
+        _reload_status["last_error_at"] = None
+
+    prev_version = previous.version if previous else None
+    logger.info(
+        f"品目ルールを差し替えました: {prev_version} → {rules.version} "
+        f"({rules.counts['item_rules']}件, {rules.compile_ms}ms)"
+    )
+    return {
+        "reloaded": True,
+        "version": rules.version,
+        "digest": rules.digest,
+        "previous_version": prev_version,
+        "compile_ms": rules.compile_ms,
+    }
+
+
+async def _rules_watch_loop(interval: float) -> None:
+    """ルールファイルの更新日時を定期的に確認し、変わっていれば読み直すループ"""
+    failed_sig: tuple[int, int] | None = None
+    while True:
+        await asyncio.sleep(interval)
+        path = rules_path()
+        current = get_rules()
+        try:
+            sig = _file_sig(path)
+        except OSError:
+            continue
+        if (current.path == str(path) and sig == current.file_sig) or sig == failed_sig:
+            continue
+        try:
+            await asyncio.to_thread(reload_rules, path)
+            failed_sig = None
+        except (OSError, ValueError):
+            # 同じ内容のファイルで失敗を繰り返し記録しない
+            failed_sig = sig
+
+
+def start_rules_watcher() -> None:
+    """
+    ルールファイルの監視を開始します（アプリ起動時に呼び出す、RULES_WATCH_INTERVAL が 0 以下なら何もしない）
+    """
+    global _watcher_task
+    get_rules()
+    if settings.RULES_WATCH_INTERVAL <= 0:
+        return
+    if _watcher_task is not None and not _watcher_task.done():
+        return
+    _watcher_task = asyncio.create_task(_rules_watch_loop(settings.RULES_WATCH_INTERVAL))
+    logger.info(f"品目ルールの監視を開始しました: {rules_path()}")
+
+
+async def stop_rules_watcher() -> None:
+    """
+    ルールファイルの監視を停止します（アプリ終了時に呼び出す）
+    """
+    global _watcher_task
+    task = _watcher_task
+    if task is not None and not task.done():
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"品目ルールの監視の停止中にエラーが発生しました: {e}")
+    _watcher_task = None
+
+
+def get_rules_status() -> dict[str, Any]:
+    """
+    品目ルールの状態を取得（/health・管理用エンドポイント用）
+    """
+    rules = get_rules()
+    return {
+        "version": rules.version,
+        "digest": rules.digest,
+        "path": rules.path,
+        "loaded_at": rules.loaded_at,
+        "compile_ms": rules.compile_ms,
+        "approx_bytes": rules.approx_size(),
+        "counts": rules.counts,
+        "stats": dict(rules.stats),
+        **_reload_status,
+        "watcher_running": _watcher_task is not None and not _watcher_task.done(),
+    }
@@ -109,6 +109,39 @@ class GeminiReceiptResponse(BaseModel):
     summary: GeminiSummary = Field(description="サマリー")
 
 
+class GeminiExtractedItem(BaseModel):
+    """Gemini構造化出力用の読取商品スキーマ（価格比較なし）"""
+    raw_name: str = Field(description="レシート記載名")
+    paid_unit_price: float | None = Field(None, description="支払単価")
+    quantity: float | None = Field(None, description="個数")
+
+
+class GeminiReceiptExtraction(BaseModel):
+    """Gemini構造化出力用のレシート読取結果スキーマ"""
+    purchase_date: str = Field(description="購入日（YYYY-MM-DD）")
+    store_name: str | None = Field(None, description="店舗名")
+    items: list[GeminiExtractedItem] = Field(description="商品リスト")
+
+
+class GeminiItemPricingResponse(BaseModel):
+    """Gemini構造化出力用の商品比較結果スキーマ（ローカルで解決できなかった商品のみ）"""
+    items: list[GeminiItemResult] = Field(description="商品リスト（入力と同じ順序）")
+
+
+class ReceiptTextRequest(BaseModel):
+    """テキストレシート解析のリクエスト（電子レシート・OCR済みテキスト）"""
+    text: str = Field(description="レシート全文（1行1商品）")
+    area_code: str | None = Field(None, description="市場価格の地域コード（未指定なら代表地域）")
+    use_model_fallback: bool = Field(False, description="ローカルで解決できない商品だけ Gemini に問い合わせるか")
+
+
+class ReceiptTextBatchRequest(BaseModel):
+    """テキストレシート一括解析のリクエスト"""
+    texts: list[str] = Field(description="レシート全文のリスト")
+    area_code: str | None = Field(None, description="市場価格の地域コード（未指定なら代表地域）")
+    use_model_fallback: bool = Field(False, description="ローカルで解決できない商品だけ Gemini に問い合わせるか")
+
+
 class Receipt(BaseModel):
     """レシート履歴"""
     id: str = Field(description="レシートID")
@@ -0,0 +1,201 @@
+"""
+単位の解析と換算
+
+e-Stat の単位（"1kg", "100g", "1000ml", "1パック(10個)" など）と、レシートの品名に含まれる
+内容量・入数（"1000ml", "10個入", "5kg", "100g×3"）を (数量, 単位) に解析し、
+品目ごとの重量表（rules.json の unit_weights）を使って単位をそろえます。
+重量は g、容量は ml に、それ以外は数え方の単位（個・本・パック…）のまま扱います。
+"""
+import re
+from collections.abc import Mapping
+from functools import lru_cache
+
+from .normalize import normalize_text
+
+# (数量, 単位)  単位は "g" / "ml" / 数え方の単位（"個", "パック" など）
+Measure = tuple[float, str]
+
+# 換算結果のメモに None（換算できない）も入るので、未登録の印を別に用意する
+_MISSING = object()
+
+# 重量・容量の単位 → (倍率, 基準単位)
+_MASS_VOLUME_UNITS: dict[str, tuple[float, str]] = {
+    "kg": (1000.0, "g"),
+    "g": (1.0, "g"),
+    "l": (1000.0, "ml"),
+    "ml": (1.0, "ml"),
+    "cc": (1.0, "ml"),
+    "キロ": (1000.0, "g"),
+    "グラム": (1.0, "g"),
+    "リットル": (1000.0, "ml"),
+}
+# 数え方の単位（長いものを先に）。"P" はレシートの「4P」（4個入り）
+_COUNT_UNITS = (
+    "パック", "カップ", "個", "袋", "本", "缶", "枚", "箱", "玉", "丁", "束",
+    "株", "尾", "杯", "組", "瓶", "食", "切", "房", "匹", "斤", "p",
+)
+_COUNT_ALIASES = {"p": "個", "切": "切れ"}
+
+_NUM = r"(\d+(?:\.\d+)?)"
+_UNIT_ALT = "|".join(
+    sorted((re.escape(u) for u in (*_MASS_VOLUME_UNITS, *_COUNT_UNITS)), key=len, reverse=True)
+)
+# 数量 + 単位（英字の単位は後ろに英字が続かないこと、「6枚切」の「枚」は入数ではないので除く）+ 「×3」などの掛け数
+_TOKEN_RE = re.compile(
+    rf"{_NUM}\s*({_UNIT_ALT})(?![a-z])(?!切)(?:入り?)?(?:\s*[x×*]\s*(\d+))?"
+)
+# 数量のない単位だけの表記（e-Stat の "パック"、"円/kg" など）
+_BARE_UNIT_RE = re.compile(rf"(?:^|/)\s*({_UNIT_ALT})(?![a-z])")
+_PAREN_RE = re.compile(r"[(（]([^)）]*)[)）]")
+
+
+def _canonical_unit(unit: str, amount: float) -> Measure:
+    if unit in _MASS_VOLUME_UNITS:
+        factor, base = _MASS_VOLUME_UNITS[unit]
+        return amount * factor, base
+    return amount, _COUNT_ALIASES.get(unit, unit)
+
+
+def _first_token(s: str) -> Measure | None:
+    m = _TOKEN_RE.search(s)
+    if not m:
+        return None
+    amount = float(m.group(1)) * (int(m.group(3)) if m.group(3) else 1)
+    return _canonical_unit(m.group(2), amount)
+
+
+def is_mass_or_volume(unit: str) -> bool:
+    return unit in ("g", "ml")
+
+
+@lru_cache(maxsize=1024)
+def parse_unit(unit: str) -> Measure | None:
+    """
+    e-Stat の単位を (数量, 単位) に解析します（解析できなければ None）。
+
+    "1kg" → (1000, "g")、"1000ml" → (1000, "ml")、"1パック(10個)" → (10, "個")、
+    "1袋(90g)" → (90, "g")、"パック" → (1, "パック")
+    """
+    s = normalize_text(unit).lower()
+    if not s:
+        return None
+    outer_s = _PAREN_RE.sub(" ", s).strip()
+    outer = _first_token(outer_s)
+    if outer is None:
+        m = _BARE_UNIT_RE.search(outer_s)
+        outer = _canonical_unit(m.group(1), 1.0) if m else None
+
+    # 括弧内に内容量・入数があればそちらを使う（外側の数量を掛ける）
+    for inner_s in _PAREN_RE.findall(s):
+        inner = _first_token(inner_s)
+        if inner is not None:
+            n = outer[0] if outer is not None and not is_mass_or_volume(outer[1]) else 1.0
+            return inner[0] * n, inner[1]
+    return outer
+
+
+@lru_cache(maxsize=8192)
+def parse_size(raw_name: str) -> Measure | None:
+    """
+    レシートの品名から内容量・入数を (数量, 単位) で取り出します（記載がなければ None）。
+
+    重量・容量の記載を入数より優先します（"卵 10個入 600g" → (600, "g")）。
+    """
+    s = normalize_text(raw_name).lower()
+    count: Measure | None = None
+    for m in _TOKEN_RE.finditer(s):
+        amount = float(m.group(1)) * (int(m.group(3)) if m.group(3) else 1)
+        measure = _canonical_unit(m.group(2), amount)
+        if is_mass_or_volume(measure[1]):
+            return measure
+        if count is None:
+            count = measure
+    return count
+
+
+def format_measure(measure: Measure) -> str:
+    amount, unit = measure
+    return f"{amount:g}{unit}"
+
+
+def base_price(price: float, unit: str) -> tuple[str, float] | None:
+    """
+    市場価格を基準単位あたりに直します（100g・100ml・数え方の単位1つ）。
+
+    戻り値: ("100g", 100gあたりの価格) など。単位を解析できなければ None
+    """
+    measure = parse_unit(unit)
+    if measure is None or measure[0] <= 0:
+        return None
+    amount, u = measure
+    per = 100.0 if is_mass_or_volume(u) else 1.0
+    return f"{per:g}{u}", round(price / amount * per, 2)
+
+
+class UnitConverter:
+    """
+    品目ごとの重量表を使った単位換算
+
+    weights: {品目名: {数え方の単位: 1つあたりのグラム数, "ml": 1mlあたりのグラム数}}
+    単位ごとの並び順の先頭は、品名に内容量の記載がないときの既定の数え方として使います。
+    換算倍率は上限付きで覚えておきます（重量表を差し替えるときはインスタンスごと作り直す）。
+    """
+
+    __slots__ = ("_weights", "_memo", "_memo_size")
+
+    def __init__(self, weights: Mapping[str, Mapping[str, float]], memo_size: int = 8192) -> None:
+        self._weights = weights
+        self._memo: dict[tuple[str, Measure, Measure], float | None] = {}
+        self._memo_size = memo_size
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def weights_for(self, canonical: str) -> Mapping[str, float]:
+        """品目名の重量表（なければ空、"チーズ(国産品)" のような括弧書きは除いて探す）"""
+        w = self._weights.get(canonical)
+        if w is None:
+            w = self._weights.get(_PAREN_RE.sub("", canonical).strip(), {})
+        return w
+
+    def default_measure(self, canonical: str) -> Measure | None:
+        """品名に内容量の記載がないときの既定の数量（重量表の先頭の数え方で1つ）"""
+        for unit in self.weights_for(canonical):
+            if unit != "ml":
+                return 1.0, unit
+        return None
+
+    def _to_grams(self, measure: Measure, weights: Mapping[str, float]) -> float | None:
+        amount, unit = measure
+        if unit == "g":
+            return amount
+        if unit == "ml":
+            # 密度の記載がなければ水と同じとみなす
+            return amount * weights.get("ml", 1.0)
+        per = weights.get(unit)
+        return amount * per if per else None
+
+    def ratio(self, canonical: str, src: Measure, dst: Measure) -> float | None:
+        """src が dst の何倍にあたるかを返します（換算できなければ None）。"""
+        key = (canonical, src, dst)
+        memo = self._memo
+        # 別スレッド（テキストの一括解析）が途中で clear() しても KeyError にならないよう get() で1回だけ引く
+        cached = memo.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached  # type: ignore[return-value]
+
+        result: float | None = None
+        if dst[0] > 0:
+            if src[1] == dst[1]:
+                result = src[0] / dst[0]
+            else:
+                weights = self.weights_for(canonical)
+                src_g = self._to_grams(src, weights)
+                dst_g = self._to_grams(dst, weights)
+                if src_g is not None and dst_g:
+                    result = src_g / dst_g
+
+        if len(memo) >= self._memo_size:
+            memo.clear()
+        memo[key] = result
+        return result
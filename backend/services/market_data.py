@@ -3,18 +3,46 @@ e-Stat APIから市場価格データを取得するモジュール
 """
 import asyncio
 import time
+from collections.abc import Mapping, Sequence
 from datetime import datetime
+from typing import Any
 
+from config import settings
+from fastapi import HTTPException
 from loguru import logger
-from schemas import EStatClient
+from schemas import EStatClient, EStatUnavailableError
+
+from .market_snapshot import compute_data_version, load_snapshot, save_snapshot
+from .price_cube import PriceCube, market_row, time_code_from_yyyymm
 
 # グローバルキャッシュ
 _market_data_cache: list[dict[str, str | float]] = []
 _cache_timestamp: float = 0
+_cache_version: str = ""
+# 品目 × 地域 × 時間 の価格キューブと、(地域, 時間) ごとの一覧のメモ
+_price_cube: PriceCube | None = None
+_rows_cache: dict[tuple[str, str], list[dict[str, str | float]]] = {}
+_snapshot_loaded: bool = False
+# 実行中の更新タスク（同時リクエストで共有する）
+_refresh_task: asyncio.Task[list[dict[str, str | float]]] | None = None
+# バックグラウンド更新スケジューラのタスク
+_scheduler_task: asyncio.Task[None] | None = None
 CACHE_TTL = 86400  # 24時間
 
-# 同時接続数制限
-MAX_CONCURRENT_REQUESTS = 10
+# 更新処理の状態（/health で公開する）
+_refresh_status: dict[str, Any] = {
+    "running": False,
+    "last_attempt_at": None,
+    "last_success_at": None,
+    "last_duration_sec": None,
+    "item_count": 0,
+    "consecutive_failures": 0,
+    "total_failures": 0,
+    "last_error": None,
+}
+
+# 代表地域: 東京特別区部（全国データがないため代表都市を使用）
+DEFAULT_AREA_CODE = "13100"
 
 # 食料品目コードの範囲（小売物価統計の品目分類）
 # 01xxx: 食料（穀類、魚介類、肉類、乳卵類、野菜・海藻、果物、油脂・調味料、菓子類、調理食品、飲料、外食）
@@ -29,39 +57,141 @@ async def _fetch_single_item(
     item_code: str,
     cd_time: str | None,
     class_key: str,
-    semaphore: asyncio.Semaphore,
-) -> dict[str, str | float] | None:
+) -> tuple[str, float, str] | None:
     """
     単一品目の価格を取得
+
+    同時実行数は EStatClient 側のリミッターで制御されます。
+    戻り値: (品目コード, 価格, 単位)
     """
-    async with semaphore:
-        try:
-            price, unit, error = await estat_client.lookup_stat_price(
-                statsDataId=stats_data_id,
-                cdTime=cd_time,
-                cdArea="13100",  # 東京特別区部（全国データがないため代表都市を使用）
-                class_key=class_key,
-                class_code=item_code,
-            )
-            if price is not None:
-                # 品目名から番号プレフィックスを削除 (例: "1341 鶏卵" → "鶏卵")
-                clean_name = item_name
-                if " " in item_name:
-                    parts = item_name.split(" ", 1)
-                    if parts[0].isdigit():
-                        clean_name = parts[1]
-
-                return {
-                    "item_name": clean_name,
-                    "price": price,
-                    "unit": unit or "",
-                }
-            else:
-                logger.debug(f"価格取得失敗: {item_name} - {error}")
-                return None
-        except Exception as e:
-            logger.warning(f"品目取得エラー: {item_name} - {e}")
+    try:
+        price, unit, error = await estat_client.lookup_stat_price(
+            statsDataId=stats_data_id,
+            cdTime=cd_time,
+            cdArea=DEFAULT_AREA_CODE,
+            class_key=class_key,
+            class_code=item_code,
+        )
+        if price is not None:
+            return item_code, price, unit or ""
+        else:
+            logger.debug(f"価格取得失敗: {item_name} - {error}")
             return None
+    except EStatUnavailableError:
+        # e-Stat が落ちている場合は取得全体を中断する
+        raise
+    except Exception as e:
+        logger.warning(f"品目取得エラー: {item_name} - {e}")
+        return None
+
+
+def _clean_item_name(item_name: str) -> str:
+    """品目名から番号プレフィックスを削除 (例: "1341 鶏卵" → "鶏卵")"""
+    if " " in item_name:
+        parts = item_name.split(" ", 1)
+        if parts[0].isdigit():
+            return parts[1]
+    return item_name
+
+
+def _build_cube(
+    food_items: dict[str, str],
+    area_codes: list[str],
+    time_codes: list[str],
+    rows: Sequence[tuple[str, str, str, float, str | None]],
+) -> PriceCube:
+    """取得した (品目コード, 地域, 時間, 価格, 単位) の一覧からキューブを組み立てます。"""
+    units: dict[str, str] = {}
+    for code, _, _, _, unit in rows:
+        if unit and code not in units:
+            units[code] = unit
+    # 価格が1件も取れなかった品目はキューブに含めない
+    priced_codes = {code for code, _, _, _, _ in rows}
+    items = [
+        (code, _clean_item_name(name), units.get(code, ""))
+        for name, code in food_items.items()
+        if code in priced_codes
+    ]
+    cube = PriceCube(items, area_codes, time_codes)
+    for code, area, time_code, price, _ in rows:
+        cube.set(code, area, time_code, price)
+    return cube
+
+
+async def _fetch_price_cube_bulk(
+    estat_client: EStatClient,
+    stats_data_id: str,
+    food_items: dict[str, str],
+    area_codes: list[str],
+    time_from: str,
+    time_to: str,
+    class_key: str,
+) -> PriceCube:
+    """
+    全品目 × 対象地域 × 対象期間の価格を getStatsData の一括取得で取得
+    """
+    rows = await estat_client.lookup_stat_price_series(
+        statsDataId=stats_data_id,
+        cdTimeFrom=time_from,
+        cdTimeTo=time_to,
+        cdAreas=area_codes,
+        class_key=class_key,
+        class_codes=list(food_items.values()),
+    )
+    time_codes = sorted({time_code for _, _, time_code, _, _ in rows})
+    return _build_cube(food_items, area_codes, time_codes, rows)
+
+
+async def _fetch_price_cube_individually(
+    estat_client: EStatClient,
+    stats_data_id: str,
+    food_items: dict[str, str],
+    cd_time: str,
+    class_key: str,
+) -> PriceCube:
+    """
+    全品目の価格を1品目ずつ並列で取得（一括取得できない場合のフォールバック）
+
+    代表地域・最新月の1セルのみのキューブになります。
+    """
+    # TaskGroup: サーキットブレーカーが開いたら残りのタスクもまとめてキャンセルされる
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(_fetch_single_item(
+                    estat_client=estat_client,
+                    stats_data_id=stats_data_id,
+                    item_name=name,
+                    item_code=code,
+                    cd_time=cd_time,
+                    class_key=class_key,
+                ))
+                for name, code in food_items.items()
+            ]
+    except* EStatUnavailableError as eg:
+        raise eg.exceptions[0] from None
+
+    rows = [
+        (code, DEFAULT_AREA_CODE, cd_time, price, unit)
+        for t in tasks if (r := t.result()) is not None
+        for code, price, unit in [r]
+    ]
+    return _build_cube(food_items, [DEFAULT_AREA_CODE], [cd_time], rows)
+
+
+def _target_area_codes() -> list[str]:
+    """キューブに含める地域コード（先頭が代表地域）"""
+    codes = [c.strip() for c in settings.MARKET_DATA_AREAS.split(",") if c.strip()]
+    if DEFAULT_AREA_CODE not in codes:
+        codes.insert(0, DEFAULT_AREA_CODE)
+    return codes
+
+
+def _months_before(time_code: str, months: int) -> str:
+    """時間コードから months ヶ月前の時間コードを返します。"""
+    y, m = int(time_code[:4]), int(time_code[6:8])
+    total = y * 12 + (m - 1) - months
+    return time_code_from_yyyymm(f"{total // 12:04d}{total % 12 + 1:02d}")
 
 
 def _get_current_time_code() -> str:
@@ -78,15 +208,180 @@ def _get_current_time_code() -> str:
     return f"{year}00{month:02d}{month:02d}"
 
 
+class MarketDataUnavailableError(Exception):
+    """e-Stat から市場データを1件も取得できなかったことを示す例外"""
+
+
+async def _refresh_market_data(estat_client: EStatClient) -> list[dict[str, str | float]]:
+    """
+    e-Stat APIから全品目の市場価格を取得し、キャッシュとスナップショットを更新
+
+    取得に失敗した場合は例外を送出します（フォールバックは呼び出し側で行う）。
+    """
+    # 統計表IDを取得
+    stats_data_id = await estat_client.pick_stats_data_id()
+    logger.info(f"統計表ID: {stats_data_id}")
+
+    # 品目分類マップを取得
+    # 統計表によってcat01またはcat02に品目が格納されている
+    class_maps = await estat_client.get_class_maps(stats_data_id)
+    item_class_key = "cat01"
+    items: Mapping[str, str] = class_maps.get("cat01", {})
+    # cat01が1件以下の場合はcat02を使用（品目データは通常cat02に格納）
+    if len(items) <= 1:
+        item_class_key = "cat02"
+        items = class_maps.get("cat02", {})
+
+    if not items:
+        raise MarketDataUnavailableError("品目が見つかりませんでした")
+
+    # 食料品目のみ抽出（コードが1で始まるもの）& 調査終了品目を除外
+    food_items = {
+        name: code for name, code in items.items()
+        if code.startswith(FOOD_CODE_PREFIXES) and "調査終了" not in name
+    }
+    logger.info(f"取得対象品目数: {len(food_items)}/{len(items)} (食料品目のみ、調査終了除外)")
+
+    # 対象期間（最新月から MARKET_DATA_MONTHS ヶ月分）と対象地域
+    cd_time = _get_current_time_code()
+    time_from = _months_before(cd_time, max(1, settings.MARKET_DATA_MONTHS) - 1)
+    area_codes = _target_area_codes()
+    logger.info(f"時間コード: {time_from}〜{cd_time}, 地域: {','.join(area_codes)}")
+
+    cube: PriceCube | None = None
+    try:
+        # まとめて取得（数回のリクエストで全品目 × 全地域 × 全期間分）
+        cube = await _fetch_price_cube_bulk(
+            estat_client=estat_client,
+            stats_data_id=stats_data_id,
+            food_items=food_items,
+            area_codes=area_codes,
+            time_from=time_from,
+            time_to=cd_time,
+            class_key=item_class_key,
+        )
+    except EStatUnavailableError:
+        raise
+    except HTTPException as e:
+        logger.warning(f"一括取得に失敗しました: {e.detail}")
+
+    if cube is None or not len(cube):
+        # bulk取得できなかった場合は1品目ずつの取得に切り替える
+        logger.info("品目ごとの取得に切り替えます")
+        cube = await _fetch_price_cube_individually(
+            estat_client=estat_client,
+            stats_data_id=stats_data_id,
+            food_items=food_items,
+            cd_time=cd_time,
+            class_key=item_class_key,
+        )
+
+    # 従来どおりの一覧（代表地域の最新月）はプロンプトなどで使う
+    latest_time = cube.latest_time_code_with_data(DEFAULT_AREA_CODE)
+    market_data = cube.rows(DEFAULT_AREA_CODE, latest_time) if latest_time else []
+
+    logger.info(
+        f"市場データ取得完了: {len(market_data)}/{len(food_items)}品目 "
+        f"(キューブ: {len(cube)}品目 × {len(cube.area_codes)}地域 × {len(cube.time_codes)}ヶ月)"
+    )
+
+    if not market_data:
+        raise MarketDataUnavailableError("市場データが1件も取得できませんでした")
+
+    # キャッシュを更新
+    cube_payload = cube.to_payload()
+    _set_cache(market_data, cube, time.time(), compute_data_version(market_data, cube_payload["values"]))
+
+    # スナップショットをディスクに保存（失敗してもメモリ上のキャッシュは使える）
+    if settings.MARKET_DATA_SNAPSHOT_PATH:
+        try:
+            await asyncio.to_thread(
+                save_snapshot,
+                settings.MARKET_DATA_SNAPSHOT_PATH,
+                market_data,
+                _cache_timestamp,
+                CACHE_TTL,
+                cube_payload,
+            )
+            logger.info(f"市場データのスナップショットを保存しました: {settings.MARKET_DATA_SNAPSHOT_PATH}")
+        except OSError as e:
+            logger.warning(f"スナップショットの保存に失敗しました: {e}")
+
+    return market_data
+
+
+def _set_cache(
+    market_data: list[dict[str, str | float]],
+    cube: PriceCube | None,
+    timestamp: float,
+    version: str,
+) -> None:
+    """メモリキャッシュ（一覧・キューブ・バージョン）をまとめて差し替えます。"""
+    global _market_data_cache, _price_cube, _rows_cache, _cache_timestamp, _cache_version
+    _market_data_cache = market_data
+    _price_cube = cube
+    _rows_cache = {}
+    _cache_timestamp = timestamp
+    _cache_version = version
+
+
+async def _tracked_refresh(estat_client: EStatClient) -> list[dict[str, str | float]]:
+    """更新処理を実行し、所要時間や失敗回数を _refresh_status に記録します。"""
+    started = time.time()
+    _refresh_status["running"] = True
+    _refresh_status["last_attempt_at"] = started
+    try:
+        market_data = await _refresh_market_data(estat_client)
+    except Exception as e:
+        _refresh_status["consecutive_failures"] += 1
+        _refresh_status["total_failures"] += 1
+        _refresh_status["last_error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        _refresh_status["running"] = False
+        _refresh_status["last_duration_sec"] = round(time.time() - started, 3)
+
+    _refresh_status["last_success_at"] = _cache_timestamp
+    _refresh_status["item_count"] = len(market_data)
+    _refresh_status["consecutive_failures"] = 0
+    _refresh_status["last_error"] = None
+    return market_data
+
+
+def _on_refresh_done(task: asyncio.Task[list[dict[str, str | float]]]) -> None:
+    # 待機者がいなくなった場合でも例外が「未取得」として警告されないよう回収しておく
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"市場データ更新タスクが失敗しました: {task.exception()}")
+
+
+def _start_or_join_refresh(estat_client: EStatClient) -> asyncio.Task[list[dict[str, str | float]]]:
+    """
+    実行中の更新タスクがあればそれを返し、なければ新しく開始します（シングルフライト）
+
+    1プロセス内で同時に走る e-Stat の全件取得は常に1つだけになります。
+    """
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_tracked_refresh(estat_client))
+        _refresh_task.add_done_callback(_on_refresh_done)
+    else:
+        logger.debug("実行中の市場データ更新に合流します")
+    return _refresh_task
+
+
 async def fetch_all_market_data(
     estat_client: EStatClient | None = None,
 ) -> list[dict[str, str | float]]:
     """
     e-Stat APIから全品目の市場価格を取得（キャッシュ付き）
 
+    キャッシュが期限切れの場合は古いデータをそのまま返し、裏で更新を開始します（stale-while-revalidate）。
+    キャッシュが空の場合のみ更新を待ち、同時に呼ばれたリクエストは1つの更新処理を共有します。
     戻り値: [{"item_name": "鶏卵", "price": 280.0, "unit": "パック(10個)"}, ...]
     """
-    global _market_data_cache, _cache_timestamp
+    # 起動直後はディスク上のスナップショットからウォームスタート
+    if not _snapshot_loaded:
+        load_market_data_snapshot()
 
     # キャッシュが有効ならそれを返す
     if _market_data_cache and (time.time() - _cache_timestamp) < CACHE_TTL:
@@ -96,63 +391,15 @@ async def fetch_all_market_data(
     if estat_client is None:
         estat_client = EStatClient()
 
-    try:
-        # 統計表IDを取得
-        stats_data_id = await estat_client.pick_stats_data_id()
-        logger.info(f"統計表ID: {stats_data_id}")
-
-        # 品目分類マップを取得
-        # 統計表によってcat01またはcat02に品目が格納されている
-        class_maps = await estat_client.get_class_maps(stats_data_id)
-        item_class_key = "cat01"
-        items = class_maps.get("cat01", {})
-        # cat01が1件以下の場合はcat02を使用（品目データは通常cat02に格納）
-        if len(items) <= 1:
-            item_class_key = "cat02"
-            items = class_maps.get("cat02", {})
-
-        if not items:
-            logger.warning("品目が見つかりませんでした")
-            return _market_data_cache if _market_data_cache else []
-
-        # 食料品目のみ抽出（コードが1で始まるもの）& 調査終了品目を除外
-        food_items = {
-            name: code for name, code in items.items()
-            if code.startswith(FOOD_CODE_PREFIXES) and "調査終了" not in name
-        }
-        logger.info(f"取得対象品目数: {len(food_items)}/{len(items)} (食料品目のみ、調査終了除外)")
-
-        # 現在の時間コード
-        cd_time = _get_current_time_code()
-        logger.info(f"時間コード: {cd_time}")
-
-        # 並列で価格を取得
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-        tasks = [
-            _fetch_single_item(
-                estat_client=estat_client,
-                stats_data_id=stats_data_id,
-                item_name=name,
-                item_code=code,
-                cd_time=cd_time,
-                class_key=item_class_key,
-                semaphore=semaphore,
-            )
-            for name, code in food_items.items()
-        ]
-
-        results = await asyncio.gather(*tasks)
-
-        # Noneを除外
-        market_data = [r for r in results if r is not None]
-
-        logger.info(f"市場データ取得完了: {len(market_data)}/{len(food_items)}品目")
-
-        # キャッシュを更新
-        _market_data_cache = market_data
-        _cache_timestamp = time.time()
+    # 期限切れでもデータがあれば即座に返し、更新はバックグラウンドで行う
+    if _market_data_cache:
+        logger.debug(f"期限切れの市場データを返し、バックグラウンドで更新します ({len(_market_data_cache)}品目)")
+        _start_or_join_refresh(estat_client)
+        return _market_data_cache
 
-        return market_data
+    try:
+        # shield: 1つのリクエストがキャンセルされても共有中の更新処理は止めない
+        return await asyncio.shield(_start_or_join_refresh(estat_client))
 
     except Exception as e:
         logger.error(f"市場データ取得エラー: {e}")
@@ -163,6 +410,195 @@ async def fetch_all_market_data(
         return []
 
 
+def _seconds_until_next_refresh() -> float:
+    """次回のバックグラウンド更新までの秒数を計算します。"""
+    if not _market_data_cache:
+        return 0.0
+    due_at = _cache_timestamp + CACHE_TTL - settings.MARKET_DATA_REFRESH_AHEAD
+    return max(0.0, due_at - time.time())
+
+
+async def _refresh_scheduler_loop(estat_client: EStatClient) -> None:
+    """期限切れより前に市場データを更新し続けるループ"""
+    # 起動直後は待たずに更新してよいが、2回目以降は前回の更新（成功・失敗とも）から
+    # 最低 MARKET_DATA_RETRY_INTERVAL 秒あける（MARKET_DATA_REFRESH_AHEAD >= CACHE_TTL でも e-Stat を連打しない）
+    min_delay = 0.0
+    while True:
+        delay = max(_seconds_until_next_refresh(), min_delay)
+        min_delay = max(1.0, float(settings.MARKET_DATA_RETRY_INTERVAL))
+        if delay > 0:
+            logger.debug(f"次回の市場データ更新まで {delay:.0f}秒")
+            await asyncio.sleep(delay)
+
+        try:
+            await asyncio.shield(_start_or_join_refresh(estat_client))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"バックグラウンドでの市場データ更新に失敗しました: {e}")
+
+
+def start_market_data_refresher(estat_client: EStatClient) -> None:
+    """
+    市場データのバックグラウンド更新を開始します（アプリ起動時に呼び出す）
+    """
+    global _scheduler_task
+    if _scheduler_task is not None and not _scheduler_task.done():
+        return
+    _scheduler_task = asyncio.create_task(_refresh_scheduler_loop(estat_client))
+    logger.info("市場データのバックグラウンド更新を開始しました")
+
+
+async def stop_market_data_refresher() -> None:
+    """
+    市場データのバックグラウンド更新を停止します（アプリ終了時に呼び出す）
+    """
+    global _scheduler_task
+    for task in (_scheduler_task, _refresh_task):
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.warning(f"市場データの更新タスクの停止中にエラーが発生しました: {e}")
+    _scheduler_task = None
+    logger.info("市場データのバックグラウンド更新を停止しました")
+
+
+def get_market_data_status() -> dict[str, Any]:
+    """
+    市場データの更新状態を取得（/health 用）
+    """
+    age = time.time() - _cache_timestamp if _market_data_cache else None
+    return {
+        **_refresh_status,
+        "cached_items": len(_market_data_cache),
+        "cache_age_sec": round(age, 1) if age is not None else None,
+        "stale": age is None or age >= CACHE_TTL,
+        "version": _cache_version,
+        "scheduler_running": _scheduler_task is not None and not _scheduler_task.done(),
+    }
+
+
+def load_market_data_snapshot() -> bool:
+    """
+    ディスク上のスナップショットをメモリキャッシュに読み込みます（API呼び出しなし）
+
+    保存時刻をキャッシュの取得時刻として扱うため、TTLを過ぎたスナップショットは
+    次回の fetch_all_market_data で再取得の対象になります（取得失敗時はフォールバックに使用）。
+    戻り値: 読み込めたかどうか
+    """
+    global _snapshot_loaded
+    _snapshot_loaded = True
+
+    if not settings.MARKET_DATA_SNAPSHOT_PATH:
+        return False
+
+    payload = load_snapshot(settings.MARKET_DATA_SNAPSHOT_PATH, settings.MARKET_DATA_SNAPSHOT_MAX_AGE)
+    if payload is None:
+        return False
+
+    items = [r for r in payload["items"] if isinstance(r, dict)]
+    if not items:
+        return False
+
+    # 既により新しいデータを持っている場合は上書きしない
+    if _market_data_cache and _cache_timestamp >= float(payload["saved_at"]):
+        return False
+
+    cube: PriceCube | None = None
+    if isinstance(payload.get("cube"), dict):
+        try:
+            cube = PriceCube.from_payload(payload["cube"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"スナップショットのキューブを復元できませんでした: {e}")
+
+    _set_cache(items, cube, float(payload["saved_at"]), str(payload.get("version") or compute_data_version(items)))
+    age = time.time() - _cache_timestamp
+    logger.info(f"市場データをスナップショットから復元しました ({len(items)}品目, {age:.0f}秒前)")
+    return True
+
+
+def get_market_data_version() -> str:
+    """
+    現在キャッシュされている市場データのバージョン（内容ハッシュ）を取得
+    """
+    return _cache_version
+
+
+def get_price_cube() -> PriceCube | None:
+    """
+    品目 × 地域 × 時間 の価格キューブを取得（API呼び出しなし）
+    """
+    return _price_cube
+
+
+def get_market_data_for(
+    purchase_date: str | None = None,
+    area_code: str | None = None,
+) -> list[dict[str, str | float]]:
+    """
+    購入日（YYYY-MM-DD）と地域コードに対応する市場データ一覧を取得（API呼び出しなし）
+
+    購入月のデータがなければそれ以前の直近月、キューブがなければ代表地域の最新月を返します。
+    """
+    cube = _price_cube
+    if cube is None:
+        return _market_data_cache
+
+    area = area_code or DEFAULT_AREA_CODE
+    yyyymm = purchase_date.replace("-", "")[:6] if purchase_date else None
+    time_code = cube.resolve_time_code(yyyymm)
+    if time_code is None:
+        return _market_data_cache
+
+    key = (area, time_code)
+    rows = _rows_cache.get(key)
+    if rows is None:
+        rows = cube.rows(area, time_code)
+        _rows_cache[key] = rows
+    return rows or _market_data_cache
+
+
+def lookup_market_price(
+    item_name: str,
+    purchase_date: str | None = None,
+    area_code: str | None = None,
+) -> dict[str, str | float] | None:
+    """
+    品目名・購入日・地域から市場価格を O(1) で引きます（API呼び出しなし）
+
+    戻り値: {"item_name": ..., "price": ..., "unit": ..., ("base_unit": ..., "base_price": ...,) "area_code": ..., "time_code": ...}
+    """
+    cube = _price_cube
+    if cube is None:
+        return None
+    item_code = cube.item_code_for_name(item_name)
+    if item_code is None:
+        return None
+
+    area = area_code or DEFAULT_AREA_CODE
+    yyyymm = purchase_date.replace("-", "")[:6] if purchase_date else None
+    time_code = cube.resolve_time_code(yyyymm)
+    if time_code is None:
+        return None
+    hit = cube.get_at_or_before(item_code, area, time_code)
+    if hit is None and area != DEFAULT_AREA_CODE:
+        # 指定地域に値がない品目は代表地域の値で代用する
+        area = DEFAULT_AREA_CODE
+        hit = cube.get_at_or_before(item_code, area, time_code)
+    if hit is None:
+        return None
+    price, used_time_code = hit
+    return {
+        **market_row(item_name, price, cube.unit_for(item_code)),
+        "area_code": area,
+        "time_code": used_time_code,
+    }
+
+
 def get_cached_market_data() -> list[dict[str, str | float]]:
     """
     キャッシュされた市場データを取得（API呼び出しなし）
@@ -174,7 +610,5 @@ def clear_market_data_cache() -> None:
     """
     市場データキャッシュをクリア
     """
-    global _market_data_cache, _cache_timestamp
-    _market_data_cache = []
-    _cache_timestamp = 0
+    _set_cache([], None, 0, "")
     logger.info("市場データキャッシュをクリアしました")
@@ -0,0 +1,89 @@
+"""
+市場価格データのスナップショットをディスクに保存・読込するモジュール
+
+再起動やワーカー追加のたびに e-Stat への全件取得が走らないよう、
+最後に取得できた市場データをJSONファイルとして保持します。
+"""
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+from utils.files import write_json_atomic
+
+# スナップショットの形式バージョン（互換性のない変更時に上げる）
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def compute_data_version(items: list[dict[str, str | float]], extra: str = "") -> str:
+    """市場データの内容（と任意の追加データ）から短いバージョン文字列（ハッシュ）を計算します。"""
+    raw = json.dumps(items, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    h = hashlib.sha1(raw.encode("utf-8"))
+    h.update(extra.encode("utf-8"))
+    return h.hexdigest()[:12]
+
+
+def load_snapshot(path: str, max_age: float) -> dict[str, Any] | None:
+    """
+    スナップショットを読み込みます。
+
+    ファイルが存在しない・形式が異なる・max_age 秒より古い場合は None を返します。
+    """
+    p = Path(path)
+    if not p.is_file():
+        return None
+
+    try:
+        with p.open("r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"スナップショットの読込に失敗しました: {p} - {e}")
+        return None
+
+    if not isinstance(payload, dict) or payload.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        logger.info(f"スナップショットの形式が異なるため無視します: {p}")
+        return None
+
+    saved_at = payload.get("saved_at")
+    items = payload.get("items")
+    if not isinstance(saved_at, (int, float)) or not isinstance(items, list):
+        logger.warning(f"スナップショットの内容が不正です: {p}")
+        return None
+
+    age = time.time() - saved_at
+    if age > max_age:
+        logger.info(f"スナップショットが古すぎるため無視します: {p} ({age:.0f}秒経過)")
+        return None
+
+    return payload
+
+
+def save_snapshot(
+    path: str,
+    items: list[dict[str, str | float]],
+    saved_at: float,
+    ttl: float,
+    cube: dict[str, Any] | None = None,
+) -> str:
+    """
+    スナップショットをアトミックに書き込みます（一時ファイル → os.replace）。
+
+    cube には PriceCube.to_payload() の結果を渡します。
+    戻り値: 保存したデータのバージョン文字列
+    """
+    version = compute_data_version(items, cube["values"] if cube else "")
+    payload = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "saved_at": saved_at,
+        "ttl": ttl,
+        "item_count": len(items),
+        "items": items,
+        "cube": cube,
+    }
+
+    write_json_atomic(path, payload)
+    return version
+
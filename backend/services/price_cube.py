@@ -0,0 +1,205 @@
+"""
+品目 × 地域 × 時間 の市場価格を保持する配列ベースのキューブ
+
+値は array('d') 1本に詰めて保持し、(品目, 地域, 時間) の各インデックスから
+位置を計算して O(1) で参照します。値のないセルは NaN です。
+"""
+import base64
+import math
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Any
+
+from loguru import logger
+from schemas.units import base_price
+
+# キューブの形式バージョン（スナップショットに埋め込む）
+CUBE_FORMAT_VERSION = 1
+
+
+def time_code_from_yyyymm(yyyymm: str) -> str:
+    """YYYYMM を e-Stat の時間コード（YYYY00MMMM）に変換します。"""
+    return f"{yyyymm[:4]}00{yyyymm[4:6]}{yyyymm[4:6]}"
+
+
+def market_row(item_name: str, price: float, unit: str) -> dict[str, str | float]:
+    """市場データ1件の dict を作ります（単位を解析できれば基準単位あたりの価格を付ける）。"""
+    row: dict[str, str | float] = {"item_name": item_name, "price": price, "unit": unit}
+    base = base_price(price, unit)
+    if base is not None:
+        row["base_unit"], row["base_price"] = base
+    return row
+
+
+class PriceCube:
+    """
+    (品目コード, 地域コード, 時間コード) → 価格 の3次元配列
+
+    品目名・単位は品目ごとに1つだけ保持します。
+    """
+
+    def __init__(
+        self,
+        items: list[tuple[str, str, str]],
+        area_codes: list[str],
+        time_codes: list[str],
+        values: array | None = None,
+    ) -> None:
+        # items: [(品目コード, 品目名, 単位), ...]
+        self._item_codes = [sys.intern(code) for code, _, _ in items]
+        self._item_names = [sys.intern(name) for _, name, _ in items]
+        self._units = [sys.intern(unit) for _, _, unit in items]
+        self._area_codes = [sys.intern(a) for a in area_codes]
+        # 時間コードは昇順に並べておき、指定月以前の最新月を二分探索で探せるようにする
+        self._time_codes = sorted(sys.intern(t) for t in time_codes)
+
+        self._item_index = {code: i for i, code in enumerate(self._item_codes)}
+        # 整形後の品目名が重なった場合は先の品目を使う（後の品目はコードでのみ引ける）
+        self._name_index: dict[str, int] = {}
+        for i, name in enumerate(self._item_names):
+            first = self._name_index.setdefault(name, i)
+            if first != i:
+                logger.warning(
+                    f"品目名が重複しています: {name} ({self._item_codes[first]} を使い、{self._item_codes[i]} は名前では引けません)"
+                )
+        self._area_index = {a: i for i, a in enumerate(self._area_codes)}
+        self._time_index = {t: i for i, t in enumerate(self._time_codes)}
+
+        self._n_areas = len(self._area_codes)
+        self._n_times = len(self._time_codes)
+        size = len(self._item_codes) * self._n_areas * self._n_times
+        if values is None:
+            values = array("d", [math.nan]) * size
+        elif len(values) != size:
+            raise ValueError(f"キューブのサイズが一致しません: {len(values)} != {size}")
+        self._values = values
+
+    def __len__(self) -> int:
+        return len(self._item_codes)
+
+    @property
+    def area_codes(self) -> list[str]:
+        return list(self._area_codes)
+
+    @property
+    def time_codes(self) -> list[str]:
+        return list(self._time_codes)
+
+    def _offset(self, item_i: int, area_i: int, time_i: int) -> int:
+        return (item_i * self._n_areas + area_i) * self._n_times + time_i
+
+    def set(self, item_code: str, area_code: str, time_code: str, price: float) -> None:
+        i = self._item_index.get(item_code)
+        a = self._area_index.get(area_code)
+        t = self._time_index.get(time_code)
+        if i is None or a is None or t is None:
+            return
+        self._values[self._offset(i, a, t)] = price
+
+    def get(self, item_code: str, area_code: str, time_code: str) -> float | None:
+        """指定セルの価格を返します（値がなければ None）。"""
+        i = self._item_index.get(item_code)
+        a = self._area_index.get(area_code)
+        t = self._time_index.get(time_code)
+        if i is None or a is None or t is None:
+            return None
+        v = self._values[self._offset(i, a, t)]
+        return None if math.isnan(v) else v
+
+    def get_at_or_before(self, item_code: str, area_code: str, time_code: str) -> tuple[float, str] | None:
+        """
+        指定月以前で最も新しい価格を返します（遡る月数はキューブの月数が上限）。
+
+        戻り値: (価格, 実際に使った時間コード)
+        """
+        i = self._item_index.get(item_code)
+        a = self._area_index.get(area_code)
+        t = self._time_index.get(time_code)
+        if i is None or a is None or t is None:
+            return None
+        base = self._offset(i, a, 0)
+        for tt in range(t, -1, -1):
+            v = self._values[base + tt]
+            if not math.isnan(v):
+                return v, self._time_codes[tt]
+        return None
+
+    def item_code_for_name(self, item_name: str) -> str | None:
+        i = self._name_index.get(item_name)
+        return self._item_codes[i] if i is not None else None
+
+    def unit_for(self, item_code: str) -> str:
+        i = self._item_index.get(item_code)
+        return self._units[i] if i is not None else ""
+
+    def resolve_time_code(self, yyyymm: str | None) -> str | None:
+        """
+        指定年月以前で最も新しい時間コードを返します（未指定なら最新月）。
+
+        統計の公表は1〜2ヶ月遅れるため、購入月のデータがなければ直近の月を使います。
+        """
+        if not self._time_codes:
+            return None
+        if not yyyymm:
+            return self._time_codes[-1]
+        code = time_code_from_yyyymm(yyyymm)
+        if code in self._time_index:
+            return code
+        pos = bisect_right(self._time_codes, code)
+        # 購入月がキューブの範囲より古い場合は最も古い月を使う
+        return self._time_codes[pos - 1] if pos > 0 else self._time_codes[0]
+
+    def latest_time_code_with_data(self, area_code: str) -> str | None:
+        """指定地域で1件以上の価格がある最新の時間コードを返します。"""
+        a = self._area_index.get(area_code)
+        if a is None:
+            return None
+        for t in range(self._n_times - 1, -1, -1):
+            for i in range(len(self._item_codes)):
+                if not math.isnan(self._values[self._offset(i, a, t)]):
+                    return self._time_codes[t]
+        return None
+
+    def rows(self, area_code: str, time_code: str) -> list[dict[str, str | float]]:
+        """
+        指定地域・時間の全品目を市場データ形式（item_name, price, unit）で返します。
+
+        その月の値がない品目は、それ以前で最も新しい月の値を使います。
+        単位を解析できた品目には基準単位あたりの価格（base_unit, base_price。例: "100g", 25.8）も付けます。
+        """
+        a = self._area_index.get(area_code)
+        t = self._time_index.get(time_code)
+        if a is None or t is None:
+            return []
+        out: list[dict[str, str | float]] = []
+        for i, name in enumerate(self._item_names):
+            base = self._offset(i, a, 0)
+            for tt in range(t, -1, -1):
+                v = self._values[base + tt]
+                if not math.isnan(v):
+                    out.append(market_row(name, v, self._units[i]))
+                    break
+        return out
+
+    def to_payload(self) -> dict[str, Any]:
+        """スナップショット保存用の dict に変換します（値配列は base64 で埋め込む）。"""
+        return {
+            "format_version": CUBE_FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "items": [list(x) for x in zip(self._item_codes, self._item_names, self._units)],
+            "areas": self._area_codes,
+            "times": self._time_codes,
+            "values": base64.b64encode(self._values.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict[str, Any]) -> "PriceCube":
+        if payload.get("format_version") != CUBE_FORMAT_VERSION:
+            raise ValueError("キューブの形式が異なります")
+        values = array("d")
+        values.frombytes(base64.b64decode(payload["values"]))
+        if payload.get("byteorder") != sys.byteorder:
+            values.byteswap()
+        items = [(str(c), str(n), str(u)) for c, n, u in payload["items"]]
+        return cls(items, list(payload["areas"]), list(payload["times"]), values)
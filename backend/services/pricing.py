@@ -0,0 +1,445 @@
+"""
+レシート商品の価格比較をローカルで行うモジュール
+
+Gemini にはレシートの読取（商品名・支払単価・個数）だけを任せ、
+名寄せ・市場価格の参照・差額/倍率/判定/サマリーの計算は Python で行います。
+ローカルで市場価格と比較できなかった商品だけを、画像なしで Gemini に問い合わせます。
+"""
+import re
+import threading
+from datetime import datetime
+from collections import OrderedDict
+from typing import Any
+
+from config import settings
+from loguru import logger
+from model import PreparedImage, extract_receipt_items, price_items_with_model
+from schemas import (
+    classify_to_code,
+    fuzzy_candidates,
+    guess_canonical,
+    normalize_text,
+    parse_receipt_text,
+    resolve_canonical,
+    search_class_names,
+)
+from schemas.class_map import ClassMap
+from schemas.rules_engine import CompiledRules, get_rules
+from schemas.units import Measure, format_measure, is_mass_or_volume, parse_size, parse_unit
+
+from .market_data import get_market_data_for, get_market_data_version, lookup_market_price
+
+# 判定基準（倍率 = 支払額 / 市場適正価格）
+OVERPAY_RATE = 1.05
+DEAL_RATE = 0.95
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# Gemini に渡す市場データを絞り込むときの、1商品あたりのあいまい検索の候補数と最低類似度
+# （名寄せより緩くして、関係しそうな品目を広めに拾う）
+_PROMPT_FUZZY_TOP_K = 3
+_PROMPT_FUZZY_MIN_SCORE = 0.5
+
+
+def judge(rate: float | None) -> str:
+    """倍率から DEAL / FAIR / OVERPAY を判定します。"""
+    if rate is None:
+        return "FAIR"
+    if rate >= OVERPAY_RATE:
+        return "OVERPAY"
+    if rate <= DEAL_RATE:
+        return "DEAL"
+    return "FAIR"
+
+
+def compare_price(
+    paid_unit_price: float | None,
+    quantity: float,
+    stat_price: float | None,
+    stat_unit: str | None,
+    note: str | None = None,
+) -> dict[str, Any]:
+    """
+    支払額と市場適正価格（購入数量分）から estat 欄（差額・倍率・判定）を組み立てます。
+
+    diff = 市場適正価格 - 支払額（プラスならお得）、rate = 支払額 / 市場適正価格
+    """
+    if paid_unit_price is None or not stat_price:
+        return {
+            "found": stat_price is not None,
+            "stat_price": stat_price,
+            "stat_unit": stat_unit,
+            "diff": None,
+            "rate": None,
+            "judgement": "FAIR",
+            "note": note,
+        }
+    paid = paid_unit_price * quantity
+    rate = paid / stat_price
+    return {
+        "found": True,
+        "stat_price": round(stat_price, 2),
+        "stat_unit": stat_unit,
+        "diff": round(stat_price - paid, 2),
+        "rate": round(rate, 4),
+        "judgement": judge(rate),
+        "note": note,
+    }
+
+
+def summarize(items: list[dict[str, Any]]) -> dict[str, float]:
+    """商品ごとの比較結果からサマリー（支払総額・割高支払い総額・節約総額）を計算します。"""
+    total_payment = 0.0
+    total_overpaid = 0.0
+    total_saved = 0.0
+    for item in items:
+        price = item.get("paid_unit_price")
+        if price is not None:
+            total_payment += price * (item.get("quantity") or 1.0)
+        estat = item.get("estat") or {}
+        diff = estat.get("diff")
+        if diff is None:
+            continue
+        if estat.get("judgement") == "OVERPAY":
+            total_overpaid += abs(diff)
+        elif estat.get("judgement") == "DEAL":
+            total_saved += abs(diff)
+    return {
+        "total_payment": round(total_payment, 2),
+        "total_overpaid_amount": round(total_overpaid, 2),
+        "total_saved_amount": round(total_saved, 2),
+    }
+
+
+class MarketNameResolver:
+    """
+    レシート記載名 → 市場データの品目名 の名寄せ器（市場データ一覧ごとに1つ）
+
+    市場データの品目名を「名前 → 名前」の分類マップにして、名寄せの検索関数をそのまま使います。
+    同じ店・同じ商品のレシートが続くことが多いので、結果を上限付きで覚えておきます。
+    テキストの一括解析は別スレッドで動くため、覚えた結果の読み書きはロックで守ります。
+    """
+
+    def __init__(self, names: tuple[str, ...], cache_size: int = 4096) -> None:
+        self.class_maps: dict[str, ClassMap] = {"cat01": ClassMap(names, names)}
+        self._cache: OrderedDict[str, str | None] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def resolve(self, raw_name: str) -> str | None:
+        """レシート記載名を市場データの品目名に名寄せします（見つからなければ None）。"""
+        with self._lock:
+            if raw_name in self._cache:
+                self._cache.move_to_end(raw_name)
+                return self._cache[raw_name]
+
+        # resolve_canonical はルールで名寄せできれば canonical だけを、
+        # 検索で見つかれば市場データの品目名を class_code に入れて返す
+        resolution = resolve_canonical(raw_name, self.class_maps)
+        market_name = resolution.class_code
+        if market_name is None and resolution.canonical:
+            hit = classify_to_code(self.class_maps, resolution.canonical)
+            market_name = hit[1] if hit else None
+
+        with self._lock:
+            self._cache[raw_name] = market_name
+            self._cache.move_to_end(raw_name)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return market_name
+
+
+def unit_ratio(raw_name: str, market_name: str, market_unit: str) -> tuple[float, Measure | None] | None:
+    """
+    レシートの商品1つが市場データの単位の何倍にあたるかを返します（換算できなければ None）。
+
+    品名に内容量・入数（"1000ml", "10個入" など）があればそれを、なければ品目の既定の数え方
+    （重量表の先頭、例: たまねぎ 1個 = 200g）を使います。市場データが個数単位で品名に記載がない場合は、
+    従来どおり1つ = 市場データの1単位とみなします。
+    戻り値: (倍率, 換算に使った商品側の数量)
+    """
+    market = parse_unit(market_unit)
+    if market is None:
+        return None
+    size = parse_size(raw_name)
+    if size is None and not is_mass_or_volume(market[1]):
+        return 1.0, None
+
+    units = get_rules().units
+
+    def convert(name: str) -> tuple[float, Measure | None] | None:
+        src = size or units.default_measure(name)
+        if src is None:
+            return None
+        ratio = units.ratio(name, src, market)
+        return (ratio, src) if ratio is not None else None
+
+    # 重量表は市場データの品目名で引き、なければルールの canonical で引く
+    converted = convert(market_name)
+    if converted is None:
+        canonical = guess_canonical(raw_name)
+        if canonical and canonical != market_name:
+            converted = convert(canonical)
+    return converted
+
+
+def price_item_locally(
+    item: dict[str, Any],
+    purchase_date: str | None,
+    area_code: str | None,
+    market_rows: dict[str, dict[str, str | float]],
+    resolver: MarketNameResolver,
+) -> dict[str, Any] | None:
+    """
+    1商品をローカルで市場価格と比較します。
+
+    名寄せできない・市場価格がない・単位を換算できない場合は None を返します。
+    """
+    raw_name = str(item.get("raw_name") or "")
+    paid_unit_price = item.get("paid_unit_price")
+    quantity = float(item.get("quantity") or 1.0)
+    if not raw_name or paid_unit_price is None:
+        return None
+
+    market_name = resolver.resolve(raw_name)
+    if market_name is None:
+        return None
+
+    hit = lookup_market_price(market_name, purchase_date, area_code) or market_rows.get(market_name)
+    if hit is None:
+        return None
+    unit = str(hit.get("unit") or "")
+    converted = unit_ratio(raw_name, market_name, unit)
+    if converted is None:
+        return None
+    ratio, size = converted
+
+    stat_price = float(hit["price"]) * ratio * quantity
+    note = "ローカル計算"
+    if size is not None:
+        note = f"ローカル計算（{format_measure(size)} = {unit} × {ratio:.3g}）"
+    return {
+        "raw_name": raw_name,
+        "canonical": market_name,
+        "paid_unit_price": float(paid_unit_price),
+        "quantity": quantity,
+        "estat": compare_price(float(paid_unit_price), quantity, stat_price, unit, note),
+    }
+
+
+# 直近に使った市場データ一覧と、その品目名 → 行 の対応表・名寄せ器（同じ一覧なら作り直さない）
+# 市場データ・品目ルールが差し替わったら作り直す（名前解決のキャッシュはルールに依存するため）
+_market_index_memo: tuple[
+    list[dict[str, str | float]], CompiledRules, dict[str, dict[str, str | float]], MarketNameResolver
+] | None = None
+
+
+def _market_index(
+    market_data: list[dict[str, str | float]],
+) -> tuple[dict[str, dict[str, str | float]], MarketNameResolver]:
+    global _market_index_memo
+    rules = get_rules()
+    memo = _market_index_memo
+    if memo is not None and memo[0] is market_data and memo[1] is rules:
+        return memo[2], memo[3]
+    rows = {str(row["item_name"]): row for row in market_data}
+    resolver = MarketNameResolver(tuple(rows))
+    _market_index_memo = (market_data, rules, rows, resolver)
+    return rows, resolver
+
+
+def price_items_locally(
+    extracted: list[dict[str, Any]],
+    purchase_date: str | None,
+    area_code: str | None,
+) -> tuple[list[dict[str, Any] | None], list[dict[str, str | float]]]:
+    """
+    読み取った商品をまとめてローカルで比較します。
+
+    戻り値: (商品ごとの比較結果（解決できなければ None）, 比較に使った市場データ一覧)
+    """
+    date_for_market = purchase_date if purchase_date and _DATE_RE.match(purchase_date) else None
+    market_data = get_market_data_for(date_for_market, area_code)
+    market_rows, resolver = _market_index(market_data)
+    items = [
+        price_item_locally(item, date_for_market, area_code, market_rows, resolver) for item in extracted
+    ]
+    return items, market_data
+
+
+def relevant_market_rows(
+    names: list[str],
+    market_data: list[dict[str, str | float]],
+) -> list[dict[str, str | float]]:
+    """
+    Gemini に渡す市場データを、商品名に関係しそうな品目だけに絞ります（最大 MODEL_MARKET_ROWS_MAX 件）。
+
+    各商品について、ローカルの名寄せで見つかった品目と、品名の語（"伊右衛門 緑茶" の "緑茶" など）を
+    含む品目、あいまい検索の上位候補を集めます。
+    どの商品にも候補が見つからない場合や、絞り込みが無効（上限 0）の場合は全件を返します。
+    """
+    cap = settings.MODEL_MARKET_ROWS_MAX
+    if cap <= 0 or len(market_data) <= cap or not names:
+        return market_data
+
+    market_rows, resolver = _market_index(market_data)
+    picked: dict[str, None] = {}
+    # 名寄せで見つかった品目を先に、あいまい検索の候補をその後に（上限を超えたら後ろから落ちる）
+    for name in names:
+        hit = resolver.resolve(name)
+        if hit is not None:
+            picked.setdefault(hit)
+    for name in names:
+        for word in normalize_text(name).split(" "):
+            if len(word) >= 2:
+                for h in search_class_names(resolver.class_maps, word, limit=_PROMPT_FUZZY_TOP_K):
+                    picked.setdefault(h["code"])
+        for c in fuzzy_candidates(name, resolver.class_maps, k=_PROMPT_FUZZY_TOP_K, min_score=_PROMPT_FUZZY_MIN_SCORE):
+            if c["source"] == "rule":
+                code = classify_to_code(resolver.class_maps, str(c["canonical"]))
+                if code is not None:
+                    picked.setdefault(code[1])
+            else:
+                picked.setdefault(str(c["code"]))
+
+    if not picked:
+        logger.info(f"関係しそうな市場データが見つからないため全件を渡します: {len(market_data)}件")
+        return market_data
+    rows = [market_rows[n] for n in list(picked)[:cap] if n in market_rows]
+    logger.info(f"Gemini に渡す市場データを絞り込みました: {len(rows)}/{len(market_data)}件 ({len(names)}商品)")
+    return rows
+
+
+def _merge_model_item(item: dict[str, Any], model_item: dict[str, Any] | None) -> dict[str, Any]:
+    # 名寄せと市場適正価格はモデルの回答を使い、差額・倍率・判定はローカルで計算し直す
+    paid_unit_price = item.get("paid_unit_price")
+    quantity = float(item.get("quantity") or 1.0)
+    estat = (model_item or {}).get("estat") or {}
+    found = bool(estat.get("found")) and estat.get("stat_price") is not None
+    stat_price = float(estat["stat_price"]) if found else None
+    return {
+        "raw_name": str(item.get("raw_name") or ""),
+        "canonical": (model_item or {}).get("canonical") if found else None,
+        "paid_unit_price": paid_unit_price,
+        "quantity": quantity,
+        "estat": compare_price(
+            paid_unit_price, quantity, stat_price, estat.get("stat_unit") if found else None, estat.get("note")
+        ),
+    }
+
+
+async def _complete_with_model(
+    extracted: list[dict[str, Any]],
+    items: list[dict[str, Any] | None],
+    market_data: list[dict[str, str | float]],
+) -> int:
+    """ローカルで解決できなかった商品を Gemini に問い合わせて items を埋めます。戻り値: 問い合わせた件数"""
+    unresolved = [i for i, r in enumerate(items) if r is None]
+    if not unresolved:
+        return 0
+
+    model_input = [
+        {
+            "raw_name": extracted[i].get("raw_name"),
+            "paid_unit_price": extracted[i].get("paid_unit_price"),
+            "quantity": extracted[i].get("quantity") or 1.0,
+        }
+        for i in unresolved
+    ]
+    names = [str(extracted[i].get("raw_name") or "") for i in unresolved]
+    rows = relevant_market_rows(names, market_data)
+    # 絞り込まずに一覧をそのまま渡すときは、プロンプトの前半部分をバージョン単位で使い回す
+    data_version = get_market_data_version() if rows is market_data else None
+    model_items = await price_items_with_model(model_input, rows, data_version)
+    if len(model_items) != len(unresolved):
+        logger.warning(f"Gemini の回答件数が一致しません: {len(model_items)} != {len(unresolved)}")
+    by_name = {str(m.get("raw_name")): m for m in model_items if isinstance(m, dict)}
+    for pos, i in enumerate(unresolved):
+        model_item = model_items[pos] if len(model_items) == len(unresolved) else None
+        if model_item is None:
+            model_item = by_name.get(str(extracted[i].get("raw_name")))
+        items[i] = _merge_model_item(extracted[i], model_item)
+    return len(unresolved)
+
+
+def _receipt_result(
+    purchase_date: str,
+    store_name: str | None,
+    extracted: list[dict[str, Any]],
+    items: list[dict[str, Any] | None],
+) -> dict[str, Any]:
+    # 解決できなかった商品は「見つからなかった」として残す（支払総額には含める）
+    results = [r if r is not None else _merge_model_item(item, None) for item, r in zip(extracted, items)]
+    return {
+        "purchase_date": purchase_date,
+        "store_name": store_name,
+        "items": results,
+        "summary": summarize(results),
+    }
+
+
+def _purchase_date_or_today(value: Any) -> str:
+    """モデルが読み取った購入日が YYYY-MM-DD の実在する日付でなければ、今日の日付を使います（parse_receipt_text と同じ）。"""
+    text = str(value or "").strip()
+    if _DATE_RE.match(text):
+        try:
+            datetime.strptime(text, "%Y-%m-%d")
+            return text
+        except ValueError:
+            pass
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+async def analyze_receipt_locally_first(
+    file_bytes: bytes | PreparedImage,
+    area_code: str | None = None,
+) -> dict[str, Any]:
+    """
+    レシート画像を読み取り、ローカルで価格比較します（解決できない商品のみ Gemini に問い合わせ）。
+
+    戻り値は analyze_receipt_with_market_data と同じ形式（purchase_date, store_name, items, summary）です。
+    購入日が読み取れなかった場合は今日の日付にします。
+    """
+    extraction = await extract_receipt_items(file_bytes)
+    purchase_date = _purchase_date_or_today(extraction.get("purchase_date"))
+    extracted: list[dict[str, Any]] = [i for i in extraction.get("items", []) if isinstance(i, dict)]
+
+    items, market_data = price_items_locally(extracted, purchase_date, area_code)
+    by_model = await _complete_with_model(extracted, items, market_data)
+    logger.info(f"ローカル価格比較: {len(extracted) - by_model}件 / モデル: {by_model}件")
+    return _receipt_result(purchase_date, extraction.get("store_name"), extracted, items)
+
+
+def _extract_from_text(text: str) -> tuple[str, list[dict[str, Any]]]:
+    purchase_date, lines = parse_receipt_text(text)
+    return purchase_date, [
+        {"raw_name": name, "paid_unit_price": price, "quantity": 1.0} for name, price in lines
+    ]
+
+
+def analyze_receipt_text_locally(text: str, area_code: str | None = None) -> dict[str, Any]:
+    """
+    レシートのテキスト（電子レシート・OCR済みテキスト）をローカルだけで解析します。
+
+    モデルは呼ばず、名寄せできなかった商品は found=false のまま返します。
+    """
+    purchase_date, extracted = _extract_from_text(text)
+    items, _ = price_items_locally(extracted, purchase_date, area_code)
+    return _receipt_result(purchase_date, None, extracted, items)
+
+
+async def analyze_receipt_text(
+    text: str,
+    area_code: str | None = None,
+    use_model_fallback: bool = False,
+) -> dict[str, Any]:
+    """
+    レシートのテキストを解析します。
+
+    use_model_fallback が true なら、ローカルで解決できなかった商品だけ Gemini に問い合わせます。
+    """
+    if not use_model_fallback:
+        return analyze_receipt_text_locally(text, area_code)
+    purchase_date, extracted = _extract_from_text(text)
+    items, market_data = price_items_locally(extracted, purchase_date, area_code)
+    await _complete_with_model(extracted, items, market_data)
+    return _receipt_result(purchase_date, None, extracted, items)
@@ -0,0 +1,266 @@
+"""
+レシート画像の解析結果キャッシュ
+
+同じレシートの再アップロード（タイムアウト後の再試行、二度押し、家族間での共有）で
+Gemini を呼び直さないよう、解析結果を画像の内容と解析条件（市場データのバージョン・地域・
+品目ルール・モデル）をキーに覚えておきます。
+
+- 完全一致: アップロードされたバイト列のハッシュ → 前処理後の画像のハッシュ の順に確認
+- ほぼ一致（任意）: 前処理後の画像の知覚ハッシュ（dHash）のハミング距離が
+  RESULT_CACHE_NEAR_DUPLICATE_DISTANCE 以下なら同じレシートとみなす
+- 同時に届いた同じ画像は1回の解析を共有する（シングルフライト）
+- 結果を受け取ったユーザーを覚えておき、同じユーザーへの2回目以降は呼び出し側に知らせる
+  （再送・二度押しで節約額が二重に保存されないように）
+- 有効期間（RESULT_CACHE_TTL）とメモリ予算（RESULT_CACHE_BUDGET_BYTES）を超えたら古いものから捨てる
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from config import settings
+from loguru import logger
+from model import PreparedImage, prepare_image
+from schemas.rules_engine import get_rules
+
+from .market_data import get_market_data_version
+
+AnalysisResult = dict[str, Any]
+
+# 1つの結果に付ける別名（アップロードのバイト列のハッシュ）の上限
+_MAX_ALIASES_PER_ENTRY = 16
+# 1つの結果について覚えておくユーザー数の上限（超えたら以後のユーザーは毎回初回として扱う）
+_MAX_USERS_PER_ENTRY = 64
+
+
+class _Entry:
+    __slots__ = ("result", "size", "expires_at", "context", "dhash", "aliases", "users")
+
+    def __init__(
+        self, result: AnalysisResult, size: int, expires_at: float, context: str, dhash: int, users: set[str]
+    ) -> None:
+        self.result = result
+        self.size = size
+        self.expires_at = expires_at
+        self.context = context
+        self.dhash = dhash
+        # このエントリーを指しているアップロードのバイト列のハッシュ
+        self.aliases: list[str] = []
+        # この結果をすでに受け取ったユーザー
+        self.users = users
+
+
+def _claim(users: set[str], user_id: str | None) -> bool:
+    """user_id がこの結果を初めて受け取るなら覚えて True を返します（user_id が None なら常に True）。"""
+    if user_id is None:
+        return True
+    if user_id in users:
+        return False
+    if len(users) < _MAX_USERS_PER_ENTRY:
+        users.add(user_id)
+    return True
+
+
+class ResultCache:
+    """
+    解析結果の LRU キャッシュ（有効期間とメモリ予算付き）
+
+    キーは "解析条件|前処理後の画像の sha256"。アップロードのバイト列のハッシュは別名として同じエントリーを指します。
+    合計サイズが budget_bytes を超えたら古いものから捨てます（直近の1件は常に残す）。
+    """
+
+    def __init__(self, budget_bytes: int, ttl: float) -> None:
+        self._budget = budget_bytes
+        self._ttl = ttl
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._aliases: dict[str, str] = {}
+        self._total = 0
+        self._evictions = 0
+        self._expired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total -= entry.size
+        for alias in entry.aliases:
+            if self._aliases.get(alias) == key:
+                del self._aliases[alias]
+
+    def _live(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._drop(key)
+            self._expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: str, user_id: str | None = None) -> tuple[AnalysisResult, bool] | None:
+        """結果と、user_id がこの結果を初めて受け取るかどうかを返します。"""
+        entry = self._live(key)
+        return (entry.result, _claim(entry.users, user_id)) if entry is not None else None
+
+    def get_alias(self, alias: str, user_id: str | None = None) -> tuple[AnalysisResult, bool] | None:
+        key = self._aliases.get(alias)
+        return self.get(key, user_id) if key is not None else None
+
+    def add_alias(self, alias: str, key: str) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and alias not in self._aliases and len(entry.aliases) < _MAX_ALIASES_PER_ENTRY:
+            self._aliases[alias] = key
+            entry.aliases.append(alias)
+
+    def find_near(
+        self, context: str, dhash: int, max_distance: int, user_id: str | None = None
+    ) -> tuple[str, AnalysisResult, bool] | None:
+        """同じ解析条件で知覚ハッシュのハミング距離が max_distance 以下のもののうち、最も近いものを返します。"""
+        best: tuple[int, str] | None = None
+        for key, entry in self._entries.items():
+            if entry.context != context:
+                continue
+            d = (entry.dhash ^ dhash).bit_count()
+            if d <= max_distance and (best is None or d < best[0]):
+                best = (d, key)
+        if best is None:
+            return None
+        found = self._live(best[1])
+        return (best[1], found.result, _claim(found.users, user_id)) if found is not None else None
+
+    def put(self, key: str, context: str, dhash: int, result: AnalysisResult, users: set[str]) -> None:
+        if key in self._entries:
+            self._drop(key)
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+        self._entries[key] = _Entry(result, size, time.time() + self._ttl, context, dhash, users)
+        self._total += size
+        while self._total > self._budget and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "aliases": len(self._aliases),
+            "approx_bytes": self._total,
+            "budget_bytes": self._budget,
+            "evictions": self._evictions,
+            "expired": self._expired,
+        }
+
+
+_cache = ResultCache(settings.RESULT_CACHE_BUDGET_BYTES, settings.RESULT_CACHE_TTL)
+# 解析中のキー → (タスク, 結果を待っているユーザー)（同じ画像の同時アップロードは1つの解析を共有する）
+_inflight: dict[str, tuple[asyncio.Task[AnalysisResult], set[str]]] = {}
+_stats: dict[str, int] = {"hits": 0, "near_hits": 0, "joined": 0, "misses": 0, "errors": 0}
+
+
+def analysis_context(area_code: str | None) -> str:
+    """
+    解析結果を左右する条件をまとめたキー（解析方式・モデル・市場データのバージョン・地域・品目ルール）
+    """
+    if settings.LOCAL_PRICING_ENABLED:
+        mode = f"local:{get_rules().digest}"
+    else:
+        mode = "model"
+    return "|".join((mode, settings.GEMINI_MODEL, get_market_data_version(), area_code or ""))
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def cached_analysis(
+    file_bytes: bytes,
+    area_code: str | None,
+    analyze: Callable[[PreparedImage], Awaitable[AnalysisResult]],
+    user_id: str | None = None,
+) -> tuple[AnalysisResult, bool]:
+    """
+    解析結果キャッシュを確認し、なければ analyze(前処理済みの画像) を実行して結果を覚えます。
+
+    戻り値は (解析結果, user_id がこの結果を初めて受け取るか)。False のときは同じユーザーの再送・二度押しなので、
+    呼び出し側は節約額を保存し直しません（user_id が None なら常に True）。
+    エラーになった解析は覚えません（同時に待っていたリクエストにも同じエラーを返す）。
+    RESULT_CACHE_ENABLED が false ならキャッシュを使わずに解析します。
+    """
+    if not settings.RESULT_CACHE_ENABLED:
+        return await analyze(await prepare_image(file_bytes)), True
+
+    context = analysis_context(area_code)
+    # 1. アップロードのバイト列が同じなら前処理もせずに返す
+    raw_alias = f"{context}|raw:{_sha256(file_bytes)}"
+    hit = _cache.get_alias(raw_alias, user_id)
+    if hit is not None:
+        _stats["hits"] += 1
+        logger.info("解析結果をキャッシュから返します（同じ画像）")
+        return hit
+
+    # 2. 前処理後の画像が同じ（向きやメタデータだけ違う場合など）
+    image = await prepare_image(file_bytes)
+    key = f"{context}|{_sha256(image.data)}"
+    hit = _cache.get(key, user_id)
+    if hit is not None:
+        _stats["hits"] += 1
+        _cache.add_alias(raw_alias, key)
+        logger.info("解析結果をキャッシュから返します（前処理後の画像が同じ）")
+        return hit
+
+    # 3. ほぼ同じ画像（撮り直し・再圧縮）
+    max_distance = settings.RESULT_CACHE_NEAR_DUPLICATE_DISTANCE
+    if max_distance > 0:
+        near = _cache.find_near(context, image.dhash, max_distance, user_id)
+        if near is not None:
+            _stats["near_hits"] += 1
+            _cache.add_alias(raw_alias, near[0])
+            logger.info("解析結果をキャッシュから返します（ほぼ同じ画像）")
+            return near[1], near[2]
+
+    # 4. 同じ画像を解析中ならそれに合流し、なければ新しく解析する
+    inflight = _inflight.get(key)
+    if inflight is None:
+        _stats["misses"] += 1
+        async def run() -> AnalysisResult:
+            return await analyze(image)
+
+        task = asyncio.create_task(run())
+        users: set[str] = set()
+        _inflight[key] = (task, users)
+
+        def _on_done(t: asyncio.Task[AnalysisResult]) -> None:
+            _inflight.pop(key, None)
+            if t.cancelled() or t.exception() is not None:
+                _stats["errors"] += 1
+                return
+            _cache.put(key, context, image.dhash, t.result(), users)
+            _cache.add_alias(raw_alias, key)
+
+        task.add_done_callback(_on_done)
+    else:
+        task, users = inflight
+        _stats["joined"] += 1
+        logger.info("同じ画像の解析中のため、その結果を待ちます")
+    first = _claim(users, user_id)
+
+    # shield: 1つのリクエストがキャンセルされても共有中の解析は止めない
+    return await asyncio.shield(task), first
+
+
+def get_result_cache_stats() -> dict[str, Any]:
+    """
+    解析結果キャッシュの状態を取得（/health 用）
+    """
+    lookups = _stats["hits"] + _stats["near_hits"] + _stats["joined"] + _stats["misses"]
+    saved = _stats["hits"] + _stats["near_hits"] + _stats["joined"]
+    return {
+        "enabled": settings.RESULT_CACHE_ENABLED,
+        **_cache.stats(),
+        **_stats,
+        "inflight": len(_inflight),
+        "hit_rate": round(saved / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,86 @@
+"""
+utils.resilience と e-Stat 呼び出しの障害対策のテスト
+
+実行例:
+    uv run --with pytest python -m pytest tests
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from config import settings
+from schemas.estat import EStatClient
+from utils.resilience import CircuitBreaker
+
+
+@pytest.fixture
+def estat_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    """.env や環境変数に左右されないよう、e-Stat 呼び出しに関わる設定をテスト用の値にそろえる"""
+    monkeypatch.setattr(settings, "ESTAT_APP_ID", "test")
+    monkeypatch.setattr(settings, "ESTAT_BASE_URL", "http://estat.test")
+    monkeypatch.setattr(settings, "ESTAT_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "ESTAT_HTTP2", False)
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_half_open_allows_single_probe() -> None:
+    breaker = _half_open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_released_probe_can_be_retried() -> None:
+    breaker = _half_open_breaker()
+    assert breaker.allow()
+    # 試行がキャンセルされて成否を記録できなかった
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_release_probe_after_outcome_is_noop() -> None:
+    breaker = _half_open_breaker()
+    assert breaker.allow()
+    breaker.record_failure()
+    breaker.release_probe()
+    # reset_timeout=0 なのですぐ half_open に戻り、新しい試行を1件だけ許可する
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+@pytest.mark.usefixtures("estat_settings")
+def test_cancelled_estat_probe_releases_breaker() -> None:
+    async def scenario() -> None:
+        started = asyncio.Event()
+
+        async def hang(request: httpx.Request) -> httpx.Response:
+            started.set()
+            await asyncio.Event().wait()
+            raise AssertionError("unreachable")
+
+        client = EStatClient()
+        client._http = httpx.AsyncClient(transport=httpx.MockTransport(hang))
+        client._breaker = _half_open_breaker()
+        try:
+            probe = asyncio.create_task(client._get("getStatsList", {}))
+            await started.wait()
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            assert client._breaker.state == "half_open"
+            assert client._breaker.allow()
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+"""
+ファイル書き込みの共通処理（スナップショット・メタデータキャッシュ・e-Stat の記録で共用）
+"""
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def write_json_atomic(path: str | Path, payload: Any) -> None:
+    """JSONファイルをアトミックに書き込みます（一時ファイル → os.replace）。"""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+
+    # 同じディレクトリに一時ファイルを作ってから置き換えることで、
+    # 読み手が書きかけのファイルを見ることがないようにする
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{p.name}.", suffix=".tmp", dir=p.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, p)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
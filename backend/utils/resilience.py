@@ -0,0 +1,212 @@
+"""
+外部API呼び出しの流量制御・障害対策モジュール
+
+- AdaptiveLimiter: レイテンシとエラー率に応じて同時実行数を増減させる（AIMD）
+- CircuitBreaker: 連続失敗時に呼び出しを一時停止し、相手側の回復を待つ
+- LatencyWindow: 直近の所要時間からパーセンタイルを求める（ヘッジの待ち時間の決定など）
+- backoff_delay / parse_retry_after: ジッター付き指数バックオフと Retry-After の解釈
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Literal
+
+
+class AdaptiveLimiter:
+    """
+    AIMD（加算的増加・乗算的減少）で同時実行数の上限を調整するリミッター
+
+    成功かつ目標レイテンシ以内なら上限を少しずつ増やし、
+    失敗または目標レイテンシ超過なら上限を一気に下げます。
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        latency_target: float,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        self._min = max(1, min_limit)
+        self._max = max(self._min, max_limit)
+        self._limit = float(min(max(initial, self._min), self._max))
+        self._latency_target = latency_target
+        self._decrease_factor = decrease_factor
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        # 直近の減少から latency_target 秒間は再度減らさない（1回の障害で何度も半減させない）
+        self._last_decrease = 0.0
+        self._stats = {"successes": 0, "failures": 0, "slow": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self._limit))
+            self._in_flight += 1
+
+    async def release(self, latency: float, ok: bool) -> None:
+        async with self._cond:
+            self._in_flight -= 1
+            slow = latency > self._latency_target
+            if ok:
+                self._stats["successes"] += 1
+            else:
+                self._stats["failures"] += 1
+            if slow:
+                self._stats["slow"] += 1
+
+            if ok and not slow:
+                # 上限の分だけ成功すると +1 になる程度の緩やかな増加
+                self._limit = min(float(self._max), self._limit + 1.0 / self._limit)
+            else:
+                now = time.monotonic()
+                if now - self._last_decrease >= self._latency_target:
+                    self._limit = max(float(self._min), self._limit * self._decrease_factor)
+                    self._last_decrease = now
+                    self._stats["decreases"] += 1
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[dict[str, bool]]:
+        """
+        同時実行枠を1つ確保します。
+
+        呼び出し側は yield された dict の "ok" を False にすることで失敗を記録できます。
+        """
+        await self.acquire()
+        outcome = {"ok": True}
+        started = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            outcome["ok"] = False
+            raise
+        finally:
+            await self.release(time.monotonic() - started, outcome["ok"])
+
+    def stats(self) -> dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self._in_flight, **self._stats}
+
+
+class CircuitBreaker:
+    """
+    連続失敗回数が閾値に達すると一定時間呼び出しを遮断するサーキットブレーカー
+
+    closed → (連続失敗) → open → (reset_timeout 経過) → half_open → 成功で closed / 失敗で open
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._state: Literal["closed", "open", "half_open"] = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self._reset_timeout:
+            return "half_open"
+        return self._state
+
+    def allow(self) -> bool:
+        """呼び出してよいかを判定します（half_open 中は1件だけ試行を許可）。"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._state = "half_open"
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """
+        成否を記録できずに終わった（キャンセルされた）half_open の試行枠を返します。
+
+        返さないと _probe_in_flight が残り、以後 allow() が常に False になります。
+        """
+        if self._state == "half_open":
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        if self._state == "half_open" or self._consecutive_failures >= self._failure_threshold:
+            if self._state != "open":
+                self._times_opened += 1
+            self._state = "open"
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self._times_opened,
+        }
+
+
+class LatencyWindow:
+    """
+    直近 size 件の所要時間（秒）を覚えておき、パーセンタイルを求めます
+    """
+
+    def __init__(self, size: int = 256) -> None:
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        """p パーセンタイル（0〜100、最近傍法）を返します（記録がなければ None）。"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "count": len(self._samples),
+            **{f"p{p}": round(v, 3) if (v := self.percentile(p)) is not None else None for p in (50, 95, 99)},
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """ジッター付き指数バックオフの待機秒数を返します（attempt は0始まり）。"""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After ヘッダ（秒数またはHTTP日付）を待機秒数に変換します。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(0.0, (dt - datetime.now(timezone.utc)).total_seconds())